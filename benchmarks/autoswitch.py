@@ -0,0 +1,90 @@
+#!/usr/bin/env python2
+"""
+Matches 1000 synthetic autoswitcher conditions against set of windows,
+by evaluating every condition in order and using ConditionMatcher,
+with and without its result cache.
+
+Usage: PYTHONPATH=. python2 benchmarks/autoswitch.py [rounds]
+"""
+from scc.x11.autoswitcher import Condition, ConditionMatcher
+from collections import OrderedDict
+import sys, time, random
+
+REPEATS = 5
+RULES = 1000
+WINDOWS = 200
+
+
+def make_conditions(count):
+	""" Generates mix of conditions similar to per-game rules """
+	rnd = random.Random(count)
+	conds = OrderedDict()
+	for i in xrange(count):
+		kind = rnd.choice(("exact_title", "wm_class", "title", "regexp", "both"))
+		if kind == "exact_title":
+			c = Condition(exact_title="Game %s" % (i,))
+		elif kind == "wm_class":
+			c = Condition(wm_class="game%s.exe" % (i,))
+		elif kind == "title":
+			c = Condition(title="Game %s -" % (i,))
+		elif kind == "regexp":
+			c = Condition(regexp="^Game %s v[0-9.]+$" % (i,))
+		else:
+			c = Condition(title="Game %s" % (i,), wm_class="steam_app_%s" % (i,))
+		conds[c] = "profile%s" % (i,)
+	return conds
+
+
+def make_windows(count):
+	rnd = random.Random(count)
+	rv = []
+	for i in xrange(count):
+		n = rnd.randint(0, RULES * 2)
+		rv.append(rnd.choice((
+			( "Game %s" % (n,), ( "game%s.exe" % (n,), "Wine" ) ),
+			( "Game %s - Level 1" % (n,), ( "steam_app_%s" % (n,), "Steam" ) ),
+			( "Game %s v1.0.2" % (n,), ( "game", "Game" ) ),
+			( "Terminal - /home/user", ( "xterm", "XTerm" ) ),
+		)))
+	return rv
+
+
+def linear(conds, windows):
+	for title, wm_class in windows:
+		for c in conds:
+			if c.matches(title, wm_class):
+				break
+
+
+def indexed(matcher, windows, clear):
+	for title, wm_class in windows:
+		if clear:
+			matcher._cache = {}
+		matcher.match(title, wm_class)
+
+
+def measure(name, fn, rounds, *args):
+	best = None
+	for x in xrange(REPEATS):
+		t = time.time()
+		for i in xrange(rounds):
+			fn(*args)
+		t = time.time() - t
+		best = t if best is None else min(best, t)
+	print "%s: %s windows matched against %s conditions %s times in %.3fms (best of %s)" % (
+		name, WINDOWS, RULES, rounds, best * 1000.0, REPEATS)
+
+
+def main(rounds):
+	conds = make_conditions(RULES)
+	windows = make_windows(WINDOWS)
+	t = time.time()
+	matcher = ConditionMatcher(conds)
+	print "matcher built in %.3fms" % ((time.time() - t) * 1000.0, )
+	measure("linear", linear, rounds, conds, windows)
+	measure("indexed", indexed, rounds, matcher, windows, True)
+	measure("cached", indexed, rounds, matcher, windows, False)
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python2
+"""
+Feeds pad positions through smooth() and ball() modifiers, as when
+trackpad is used to control mouse.
+
+Usage: PYTHONPATH=. python2 benchmarks/filters.py [count]
+"""
+from scc.constants import SCButtons, LEFT
+from scc.parser import ActionParser
+from scc.uinput import Dummy
+import sys, time, math
+
+
+class FakeMapper(object):
+	""" Just enough of Mapper to keep pad touched all the time """
+	def __init__(self):
+		self.mouse = Dummy()
+		self.syn_list = set()
+	
+	def controller_flags(self): return 0
+	def is_touched(self, what): return True
+	def was_touched(self, what): return True
+	def mouse_move(self, *a): pass
+	def schedule(self, *a): pass
+
+
+def main(count):
+	parser = ActionParser()
+	mapper = FakeMapper()
+	positions = [ (int(20000 * math.sin(i * 0.01)), int(20000 * math.cos(i * 0.01)))
+		for i in xrange(count) ]
+	for actionstr in ("smooth(8, 0.75, 2, mouse())", "smooth(32, 0.9, 2, mouse())",
+				"ball(mouse())", "oneeuro(mouse())"):
+		action = parser.restart(actionstr).parse()
+		action.whole(mapper, 0, 0, LEFT)
+		# Modifiers see time advancing by 10ms with every input
+		clock = [ time.time() ]
+		time_fn, time.time = time.time, lambda : clock[0]
+		try:
+			t = time_fn()
+			for x, y in positions:
+				clock[0] += 0.01
+				action.whole(mapper, x, y, LEFT)
+			t = time_fn() - t
+		finally:
+			time.time = time_fn
+		print "%-28s %8i inputs: %8.3fms" % (actionstr, count, t * 1000.0)
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python2
+"""
+Replays generated controller input through Mapper.input() using Dummy
+outputs and reports how many frames per second can mapper handle.
+
+Frames are generated to resemble recorded input: stick being moved around,
+both pads touched, buttons and triggers pressed and released.
+
+Usage: PYTHONPATH=. python2 benchmarks/mapper.py [profile] [frames]
+"""
+from scc.drivers.sc_dongle import ControllerInput, SCI_NULL
+from scc.drivers.fake import FakeController
+from scc.constants import SCButtons
+from scc.parser import ActionParser
+from scc.scheduler import Scheduler
+from scc.profile import Profile
+from scc.mapper import Mapper
+from math import sin, cos
+import sys, time, logging
+
+DEFAULT_PROFILE = "default_profiles/XBox Controller with High Precision Camera.sccprofile"
+REPEATS = 5
+BUTTONS = [ SCButtons.A, SCButtons.B, SCButtons.X, SCButtons.Y,
+	SCButtons.LB, SCButtons.RB, SCButtons.BACK, SCButtons.START ]
+
+
+def generate_frames(count):
+	""" Returns list of ControllerInput tuples """
+	frames = []
+	for i in xrange(count):
+		a = i / 100.0
+		buttons = 0
+		# Some button is pressed for 50 frames every 150 frames
+		if i % 150 < 50:
+			buttons |= BUTTONS[(i / 150) % len(BUTTONS)]
+		# Right pad is touched most of time, left pad sometimes
+		if i % 400 < 300:
+			buttons |= SCButtons.RPADTOUCH
+		if i % 1000 > 800:
+			buttons |= SCButtons.LPADTOUCH
+		frames.append(SCI_NULL._replace(
+			buttons = buttons,
+			ltrig = int(127 + 127 * sin(a)),
+			rtrig = int(127 + 127 * cos(a)),
+			# Without LPADTOUCH, lpad_x and lpad_y are used by stick
+			lpad_x = int(15000 * cos(a * 3)),
+			lpad_y = int(15000 * sin(a * 3)),
+			rpad_x = int(25000 * sin(a * 2)),
+			rpad_y = int(25000 * cos(a * 2)),
+			gpitch = int(100 * sin(a)),
+			groll = int(100 * cos(a)),
+			gyaw = int(50 * sin(a)),
+		))
+	return frames
+
+
+def main(filename, count):
+	profile = Profile(ActionParser()).load(filename)
+	profile.compress()
+	mapper = Mapper(profile, Scheduler(), keyboard=None, mouse=None, gamepad=False)
+	mapper.set_controller(FakeController(0))
+	frames = generate_frames(count)
+	
+	best = None
+	for x in xrange(REPEATS):
+		old_state = SCI_NULL
+		t = time.time()
+		for state in frames:
+			mapper.input(mapper.controller, old_state, state)
+			old_state = state
+		t = time.time() - t
+		best = t if best is None else min(best, t)
+	print "%s frames in %.3fs: %.1f frames/s (best of %s)" % (
+		count, best, count / best, REPEATS)
+
+
+if __name__ == "__main__":
+	logging.basicConfig()
+	main(
+		sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PROFILE,
+		int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+	)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python2
+"""
+Loads every profile from default_profiles/ and every menu from
+default_menus/, as GUI, daemon and OSD do on start.
+
+Measured with cache of ActionParser emptied before every round (cold)
+and with cache kept from previous round (warm).
+
+Usage: PYTHONPATH=. python2 benchmarks/parser.py [rounds]
+"""
+from scc.parser import ActionParser
+from scc.menu_data import MenuData
+from scc.profile import Profile
+import sys, time, glob
+
+REPEATS = 5
+
+
+def load_all(profiles, menus):
+	for filename in profiles:
+		Profile(ActionParser()).load(filename)
+	for filename in menus:
+		MenuData.from_file(filename, ActionParser())
+
+
+def main(rounds):
+	profiles = sorted(glob.glob("default_profiles/*.sccprofile"))
+	menus = sorted(glob.glob("default_menus/*.menu"))
+	for name, clear in (("cold", True), ("warm", False)):
+		best = None
+		ActionParser.clear_cache()
+		load_all(profiles, menus)
+		for x in xrange(REPEATS):
+			t = time.time()
+			for i in xrange(rounds):
+				if clear:
+					ActionParser.clear_cache()
+				load_all(profiles, menus)
+			t = time.time() - t
+			best = t if best is None else min(best, t)
+		print "%s: %s profiles and %s menus loaded %s times in %.3fms (best of %s)" % (
+			name, len(profiles), len(menus), rounds, best * 1000.0, REPEATS)
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python2
+"""
+Runs decoded Steam Controller and Steam Deck inputs through
+InputPreprocessor, as drivers do before calling Mapper.input.
+
+Usage: PYTHONPATH=. python2 benchmarks/preprocess.py [count]
+"""
+from scc.drivers.preprocess import InputPreprocessor
+from scc.drivers.sc_dongle import SCInput
+from scc.drivers.steamdeck import DeckInput, STICK_DEADZONE
+import sys, time, math
+
+
+def generate_frames(cls, count):
+	frames = []
+	for i in xrange(count):
+		a = i / 100.0
+		frame = cls()
+		frame.lpad_x = int(15000 * math.cos(a * 3))
+		frame.lpad_y = int(15000 * math.sin(a * 3))
+		frame.rpad_x = int(25000 * math.sin(a * 2))
+		frame.rpad_y = int(25000 * math.cos(a * 2))
+		if hasattr(frame, "stick_x"):
+			# Stick oscillates around center, in and out of deadzone
+			frame.stick_x = frame.rstick_x = int(5000 * math.sin(a))
+			frame.stick_y = frame.rstick_y = int(5000 * math.cos(a))
+		frames.append(frame)
+	return frames
+
+
+def main(count):
+	sc = InputPreprocessor()
+	sc.set_rotation(20, -20)
+	deck = InputPreprocessor({ x : STICK_DEADZONE
+		for x in ('stick_x', 'stick_y', 'rstick_x', 'rstick_y') })
+	for name, p, frames in (
+			("SC, rotation", sc, generate_frames(SCInput, count)),
+			("Deck, deadzones", deck, generate_frames(DeckInput, count))):
+		t = time.time()
+		for frame in frames:
+			p.process(frame)
+		t = time.time() - t
+		print "%-20s %8i inputs: %8.3fms" % (name, count, t * 1000.0)
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
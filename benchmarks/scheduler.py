@@ -0,0 +1,43 @@
+#!/usr/bin/env python2
+"""
+Schedules and cancels 100k tasks using Scheduler.
+
+Usage: PYTHONPATH=. python2 benchmarks/scheduler.py [count]
+"""
+from scc.scheduler import Scheduler
+import sys, time, random
+
+def nothing(*a):
+	pass
+
+
+def main(count):
+	s = Scheduler()
+	r = random.Random(0)
+	delays = [ r.random() for x in xrange(count) ]
+	
+	t = time.time()
+	tasks = [ s.schedule(d, nothing) for d in delays ]
+	t_schedule = time.time() - t
+	
+	t = time.time()
+	for task in tasks[::2]:
+		s.cancel_task(task)
+	t_cancel = time.time() - t
+	
+	t = time.time()
+	s._now = s._now + 2.0
+	time_fn, time.time = time.time, lambda : s._now
+	try:
+		s.run()
+	finally:
+		time.time = time_fn
+	t_run = time.time() - t
+	
+	print "schedule %8i tasks: %8.3fms" % (count, t_schedule * 1000.0)
+	print "cancel   %8i tasks: %8.3fms" % (count / 2, t_cancel * 1000.0)
+	print "run      %8i tasks: %8.3fms" % (count - count / 2, t_run * 1000.0)
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -898,6 +898,7 @@ class MouseAction(WholeHapticAction, Action):
 		dx, dy = dx * self.speed[0], dy * self.speed[1]
 		if self._mouse_axis is None:
 			mapper.mouse.moveEvent(dx, dy)
+			mapper.syn_list.add(mapper.mouse)
 		elif self._mouse_axis == Rels.REL_X:
 			mapper.mouse_move(dx, 0)
 		elif self._mouse_axis == Rels.REL_Y:
@@ -1005,6 +1006,7 @@ class MouseAbsAction(Action):
 		dx = x * self.speed[0] * MouseAbsAction.MOUSE_FACTOR
 		dy = y * self.speed[0] * MouseAbsAction.MOUSE_FACTOR
 		mapper.mouse.moveEvent(dx, dy)
+		mapper.syn_list.add(mapper.mouse)
 
 
 class AreaAction(Action, SpecialAction, OSDEnabledAction):
@@ -110,6 +110,12 @@ class Config(object):
 		"windows_opacity": 0.95,
 		# See drivers/sc_dongle.py, read_serial method
 		"ignore_serials" : True,
+		# Number of input transfers kept submitted for each USB endpoint.
+		# More of them helps to not lose packets when daemon is busy.
+		"usb_input_transfers" : 4,
+		# If enabled, USB events and control messages (haptics, LED) are
+		# handled by separate thread and not by daemon mainloop.
+		"usb_thread" : False,
 	}
 	
 	CONTROLLER_DEFAULTS = {
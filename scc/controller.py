@@ -107,6 +107,14 @@ class Controller(object):
 		pass
 	
 	
+	def get_dropped(self):
+		"""
+		Returns number of input packets known to be lost or ignored,
+		or None if driver doesn't keep track of it.
+		"""
+		return None
+	
+	
 	def disconnected(self):
 		""" Called from daemon after controller is disconnected """
 		pass
@@ -0,0 +1,86 @@
+#!/usr/bin/env python2
+"""
+SC Controller - Input preprocessing
+
+Pad rotation and axis deadzones shared by drivers. Drivers create one
+InputPreprocessor per controller and call process() on decoded input
+right before passing it to Mapper.input.
+
+Everything that can be computed in advance is computed when configured,
+so process() does only multiplications and comparisons.
+"""
+from scc.constants import STICK_PAD_MIN, STICK_PAD_MAX
+from scc.tools import clamp
+from math import pi as PI, sin, cos
+import logging
+log = logging.getLogger("Preprocess")
+
+
+class InputPreprocessor(object):
+	"""
+	Rotates pads and applies deadzones on decoded input, in place.
+	Input can be any object with writable lpad_x, lpad_y, rpad_x, rpad_y
+	and deadzoned axis attributes, typically ctypes structure.
+	"""
+	
+	def __init__(self, deadzones=None):
+		self._left = None		# (sin, cos) or None if not rotated
+		self._right = None
+		self._deadzones = ()
+		if deadzones:
+			self.set_deadzones(deadzones)
+	
+	
+	def configure(self, config):
+		""" Reads rotation from controller config, as from Config().get_controller_config """
+		self.set_rotation(
+			float(config.get('input_rotation_l', 0)),
+			float(config.get('input_rotation_r', 0)))
+	
+	
+	@staticmethod
+	def _trig(angle):
+		if angle % 360 == 0:
+			return None
+		rad = angle * PI / -180.0
+		return sin(rad), cos(rad)
+	
+	
+	def set_rotation(self, left, right):
+		""" Sets rotation of left and right pad, in degrees """
+		self._left = InputPreprocessor._trig(left)
+		self._right = InputPreprocessor._trig(right)
+	
+	
+	def set_deadzones(self, deadzones):
+		"""
+		Sets deadzones as dict of { axis name: deadzone }. Values closer to
+		zero than deadzone are replaced by zero.
+		"""
+		self._deadzones = tuple(( axis, dz )
+			for axis, dz in sorted(deadzones.items()) if dz > 0)
+	
+	
+	def process(self, state, left=True, right=True):
+		"""
+		Applies rotation and deadzones to 'state'.
+		'left' and 'right' can be set to False to not rotate pad that is
+		not touched.
+		"""
+		if left and self._left:
+			s, c = self._left
+			x, y = state.lpad_x, state.lpad_y
+			x, y = int(x * c - y * s), int(x * s + y * c)
+			# Rotated values are clamped, as they may not fit int16 otherwise
+			state.lpad_x = clamp(STICK_PAD_MIN, x, STICK_PAD_MAX)
+			state.lpad_y = clamp(STICK_PAD_MIN, y, STICK_PAD_MAX)
+		if right and self._right:
+			s, c = self._right
+			x, y = state.rpad_x, state.rpad_y
+			x, y = int(x * c - y * s), int(x * s + y * c)
+			state.rpad_x = clamp(STICK_PAD_MIN, x, STICK_PAD_MAX)
+			state.rpad_y = clamp(STICK_PAD_MIN, y, STICK_PAD_MAX)
+		for axis, dz in self._deadzones:
+			value = getattr(state, axis)
+			if value and -dz < value < dz:
+				setattr(state, axis, 0)
@@ -12,7 +12,6 @@ from scc.constants import ControllerFlags
 from scc.tools import find_library
 from sc_dongle import SCPacketType, SCPacketLength, SCConfigType
 from sc_dongle import SCController
-from math import sin, cos
 import os, sys, struct, ctypes, logging
 
 VENDOR_ID = 0x28de
@@ -266,16 +265,8 @@ class SCByBt(SCController):
 		
 		if r == 1:
 			if self.mapper is not None:
-				if self._input_rotation_l and (self._state.type & 0x0100) != 0:
-					lx, ly = self._state.lpad_x, self._state.lpad_y
-					s, c = sin(self._input_rotation_l), cos(self._input_rotation_l)
-					self._state.lpad_x = int(lx * c - ly * s)
-					self._state.lpad_y = int(lx * s + ly * c)
-				if self._input_rotation_r and (self._state.type & 0x0200) != 0:
-					rx, ry = self._state.rpad_x, self._state.rpad_y
-					s, c = sin(self._input_rotation_r), cos(self._input_rotation_r)
-					self._state.rpad_x = int(rx * c - ry * s)
-					self._state.rpad_y = int(rx * s + ry * c)
+				self._preprocessor.process(self._state,
+					(self._state.type & 0x0100) != 0, (self._state.type & 0x0200) != 0)
 				
 				self.mapper.input(self, self._old_state, self._state)
 			self.flush()
@@ -9,9 +9,9 @@ Shares a lot of classes with sc_dongle.py
 
 from scc.lib.usb1 import USBError
 from scc.drivers.usb import USBDevice, register_hotplug_device
-from sc_dongle import ControllerInput, TUP_FORMAT
+from sc_dongle import SCInput, SCI_SIZE, STATUS_OFFSET
 from sc_dongle import SCStatus, SCController
-import struct, logging
+import ctypes, logging
 
 VENDOR_ID = 0x28de
 PRODUCT_ID = 0x1102
@@ -38,7 +38,9 @@ class SCByCable(USBDevice, SCController):
 		USBDevice.__init__(self, device, handle)
 		SCController.__init__(self, self, CONTROLIDX, ENDPOINT)
 		self._ready = False
-		self._last_tup = None
+		# Third buffer, filled by _wait_input and rotated in by _timer
+		self._incoming = SCInput()
+		self._has_input = False
 		daemon.add_mainloop(self._timer)
 		
 		self.claim_by(klass=3, subclass=0, protocol=0)
@@ -65,21 +67,23 @@ class SCByCable(USBDevice, SCController):
 	
 	
 	def _wait_input(self, endpoint, data):
-		tup = ControllerInput._make(struct.unpack(TUP_FORMAT, data))
 		if not self._ready:
 			self.daemon.add_controller(self)
 			self.configure()
 			self._ready = True
-		if tup.status == SCStatus.INPUT:
-			self._last_tup = tup
+		if ord(data[STATUS_OFFSET]) == SCStatus.INPUT and self._check_seq(data):
+			ctypes.memmove(ctypes.addressof(self._incoming), data, min(len(data), SCI_SIZE))
+			self._has_input = True
 	
 	
 	def _timer(self):
 		m = self.get_mapper()
 		if m:
-			if self._last_tup:
-				self.input(self._last_tup)
-				self._last_tup = None
+			if self._has_input:
+				self._old_state, self._state, self._incoming = (
+					self._state, self._incoming, self._old_state)
+				self._has_input = False
+				self._process_input()
 			else:
 				m.generate_events()
 				m.generate_feedback()
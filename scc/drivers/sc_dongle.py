@@ -10,10 +10,10 @@ from scc.lib import IntEnum
 from scc.drivers.usb import USBDevice, register_hotplug_device
 from scc.constants import SCButtons, STICKTILT
 from scc.controller import Controller
+from scc.drivers.preprocess import InputPreprocessor
 from scc.config import Config
 from collections import namedtuple
-from math import pi as PI, sin, cos
-import struct, logging
+import struct, ctypes, logging
 
 VENDOR_ID = 0x28de
 PRODUCT_ID = 0x1142
@@ -50,6 +50,49 @@ TUP_FORMAT = '<' + ''.join(FORMATS)
 ControllerInput = namedtuple('ControllerInput', ' '.join([ x for x in NAMES if not x.startswith('ukn_') ]))
 SCI_NULL = ControllerInput._make(struct.unpack('<' + ''.join(FORMATS), b'\x00' * 64))
 STICKPRESS = 0b1000000000000000000000000000000
+STATUS_OFFSET = 2		# Offset of 'status' byte in input packet
+SEQ_OFFSET = 4			# Offset of 'seq' in input packet
+SEQ = struct.Struct("<H")
+
+
+class SCInput(ctypes.Structure):
+	"""
+	Same layout as INPUT_FORMAT. Input packets are copied directly into
+	preallocated instance, so nothing is allocated while decoding.
+	"""
+	_pack_ = 1
+	_fields_ = [
+		('type', ctypes.c_int8),
+		('_a1', ctypes.c_uint8),
+		('status', ctypes.c_uint8),
+		('_a2', ctypes.c_uint8),
+		('seq', ctypes.c_uint16),
+		('_a3', ctypes.c_uint8),
+		('buttons', ctypes.c_uint32),
+		('ltrig', ctypes.c_uint8),
+		('rtrig', ctypes.c_uint8),
+		('_a4', ctypes.c_uint8 * 3),
+		('lpad_x', ctypes.c_int16),
+		('lpad_y', ctypes.c_int16),
+		('rpad_x', ctypes.c_int16),
+		('rpad_y', ctypes.c_int16),
+		('_a5', ctypes.c_uint8 * 10),
+		('gpitch', ctypes.c_int16),
+		('groll', ctypes.c_int16),
+		('gyaw', ctypes.c_int16),
+		('q1', ctypes.c_int16),
+		('q2', ctypes.c_int16),
+		('q3', ctypes.c_int16),
+		('q4', ctypes.c_int16),
+		('_a6', ctypes.c_uint8 * 16),
+	]
+	
+	def __repr__(self):
+		return "SCInput(%s)" % (", ".join([ "%s=%s" % (x, getattr(self, x))
+			for x in ControllerInput._fields ]),)
+
+SCI_SIZE = ctypes.sizeof(SCInput)
+assert SCI_SIZE == struct.calcsize(TUP_FORMAT)
 
 
 log = logging.getLogger("SCDongle")
@@ -100,8 +143,8 @@ class Dongle(USBDevice):
 	
 	
 	def _on_input(self, endpoint, data):
-		tup = ControllerInput._make(struct.unpack(TUP_FORMAT, data))
-		if tup.status == SCStatus.HOTPLUG:
+		status = ord(data[STATUS_OFFSET])
+		if status == SCStatus.HOTPLUG:
 			# Most of INPUT_FORMAT doesn't apply here
 			if ord(data[4]) == 2:
 				# Controller connected
@@ -113,7 +156,7 @@ class Dongle(USBDevice):
 					self.daemon.remove_controller(self._controllers[endpoint])
 					self._controllers[endpoint].disconnected()
 					del self._controllers[endpoint]
-		elif tup.status == SCStatus.INPUT:
+		elif status == SCStatus.INPUT:
 			if endpoint not in self._controllers:
 				self._add_controller(endpoint)
 			elif len(self._no_serial):
@@ -121,7 +164,7 @@ class Dongle(USBDevice):
 					x.read_serial()
 				self._no_serial = []
 			else:
-				self._controllers[endpoint].input(tup)
+				self._controllers[endpoint].input(data)
 
 
 class SCStatus(IntEnum):
@@ -167,14 +210,18 @@ class SCController(Controller):
 		self._endpoint = endpoint
 		self._idle_timeout = 600
 		self._enable_gyros = False
-		self._input_rotation_l = 0
-		self._input_rotation_r = 0
+		self._preprocessor = InputPreprocessor()
 		self._led_level = 10
 		# TODO: Is serial really used anywhere?
 		self._serial = "0000000000"
 		self._id = self._generate_id() if driver else "-"
-		self._old_state = SCI_NULL
+		# Two buffers, swapped every time when new input is received
+		self._old_state = SCInput()
+		self._state = SCInput()
 		self._ccidx = ccidx
+		self._last_seq = None
+		self.missed = 0		# Packets lost, detected from gaps in 'seq'
+		self.stale = 0		# Packets older than already processed one
 	
 	
 	def get_type(self):
@@ -185,34 +232,49 @@ class SCController(Controller):
 		return "<SCWireless %s>" % (self.get_id(),)
 	
 	
-	def input(self, idata):
-		old_state, self._old_state = self._old_state, idata
+	def get_dropped(self):
+		return self.missed + self.stale
+	
+	
+	def _check_seq(self, data):
+		"""
+		Counts packets missing between last and this one.
+		Returns False if packet is older than last one and should be ignored.
+		"""
+		seq, = SEQ.unpack_from(data, SEQ_OFFSET)
+		if self._last_seq is not None:
+			diff = (seq - self._last_seq) & 0xFFFF
+			if diff >= 0x8000:
+				self.stale += 1
+				return False
+			if diff > 1:
+				self.missed += diff - 1
+		self._last_seq = seq
+		return True
+	
+	
+	def input(self, data):
+		""" Decodes input packet and passes it to mapper """
+		if not self._check_seq(data):
+			return
+		self._old_state, self._state = self._state, self._old_state
+		ctypes.memmove(ctypes.addressof(self._state), data, min(len(data), SCI_SIZE))
+		self._process_input()
+	
+	
+	def _process_input(self):
+		""" Rotates pads in place and passes decoded input to mapper """
 		if self.mapper:
 			#if idata.buttons & SCButtons.LPAD:
 			#	# STICKPRESS button may signalize pressing stick instead
 			#	if (idata.buttons & STICKPRESS) and not (idata.buttons & STICKTILT):
 			#		idata = ControllerInput.replace(buttons=idata.buttons & ~SCButtons.LPAD)
 			
-			if self._input_rotation_l:
-				lx, ly = idata.lpad_x, idata.lpad_y
-				if idata.buttons & SCButtons.LPADTOUCH:
-					s, c = sin(self._input_rotation_l), cos(self._input_rotation_l)
-					lx = int(idata.lpad_x * c - idata.lpad_y * s)
-					ly = int(idata.lpad_x * s + idata.lpad_y * c)
-				s, c = sin(self._input_rotation_r), cos(self._input_rotation_r)
-				rx = int(idata.rpad_x * c - idata.rpad_y * s)
-				ry = int(idata.rpad_x * s + idata.rpad_y * c)
-				
-				# TODO: This is awfull :(
-				idata = ControllerInput(
-						idata.type, idata.status, idata.seq, idata.buttons,
-						idata.ltrig, idata.rtrig,
-						lx, ly, rx, ry,
-						idata.gpitch, idata.groll, idata.gyaw,
-						idata.q1, idata.q2, idata.q3, idata.q4
-				)
+			state = self._state
+			# Left pad is rotated only while touched, as stick uses same axes
+			self._preprocessor.process(state, state.buttons & SCButtons.LPADTOUCH)
 			
-			self.mapper.input(self, old_state, idata)
+			self.mapper.input(self, self._old_state, state)
 	
 	
 	def _generate_id(self):
@@ -242,6 +304,10 @@ class SCController(Controller):
 			return
 		
 		def cb(rawserial):
+			if rawserial is None:
+				# Request failed, retried after next input packet
+				self._driver._no_serial.append(self)
+				return
 			size, serial = struct.unpack(">xBx12s49x", rawserial)
 			if size > 1:
 				serial = serial.strip(" \x00")
@@ -278,8 +344,7 @@ class SCController(Controller):
 	def apply_config(self, config):
 		self.configure(idle_timeout=int(config['idle_timeout']),
 				led_level=float(config['led_level']))
-		self._input_rotation_l = float(config['input_rotation_l']) * PI / -180.0
-		self._input_rotation_r = float(config['input_rotation_r']) * PI / -180.0
+		self._preprocessor.configure(config)
 	
 	
 	def disconnected(self):
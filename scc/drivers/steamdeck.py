@@ -15,7 +15,7 @@ from scc.lib.usb1 import USBError
 from scc.drivers.usb import USBDevice, register_hotplug_device
 from scc.constants import STICK_PAD_MIN, STICK_PAD_MAX
 from scc.constants import SCButtons, ControllerFlags
-from sc_dongle import ControllerInput, SCController, SCPacketType
+from sc_dongle import SCController, SCPacketType
 import struct, logging, ctypes
 
 
@@ -122,12 +122,6 @@ def map_dpad(i, low, hi):
 		return 0
 
 
-def apply_deadzone(value, deadzone):
-	if value > -deadzone and value < deadzone:
-		return 0
-	return value
-
-
 class Deck(USBDevice, SCController):
 	flags = ( 0
 		| ControllerFlags.SEPARATE_STICK
@@ -141,6 +135,8 @@ class Deck(USBDevice, SCController):
 		SCController.__init__(self, self, CONTROLIDX, ENDPOINT)
 		self._old_state = DeckInput()
 		self._input = DeckInput()
+		self._preprocessor.set_deadzones({ x : STICK_DEADZONE
+			for x in ('stick_x', 'stick_y', 'rstick_x', 'rstick_y') })
 		self._ready = False
 		
 		self.claim_by(klass=3, subclass=0, protocol=0)
@@ -192,6 +188,8 @@ class Deck(USBDevice, SCController):
 			self.daemon.add_controller(self)
 			self.configure()
 			self._ready = True
+		if not self._check_seq(data):
+			return
 		
 		self._old_state, self._input = self._input, self._old_state
 		ctypes.memmove(ctypes.addressof(self._input), data, len(data))
@@ -216,11 +214,8 @@ class Deck(USBDevice, SCController):
 		# Convert triggers
 		self._input.ltrig >>= 7
 		self._input.rtrig >>= 7
-		# Apply deadzones
-		self._input.stick_x = apply_deadzone(self._input.stick_x, STICK_DEADZONE)
-		self._input.stick_y = apply_deadzone(self._input.stick_y, STICK_DEADZONE)
-		self._input.rstick_x = apply_deadzone(self._input.rstick_x, STICK_DEADZONE)
-		self._input.rstick_y = apply_deadzone(self._input.rstick_y, STICK_DEADZONE)
+		# Apply deadzones. Pads on deck are not rotated
+		self._preprocessor.process(self._input, False, False)
 		
 		m = self.get_mapper()
 		if m:
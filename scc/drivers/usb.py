@@ -8,113 +8,247 @@ method to get notified about connected USB devices.
 Callback will be called with following arguments:
 	callback(device, handle)
 Callback has to return created USBDevice instance or None.
+
+If 'usb_thread' option is enabled, libusb events are handled and control
+messages are sent by separate thread. Received data is then passed to
+main thread through bounded queue and all driver callbacks are still
+called from daemon mainloop.
 """
 from scc.lib import usb1
+from scc.poller import Poller
+from collections import OrderedDict, deque
 
-import time, traceback, logging
+import time, threading, traceback, logging
 log = logging.getLogger("USB")
 
+DEFAULT_INPUT_TRANSFERS = 4
+IO_QUEUE_SIZE = 256		# Input packets waiting for main thread, in thread mode
+IO_TIMEOUT = 1.0		# Longest time USB thread sleeps between checks
+CLOSE_TIMEOUT = 0.5		# How long close waits for control transfer to be canceled
+
 class USBDevice(object):
 	""" Base class for all handled usb devices """
 	def __init__(self, device, handle):
 		self.device = device
 		self.handle = handle
 		self._claimed = []
-		self._cmsg = []		# controll messages
+		self._cmsg = OrderedDict()	# controll messages, by (index, type)
 		self._rmsg = []		# requests (excepts response)
 		self._transfer_list = []
+		self._ctransfer = None		# Used to send control messages
+		self._ctransfer_busy = False
+		self._lock = threading.Lock()		# Guards _cmsg and _rmsg
+		self._io_lock = threading.Lock()	# Held while submitting
+		self._closed = False
+		self.dropped_transfers = 0	# Completed with unexpected size
+		self.sent_controls = 0
+		self.coalesced_controls = 0	# Replaced before they were sent
 	
 	
-	def set_input_interrupt(self, endpoint, size, callback):
+	def set_input_interrupt(self, endpoint, size, callback, count=None):
 		"""
-		Helper method for setting up input transfer.
+		Helper method for setting up input transfers.
+		
+		'count' transfers (by default value of 'usb_input_transfers' option)
+		are kept submitted for endpoint, so packets arriving while callback
+		is still running are queued instead of being lost. libusb completes
+		them in same order as packets arrived.
 		
 		callback(endpoint, data) is called repeadedly with every packed recieved.
 		"""
-		def callback_wrapper(transfer):
-			if (transfer.getStatus() != usb1.TRANSFER_COMPLETED or
-				transfer.getActualLength() != size):
-				return
-			
-			data = transfer.getBuffer()
+		def handle_data(data):
 			try:
 				callback(endpoint, data)
 			except Exception, e:
 				log.error("Failed to handle recieved data")
 				log.error(e)
 				log.error(traceback.format_exc())
-			finally:
+		
+		def callback_wrapper(transfer):
+			if transfer.getStatus() != usb1.TRANSFER_COMPLETED:
+				return
+			if transfer.getActualLength() != size:
+				self.dropped_transfers += 1
 				transfer.submit()
+				return
+			
+			# Transfer is resubmitted before data is processed,
+			# so number of transfers waiting for data doesn't drop
+			data = transfer.getBuffer()
+			transfer.submit()
+			_usb.input_in_mainloop(handle_data, data)
 		
-		transfer = self.handle.getTransfer()
-		transfer.setInterrupt(
-			usb1.ENDPOINT_IN | endpoint,
-			size,
-			callback=callback_wrapper,
-		)
-		transfer.submit()
-		self._transfer_list.append(transfer)
+		for i in xrange(count or _usb.input_transfers):
+			transfer = self.handle.getTransfer()
+			transfer.setInterrupt(
+				usb1.ENDPOINT_IN | endpoint,
+				size,
+				callback=callback_wrapper,
+			)
+			transfer.submit()
+			self._transfer_list.append(transfer)
 	
 	
 	def send_control(self, index, data):
-		""" Schedules writing control to device """
+		"""
+		Schedules writing control to device.
+		
+		Messages are sent one after another. If message for same index
+		with same first 3 bytes (PacketType, size and ConfigType or, for
+		haptics, side) is still waiting to be sent, it's replaced by new
+		one, so only latest state is sent.
+		"""
 		zeros = b'\x00' * (64 - len(data))
+		key = index, data[0:3]
 		
-		self._cmsg.insert(0, (
-			0x21,	# request_type
-			0x09,	# request
-			0x0300,	# value
-			index,
-			data + zeros,
-			0		# Timeout
-		))
+		with self._lock:
+			if key in self._cmsg:
+				self.coalesced_controls += 1
+			self._cmsg[key] = (
+				0x21,	# request_type
+				0x09,	# request
+				0x0300,	# value
+				index,
+				data + zeros,
+				0		# Timeout
+			)
+		_usb.wakeup()
 	
 	
 	def overwrite_control(self, index, data):
 		"""
-		Similar to send_control, but this one checks and overwrites
-		already scheduled controll for same device/index.
+		Same as send_control, which now overwrites already scheduled
+		controll for same device/index as well.
 		"""
-		for x in self._cmsg:
-			x_index, x_data, x_timeout = x[-3:]
-			# First 3 bytes are for PacketType, size and ConfigType
-			if x_index == index and x_data[0:3] == data[0:3]:
-				self._cmsg.remove(x)
-				break
 		self.send_control(index, data)
 	
 	
 	def make_request(self, index, callback, data, size=64):
 		"""
-		Schedules synchronous request that requires response.
-		Request is done ASAP and provided callback is called with recieved data.
+		Schedules request that requires response. Returns immediately;
+		request is sent as asynchronous transfer after control messages
+		scheduled before it, then response is read and callback is called
+		from daemon mainloop with recieved data, or with None if request fails.
 		"""
-		self._rmsg.append((
-			(
-				0x21,	# request_type
-				0x09,	# request
-				0x0300,	# value
-				index, data
-			), index, size, callback
-		))
+		with self._lock:
+			self._rmsg.append((
+				(
+					0x21,	# request_type
+					0x09,	# request
+					0x0300,	# value
+					index, data,
+					0		# Timeout
+				), index, size, callback
+			))
+		_usb.wakeup()
 	
 	
 	def flush(self):
-		""" Flushes all prepared control messages to the device """
-		while len(self._cmsg):
-			msg = self._cmsg.pop()
-			self.handle.controlWrite(*msg)
+		"""
+		Starts sending prepared control messages to the device, unless
+		transfer is already in progress. Rest is sent as each transfer
+		completes.
 		
-		while len(self._rmsg):
-			msg, index, size, callback = self._rmsg.pop()
-			self.handle.controlWrite(*msg)
-			data = self.handle.controlRead(
-				0xA1,	# request_type
-				0x01,	# request
-				0x0300,	# value
-				index, size
-			)
-			callback(data)
+		Called from daemon mainloop or, if 'usb_thread' is enabled,
+		from USB thread. Drivers may call it from mainloop as well;
+		submitting is serialized, so that is safe in both modes.
+		"""
+		self._submit_next()
+	
+	
+	def _submit_next(self):
+		"""
+		Submits next control message or request as asynchronous transfer,
+		unless one is already in progress.
+		
+		If submitting fails, failure is reported for message that was
+		being submitted and USBError is re-raised.
+		"""
+		with self._io_lock:
+			if self._closed or self._ctransfer_busy:
+				return
+			with self._lock:
+				if self._cmsg:
+					key, msg = self._cmsg.popitem(False)
+					user_data = None
+				elif self._rmsg:
+					msg, index, size, callback = self._rmsg.pop()
+					user_data = callback, index, size, msg[4], False
+				else:
+					return
+			if self._ctransfer is None:
+				self._ctransfer = self.handle.getTransfer()
+			request_type, request, value, index, data, timeout = msg
+			try:
+				self._ctransfer.setControl(request_type, request, value, index, data,
+					callback=self._on_control_done, user_data=user_data, timeout=timeout)
+				self._ctransfer.submit()
+				self._ctransfer_busy = True
+				self.sent_controls += 1
+				return
+			except usb1.USBError, e:
+				error = e
+		# Reported outside of lock, callback may call close()
+		self._control_failed(user_data, error)
+		raise error
+	
+	
+	def _on_control_done(self, transfer):
+		"""
+		Called by libusb when control transfer is finished. If it was
+		request, response is read, otherwise next message is sent.
+		"""
+		self._ctransfer_busy = False
+		status = transfer.getStatus()
+		if self._closed or status in (usb1.TRANSFER_NO_DEVICE, usb1.TRANSFER_CANCELLED):
+			return
+		user_data = transfer.getUserData()
+		if status != usb1.TRANSFER_COMPLETED:
+			self._control_failed(user_data, "status %s" % (status,))
+		elif user_data and not user_data[4]:
+			# Request sent, read response
+			callback, index, size, data, reading = user_data
+			user_data = callback, index, size, data, True
+			with self._io_lock:
+				if self._closed:
+					return
+				try:
+					transfer.setControl(
+						0xA1,	# request_type
+						0x01,	# request
+						0x0300,	# value
+						index, size,
+						callback=self._on_control_done,
+						user_data=user_data)
+					transfer.submit()
+					self._ctransfer_busy = True
+					return
+				except usb1.USBError, e:
+					error = e
+			self._control_failed(user_data, error)
+		elif user_data:
+			# Response received
+			_usb.call_in_mainloop(user_data[0], transfer.getBuffer())
+		try:
+			self._submit_next()
+		except usb1.USBError:
+			# Already reported by _submit_next
+			pass
+	
+	
+	def _control_failed(self, user_data, reason):
+		"""
+		Logs failed control transfer. If it was request, its callback
+		is called with None, so caller doesn't wait for response forever.
+		"""
+		if user_data:
+			callback, index, size, data, reading = user_data
+			log.error("Request %s to %s, index %s failed while %s: %s",
+				data[0:3].encode("hex"), self, index,
+				"reading response" if reading else "sending", reason)
+			_usb.call_in_mainloop(callback, None)
+		else:
+			log.error("Failed to send control to %s: %s", self, reason)
 	
 	
 	def force_restart(self):
@@ -169,6 +303,29 @@ class USBDevice(object):
 	
 	def close(self):
 		""" Called after device is disconnected """
+		# Waits until USB thread finishes submitting, if it's doing so
+		with self._io_lock:
+			self._closed = True
+			if self._ctransfer_busy:
+				try:
+					self._ctransfer.cancel()
+				except usb1.USBError:
+					# Already finished or device is gone
+					self._ctransfer_busy = False
+		# Control transfer has to be finished before interfaces are released
+		deadline = time.time() + CLOSE_TIMEOUT
+		while self._ctransfer_busy and time.time() < deadline:
+			if _usb._thread:
+				# USB thread handles events and calls _on_control_done
+				time.sleep(0.01)
+			else:
+				try:
+					_usb._ctx.handleEventsTimeout(0.01)
+				except usb1.USBError:
+					# Fails when called from another transfer callback
+					break
+		if self._ctransfer_busy:
+			log.warning("Control transfer to %s not canceled in time", self)
 		try:
 			self.unclaim()
 		except: pass
@@ -190,6 +347,13 @@ class USBDriver(object):
 		self._retry_devices_timer = 0
 		self._ctx = None	# Set by start method
 		self._changed = 0
+		self.input_transfers = DEFAULT_INPUT_TRANSFERS
+		self.use_thread = False
+		self.dropped_calls = 0		# Input packets dropped because queue was full
+		self._thread = None
+		self._io_poller = None		# Used only by USB thread
+		self._queue = deque()
+		self._input_queue = deque(maxlen=IO_QUEUE_SIZE)
 	
 	
 	def set_daemon(self, daemon):
@@ -198,6 +362,10 @@ class USBDriver(object):
 	
 	def on_exit(self, *a):
 		""" Closes all devices and unclaims all interfaces """
+		if self._thread:
+			self._thread, thread = None, self._thread
+			self._io_poller.wakeup()
+			thread.join(IO_TIMEOUT)
 		if len(self._devices):
 			log.debug("Releasing devices...")
 			to_release, self._devices, self._syspaths = self._devices.values(), {}, {}
@@ -211,16 +379,82 @@ class USBDriver(object):
 		def fd_cb(*a):
 			self._changed += 1
 		
+		if self.use_thread:
+			poller = self._io_poller = Poller()
+		else:
+			poller = self.daemon.get_poller()
+		
 		def register_fd(fd, events, *a):
-			self.daemon.get_poller().register(fd, events, fd_cb)
+			poller.register(fd, events, fd_cb)
 		
 		def unregister_fd(fd, *a):
-			self.daemon.get_poller().unregister(fd)
+			poller.unregister(fd)
 		
 		self._ctx.setPollFDNotifiers(register_fd, unregister_fd)
 		for fd, events in self._ctx.getPollFDList():
 			register_fd(fd, events)	
 		self._started = True
+		if self.use_thread:
+			self._thread = threading.Thread(target=self._io_thread, name="USB")
+			self._thread.daemon = True
+			self._thread.start()
+	
+	
+	def wakeup(self):
+		""" Wakes up USB thread so queued control messages are sent """
+		if self._thread:
+			self._io_poller.wakeup()
+	
+	
+	def call_in_mainloop(self, fn, *args):
+		"""
+		Calls fn(*args) right away or, if called from USB thread, queues
+		it to be called from daemon mainloop.
+		"""
+		if self._thread is None or threading.current_thread() is not self._thread:
+			fn(*args)
+			return
+		self._queue.append(( fn, args ))
+		self.daemon.get_poller().wakeup()
+	
+	
+	def input_in_mainloop(self, fn, *args):
+		"""
+		As call_in_mainloop, but used for input packets, which may be lost
+		anyway. If main thread is not fast enough to process them, oldest
+		queued packets are dropped.
+		"""
+		if self._thread is None or threading.current_thread() is not self._thread:
+			fn(*args)
+			return
+		if len(self._input_queue) == IO_QUEUE_SIZE:
+			self.dropped_calls += 1
+		self._input_queue.append(( fn, args ))
+		self.daemon.get_poller().wakeup()
+	
+	
+	def _flush_devices(self):
+		""" Sends control messages to all devices """
+		for d in self._devices.values():		# TODO: don't use .values() here
+			try:
+				d.flush()
+			except usb1.USBErrorPipe:
+				log.error("USB device %s disconnected durring flush", d)
+				self.call_in_mainloop(d.close)
+				break
+	
+	
+	def _io_thread(self):
+		""" Handles libusb events and sends control messages """
+		while self._thread:
+			self._io_poller.poll(IO_TIMEOUT)
+			try:
+				if self._changed > 0:
+					self._changed = 0
+					self._ctx.handleEventsTimeout()
+				self._flush_devices()
+			except usb1.USBError, e:
+				log.error("USB error: %s", e)
 	
 	
 	def handle_new_device(self, syspath, vendor, product):
@@ -312,17 +546,17 @@ class USBDriver(object):
 	
 	
 	def mainloop(self):
-		if self._changed > 0:
-			self._ctx.handleEventsTimeout()
-			self._changed = 0
-		
-		for d in self._devices.values():		# TODO: don't use .values() here
-			try:
-				d.flush()
-			except usb1.USBErrorPipe:
-				log.error("USB device %s disconnected durring flush", d)
-				d.close()
-				break
+		if self._thread:
+			# Only calls queued by USB thread are processed here
+			for queue in (self._queue, self._input_queue):
+				while queue:
+					fn, args = queue.popleft()
+					fn(*args)
+		else:
+			if self._changed > 0:
+				self._ctx.handleEventsTimeout()
+				self._changed = 0
+			self._flush_devices()
 		if len(self._retry_devices):
 			if time.time() > self._retry_devices_timer:
 				self._retry_devices_timer = time.time() + 5.0
@@ -336,6 +570,8 @@ _usb = USBDriver()
 
 def init(daemon, config):
 	_usb.set_daemon(daemon)
+	_usb.input_transfers = max(1, int(config["usb_input_transfers"]))
+	_usb.use_thread = bool(config["usb_thread"])
 	daemon.add_on_exit(_usb.on_exit)
 	daemon.add_mainloop(_usb.mainloop)
 	return True
@@ -344,6 +580,22 @@ def start(daemon):
 	_usb.start()
 
 
+def get_dropped():
+	"""
+	Returns number of input transfers completed with unexpected size
+	on all opened devices.
+	"""
+	return sum([ d.dropped_transfers for d in _usb._devices.values() ])
+
+
+def get_dropped_calls():
+	"""
+	Returns number of input packets dropped because USB thread received
+	them faster than main thread was able to process them.
+	"""
+	return _usb.dropped_calls
+
+
 def register_hotplug_device(callback, vendor_id, product_id, on_failure=None):
 	_usb.register_hotplug_device(callback, vendor_id, product_id, on_failure)
 
@@ -0,0 +1,177 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Binary framing for daemon protocol
+
+After client sends 'Binary.' and daemon responds with 'OK.', both sides
+may use length-prefixed frames instead of newline-terminated text messages.
+Input events are then sent as fixed-size records instead of 'Event: ...'
+lines, which saves formatting and parsing strings on both sides.
+
+Frame:	0xFF marker (uint8), frame type (uint8), payload length (uint16),
+		payload.
+All values are little-endian. As 0xFF never appears in utf-8 encoded text,
+frames and text messages can be mixed in same stream and reader can always
+tell them apart.
+
+Frame types:
+	FT_MESSAGE		payload is utf-8 encoded text message without newline.
+	FT_CONTROLLER	assigns handle (uint16) to controller id (rest of payload,
+					utf-8). Sent before first event from that controller.
+	FT_EVENT		EVENT_RECORD; controller handle (uint16), source (uint8,
+					index in SOURCES), number of values (uint8) and two
+					values (int32). Unused value is zero.
+"""
+from scc.constants import SCButtons, STICK, RSTICK, LEFT, RIGHT, CPAD, DPAD
+import struct, threading
+
+MARKER = b"\xff"
+FRAME_HEADER = struct.Struct("<cBH")
+EVENT_RECORD = struct.Struct("<HBBii")
+HANDLE = struct.Struct("<H")
+# Header and event record packed at once
+EVENT_FRAME = struct.Struct(FRAME_HEADER.format + EVENT_RECORD.format[1:])
+MAX_PAYLOAD = 0xFFFF
+
+FT_MESSAGE = 0
+FT_CONTROLLER = 1
+FT_EVENT = 2
+
+SOURCES = ( STICK, RSTICK, LEFT, RIGHT, CPAD, DPAD ) + tuple([
+	x.name for x in sorted(SCButtons, key=lambda x: x.value) ])
+SOURCE_CODES = { name : i for (i, name) in enumerate(SOURCES) }
+
+
+def encode_frame(type, payload):
+	""" Returns frame as bytes """
+	return FRAME_HEADER.pack(MARKER, type, len(payload)) + payload
+
+
+def decode_event(payload):
+	""" Returns (handle, source, values) from FT_EVENT payload """
+	handle, source, count, x, y = EVENT_RECORD.unpack(payload)
+	return handle, SOURCES[source], (x, y)[0:count]
+
+
+def read_frame(rfile):
+	"""
+	Reads single frame or text line from file-like object.
+	Returns (FT_MESSAGE, text) for text lines, (type, payload) for frames
+	and None when connection is closed.
+	"""
+	first = rfile.read(1)
+	if len(first) == 0:
+		return None
+	if first == MARKER:
+		header = first + rfile.read(FRAME_HEADER.size - 1)
+		if len(header) < FRAME_HEADER.size:
+			return None
+		trash, type, length = FRAME_HEADER.unpack(header)
+		payload = rfile.read(length)
+		if len(payload) < length:
+			return None
+		if type == FT_MESSAGE:
+			return FT_MESSAGE, payload.decode("utf-8")
+		return type, payload
+	line = first + rfile.readline()
+	return FT_MESSAGE, line.decode("utf-8").rstrip("\n")
+
+
+class FrameReader(object):
+	"""
+	Splits incoming data into frames and text lines, for clients
+	that are not reading from blocking file.
+	"""
+	
+	def __init__(self):
+		self.buffer = b""
+	
+	
+	def feed(self, data):
+		"""
+		Adds received data to buffer and returns list of complete
+		(type, payload) tuples, as read_frame does.
+		"""
+		self.buffer += data
+		rv, pos = [], 0
+		while pos < len(self.buffer):
+			if self.buffer[pos] == MARKER:
+				if len(self.buffer) < pos + FRAME_HEADER.size:
+					break
+				trash, type, length = FRAME_HEADER.unpack_from(self.buffer, pos)
+				end = pos + FRAME_HEADER.size + length
+				if len(self.buffer) < end:
+					break
+				payload = self.buffer[pos + FRAME_HEADER.size:end]
+				if type == FT_MESSAGE:
+					payload = payload.decode("utf-8")
+				rv.append(( type, payload ))
+				pos = end
+			else:
+				end = self.buffer.find(b"\n", pos)
+				if end < 0:
+					break
+				rv.append(( FT_MESSAGE, self.buffer[pos:end].decode("utf-8") ))
+				pos = end + 1
+		self.buffer = self.buffer[pos:]
+		return rv
+
+
+class FramedWriter(object):
+	"""
+	Replaces socket file of client that switched to binary mode.
+	Text written using write() is sent as FT_MESSAGE frames, one per line,
+	so code writing to client doesn't have to care about mode.
+	"""
+	
+	def __init__(self, wfile):
+		self.wfile = wfile
+		self.handles = {}
+		self._partial = b""
+		self._lock = threading.Lock()
+	
+	
+	def write(self, data):
+		with self._lock:
+			lines = (self._partial + data).split(b"\n")
+			self._partial = lines.pop()
+			self.wfile.write(b"".join([
+				encode_frame(FT_MESSAGE, line[0:MAX_PAYLOAD]) for line in lines ]))
+	
+	
+	def encode_event(self, controller_id, source, values):
+		"""
+		Returns (prefix, data) tuple, where 'data' is input event encoded
+		as FT_EVENT record and 'prefix' is empty or FT_CONTROLLER frame that
+		has to be sent before it. 'values' is tuple of one or two integers.
+		"""
+		code = SOURCE_CODES.get(source)
+		if code is None or len(values) > 2:
+			# Not something that can be sent as record
+			return b"", encode_frame(FT_MESSAGE, ("Event: %s %s %s" % (controller_id,
+				source, " ".join([ str(x) for x in values ]))).encode("utf-8"))
+		if len(values) == 2:
+			x, y = int(values[0]), int(values[1])
+		else:
+			x, y = int(values[0]), 0
+		handle, prefix = self.handles.get(controller_id), b""
+		if handle is None:
+			handle = self.handles[controller_id] = len(self.handles)
+			prefix = encode_frame(FT_CONTROLLER, HANDLE.pack(handle) + controller_id.encode("utf-8"))
+		return prefix, EVENT_FRAME.pack(MARKER, FT_EVENT, EVENT_RECORD.size,
+			handle, code, len(values), x, y)
+	
+	
+	def write_event(self, controller_id, source, values):
+		""" Encodes and sends input event """
+		prefix, data = self.encode_event(controller_id, source, values)
+		# Complete frames are written at once, lock is needed only
+		# by write() to keep partial lines
+		self.wfile.write(prefix + data)
+	
+	
+	def flush(self):
+		self.wfile.flush()
+	
+	
+	def close(self):
+		self.wfile.close()
@@ -998,7 +998,7 @@ class App(Gtk.Application, UserDataManager, BindingEditor):
 				return
 			if c:
 				c.unlock_all()
-				c.observe(DaemonManager.nocallback, self.on_observe_failed,
+				c.observe(DaemonManager.nocallback, self.on_observe_failed, '@60Hz',
 					'A', 'B', 'C', 'X', 'Y', 'START', 'BACK', 'LB', 'RB',
 					'LPAD', 'RPAD', 'LGRIP', 'RGRIP', 'LT', 'RT', 'LEFT',
 					'RIGHT', 'STICK', 'STICKPRESS')
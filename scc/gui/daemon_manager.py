@@ -11,6 +11,8 @@ probably too crazy even for me.
 from __future__ import unicode_literals
 
 from scc.tools import find_binary, find_button_image, nameof
+from scc.framing import FrameReader, decode_event, FT_MESSAGE, FT_CONTROLLER, FT_EVENT
+from scc.framing import HANDLE
 from scc.paths import get_daemon_socket
 from scc.constants import SCButtons
 from scc.gui import BUTTON_ORDER
@@ -79,7 +81,8 @@ class DaemonManager(GObject.GObject):
 		self.alive = None
 		self.connection = None
 		self.connecting = False
-		self.buffer = b""
+		self.reader = FrameReader()
+		self._handles = {}				# Controller handles used in binary mode
 		self._connect()
 		self._requests = []
 		self._controllers = []			# Ordered as daemon says
@@ -153,7 +156,8 @@ class DaemonManager(GObject.GObject):
 		except Exception, e:
 			self._on_daemon_died()
 			return
-		self.buffer = b""
+		self.reader = FrameReader()
+		self._handles = {}
 		self.connection.get_input_stream().read_bytes_async(102400,
 			1, None, self._on_read_data)
 	
@@ -173,14 +177,24 @@ class DaemonManager(GObject.GObject):
 			# Connection terminated
 			self._on_daemon_died()
 			return
-		self.buffer += data
-		while b"\n" in self.buffer:
-			line, self.buffer = self.buffer.split(b"\n", 1)
-			line = line.decode("utf-8")
+		for kind, line in self.reader.feed(data):
+			if kind == FT_EVENT:
+				handle, source, values = decode_event(line)
+				c = self.get_controller(self._handles[handle])
+				c.emit('event', source, list(values))
+				self.emit('event', c, source, list(values))
+				continue
+			elif kind == FT_CONTROLLER:
+				self._handles[HANDLE.unpack_from(line)[0]] = line[HANDLE.size:].decode("utf-8")
+				continue
+			elif kind != FT_MESSAGE:
+				# Unknown frame type
+				continue
 			if line.startswith("Version:"):
 				version = line.split(":", 1)[-1].strip()
 				log.debug("Connected to daemon, version %s", version)
 				self.emit('version', version)
+				self._request_binary()
 			elif line.startswith("Ready."):
 				log.debug("Daemon is ready.")
 				self.alive = True
@@ -247,6 +261,18 @@ class DaemonManager(GObject.GObject):
 				1, None, self._on_read_data)
 	
 	
+	def _request_binary(self):
+		"""
+		Asks daemon to send events as binary records. Daemons that don't
+		support that respond with 'Fail:' and keep sending text.
+		"""
+		def on_binary(*a):
+			log.debug("Daemon switched to binary frames")
+		
+		self._requests.append(( on_binary, DaemonManager.nocallback ))
+		self.connection.get_output_stream().write_all(b"Binary.\n", None)
+	
+	
 	def is_alive(self):
 		""" Returns True if daemon is running """
 		return self.alive
@@ -524,6 +550,8 @@ class ControllerManager(GObject.GObject):
 		Enables observing on physical button, axis or pad.
 		Events from observed sources are sent to this client and processed
 		using 'event' singal, until unlock_all() is called.
+		Rate like '@60Hz' may be passed along with sources to limit how
+		often are positions of axes and pads sent.
 		
 		Calls success_cb() on success or error_cb(error) on failure.
 		"""
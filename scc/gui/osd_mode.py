@@ -77,6 +77,10 @@ class OSDModeKeyboard(object):
 			event.window = self.mapper.target_window
 			event.set_device(self.device)
 			Gtk.main_do_event(event)
+	
+	
+	def flush(self):
+		pass
 
 
 class OSDModeMouse(object):
@@ -96,6 +100,10 @@ class OSDModeMouse(object):
 		pass
 	
 	
+	def flush(self):
+		pass
+	
+	
 	def keyEvent(self, key, val):
 		tp = Gdk.EventType.BUTTON_PRESS if val else Gdk.EventType.BUTTON_RELEASE
 		event = Gdk.Event.new(tp)
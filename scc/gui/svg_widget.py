@@ -4,15 +4,20 @@ SC-Controller - Background
 
 Changes SVG on the fly and uptates that magnificent image on background with it.
 Also supports clicking on areas defined in SVG image.
+
+Hilighting is done in layers: Image without any hilight is rendered once and
+for every hilighted element and color, image with that element recolored is
+rendered once, but only in rectangle around that element. Changing hilights
+then only copies those rectangles over base image.
 """
 from __future__ import unicode_literals
 from scc.tools import _
 
 from gi.repository import Gtk, Gdk, GObject, GdkPixbuf, Rsvg
 from xml.etree import ElementTree as ET
-from math import sin, cos, pi as PI
+from math import sin, cos, floor, ceil, pi as PI
 from collections import OrderedDict
-import os, sys, re, logging
+import os, sys, re, cairo, logging
 
 log = logging.getLogger("Background")
 ET.register_namespace('', "http://www.w3.org/2000/svg")
@@ -20,7 +25,9 @@ ET.register_namespace('', "http://www.w3.org/2000/svg")
 
 class SVGWidget(Gtk.EventBox):
 	FILENAME = "background.svg"
-	CACHE_SIZE = 50
+	CACHE_SIZE = 50			# Images with overlapping hilights
+	LAYER_CACHE_SIZE = 200	# Rendered layers
+	LAYER_MARGIN = 2		# Added around element bounds, in pixels
 	
 	__gsignals__ = {
 			# Raised when mouse is over defined area
@@ -36,6 +43,11 @@ class SVGWidget(Gtk.EventBox):
 		Gtk.EventBox.__init__(self)
 		self.cache = OrderedDict()
 		self.areas = []
+		self._tree = None
+		self._base = None			# Rendered image without hilights
+		self._surface = None		# Currently displayed image
+		self._layers = OrderedDict()	# (id, color) -> Layer
+		self._shown = {}			# Layers drawn on _surface, by id
 		
 		self.connect("motion-notify-event", self.on_mouse_moved)
 		self.connect("button-press-event", self.on_mouse_click)
@@ -54,11 +66,21 @@ class SVGWidget(Gtk.EventBox):
 	
 	def set_image(self, filename):
 		self.current_svg = open(filename, "r").read().decode("utf-8")
-		self.cache = OrderedDict()
+		self.clear_cache()
 		self.areas = []
 		self.parse_image()
 	
 	
+	def clear_cache(self):
+		""" Drops everything rendered. Has to be called when image is changed """
+		self.cache = OrderedDict()
+		self._tree = None
+		self._base = None
+		self._surface = None
+		self._layers = OrderedDict()
+		self._shown = {}
+	
+	
 	def parse_image(self):
 		"""
 		Goes trought SVG image, searches for all rects named
@@ -79,7 +101,7 @@ class SVGWidget(Gtk.EventBox):
 		so this may be slow and nasty.
 		"""
 		self.size_override = width, height
-		self.cache = OrderedDict()
+		self.clear_cache()
 	
 	
 	def on_mouse_click(self, trash, event):
@@ -189,44 +211,181 @@ class SVGWidget(Gtk.EventBox):
 		return 1, 0, 1, 1	# uggly purple
 	
 	
-	def hilight(self, buttons):
-		""" Hilights specified button, if same ID is found in svg """
-		cache_id = "|".join([ "%s:%s" % (x, buttons[x]) for x in buttons ])
-		if not cache_id in self.cache:
-			# Ok, this is close to madness, but probably better than drawing
-			# 200 images by hand;
-			if len(buttons) == 0:
-				# Quick way out - changes are not needed
-				svg = Rsvg.Handle.new_from_data(self.current_svg.encode("utf-8"))
+	def _render(self, svg, surface, x=0, y=0):
+		""" Renders Rsvg.Handle to surface, which covers image from x, y """
+		cr = cairo.Context(surface)
+		cr.translate(-x, -y)
+		if self.size_override:
+			dim = svg.get_dimensions()
+			cr.scale(float(self.size_override[0]) / dim.width,
+				float(self.size_override[1]) / dim.height)
+		svg.render_cairo(cr)
+	
+	
+	def _render_full(self, svg):
+		""" Renders Rsvg.Handle to new surface """
+		if self.size_override:
+			w, h = self.size_override
+		else:
+			dim = svg.get_dimensions()
+			w, h = dim.width, dim.height
+		surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(w), int(h))
+		self._render(svg, surface)
+		return surface
+	
+	
+	def _render_recolored(self, buttons):
+		""" Returns Rsvg.Handle with specified elements recolored """
+		if self._tree is None:
+			self._tree = ET.fromstring(self.current_svg.encode("utf-8"))
+		# Change colors in place and restore them after serializing,
+		# so tree doesn't have to be parsed again
+		saved = []
+		for button in buttons:
+			el = SVGEditor.find_by_id(self._tree, button)
+			if el is not None:
+				saved += [ (e, e.attrib.get('style')) for e in el.iter() ]
+				SVGEditor.recolor(el, buttons[button])
+		xml = ET.tostring(self._tree)
+		for e, style in saved:
+			if style is None:
+				e.attrib.pop('style', None)
 			else:
-				# 1st, parse source as XML
-				tree = ET.fromstring(self.current_svg.encode("utf-8"))
-				# 2nd, change colors of some elements
-				for button in buttons:
-					el = SVGEditor.find_by_id(tree, button)
-					if el is not None:
-						SVGEditor.recolor(el, buttons[button])
-					
-				# 3rd, turn it back into XML string......
-				xml = ET.tostring(tree)
-				
-				# ... and now, parse that as XML again......
-				svg = Rsvg.Handle.new_from_data(xml.encode("utf-8"))
-			while len(self.cache) >= self.CACHE_SIZE:
-				self.cache.popitem(False)
-			if self.size_override:
-				w, h = self.size_override
-				self.cache[cache_id] = svg.get_pixbuf().scale_simple(
-						w, h, GdkPixbuf.InterpType.BILINEAR)
+				e.attrib['style'] = style
+		return Rsvg.Handle.new_from_data(xml.encode("utf-8"))
+	
+	
+	def _get_layer(self, id, color):
+		"""
+		Returns Layer with element recolored, rendered only in
+		rectangle around that element. Returns None if there is no
+		element with such id.
+		"""
+		key = id, color
+		if key in self._layers:
+			return self._layers[key]
+		layer = None
+		if SVGEditor.find_by_id(self._tree, id) is not None:
+			svg = self._render_recolored({ id : color })
+			ok1, pos = svg.get_position_sub("#" + id)
+			ok2, dim = svg.get_dimensions_sub("#" + id)
+			width, height = self._base.get_width(), self._base.get_height()
+			if ok1 and ok2:
+				sx, sy = 1.0, 1.0
+				if self.size_override:
+					size = svg.get_dimensions()
+					sx = float(width) / size.width
+					sy = float(height) / size.height
+				x1 = max(0, int(floor(pos.x * sx)) - self.LAYER_MARGIN)
+				y1 = max(0, int(floor(pos.y * sy)) - self.LAYER_MARGIN)
+				x2 = min(width, int(ceil((pos.x + dim.width) * sx)) + self.LAYER_MARGIN)
+				y2 = min(height, int(ceil((pos.y + dim.height) * sy)) + self.LAYER_MARGIN)
 			else:
-				self.cache[cache_id] = svg.get_pixbuf()
+				# Bounds unknown, whole image is used
+				x1, y1, x2, y2 = 0, 0, width, height
+			if x2 > x1 and y2 > y1:
+				surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, x2 - x1, y2 - y1)
+				self._render(svg, surface, x1, y1)
+				layer = Layer(x1, y1, x2 - x1, y2 - y1, surface)
+		while len(self._layers) >= self.LAYER_CACHE_SIZE:
+			self._layers.popitem(False)
+		self._layers[key] = layer
+		return layer
+	
+	
+	def _paint(self, source, rect):
+		"""
+		Copies 'rect' (x, y, width, height) from base image and then from
+		every shown layer that intersects it to displayed image.
+		"""
+		SVGWidget.composite(self._surface, source, rect, self._shown.values())
+	
+	
+	@staticmethod
+	def composite(surface, source, rect, layers):
+		"""
+		Copies 'rect' of 'source' to 'surface' and then copies every layer
+		over it, each only in area where layer and 'rect' overlap.
+		"""
+		cr = cairo.Context(surface)
+		cr.set_operator(cairo.OPERATOR_SOURCE)
+		cr.rectangle(*rect)
+		cr.clip()
+		cr.set_source_surface(source, 0, 0)
+		cr.paint()
+		for layer in layers:
+			if layer.intersects(rect):
+				# SOURCE replaces everything in clip, so clip has to be
+				# limited to layer itself
+				cr.save()
+				cr.rectangle(*layer.rect())
+				cr.clip()
+				cr.set_source_surface(layer.surface, layer.x, layer.y)
+				cr.paint()
+				cr.restore()
+	
+	
+	def hilight(self, buttons):
+		""" Hilights specified button, if same ID is found in svg """
+		if self._base is None:
+			self._tree = ET.fromstring(self.current_svg.encode("utf-8"))
+			self._base = self._render_full(
+				Rsvg.Handle.new_from_data(self.current_svg.encode("utf-8")))
+			self._surface = None
+		
+		layers = {}
+		for id in buttons:
+			layer = self._get_layer(id, buttons[id])
+			if layer is not None:
+				layers[id] = layer
+		
+		lst = layers.values()
+		overlapping = any([ lst[i].intersects(lst[j].rect())
+			for i in xrange(len(lst)) for j in xrange(i + 1, len(lst)) ])
+		if overlapping:
+			# Layers cannot be simply stacked over each other here,
+			# whole image is rendered with all elements recolored
+			cache_id = "|".join([ "%s:%s" % (x, buttons[x]) for x in sorted(buttons) ])
+			if not cache_id in self.cache:
+				while len(self.cache) >= self.CACHE_SIZE:
+					self.cache.popitem(False)
+				self.cache[cache_id] = self._render_full(self._render_recolored(buttons))
+			self._surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+				self._base.get_width(), self._base.get_height())
+			self._shown = {}
+			self._paint(self.cache[cache_id], self.rect())
+			self._shown = None		# Everything has to be repainted next time
+		elif self._surface is None or self._shown is None:
+			self._surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
+				self._base.get_width(), self._base.get_height())
+			self._shown = layers
+			self._paint(self._base, self.rect())
+		else:
+			# Only rectangles where something has changed are repainted
+			dirty = []
+			for id in set(self._shown.keys() + layers.keys()):
+				old, new = self._shown.get(id), layers.get(id)
+				if old is not new:
+					if old: dirty.append(old.rect())
+					if new: dirty.append(new.rect())
+			self._shown = layers
+			for rect in dirty:
+				self._paint(self._base, rect)
 		
-		self.image.set_from_pixbuf(self.cache[cache_id])
+		self.image.set_from_surface(self._surface)
+	
+	
+	def rect(self):
+		""" Returns (x, y, width, height) of whole rendered image """
+		return 0, 0, self._base.get_width(), self._base.get_height()
 	
 	
 	def get_pixbuf(self):
 		""" Returns pixbuf of current image """
-		return self.image.get_pixbuf()
+		if self._surface is None:
+			return None
+		return Gdk.pixbuf_get_from_surface(self._surface, 0, 0,
+			self._surface.get_width(), self._surface.get_height())
 	
 	
 	def edit(self):
@@ -234,6 +393,24 @@ class SVGWidget(Gtk.EventBox):
 		return SVGEditor(self)
 
 
+class Layer(object):
+	""" Part of image with one element recolored """
+	def __init__(self, x, y, width, height, surface):
+		self.x, self.y = x, y
+		self.width, self.height = width, height
+		self.surface = surface
+	
+	
+	def rect(self):
+		return self.x, self.y, self.width, self.height
+	
+	
+	def intersects(self, rect):
+		x, y, width, height = rect
+		return (self.x < x + width and x < self.x + self.width
+			and self.y < y + height and y < self.y + self.height)
+
+
 class Area:
 	SPECIAL_CASES = ( "LSTICK", "RSTICK", "DPAD", "ABS", "MOUSE",
 		"MINUSHALF", "PLUSHALF", "KEY" )
@@ -287,7 +464,7 @@ class SVGEditor(object):
 		Return self.
 		"""
 		self._svgw.current_svg = ET.tostring(self._tree)
-		self._svgw.cache = OrderedDict()
+		self._svgw.clear_cache()
 		self._svgw.hilight({})
 		
 		return self
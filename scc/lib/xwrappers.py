@@ -18,7 +18,8 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
-from ctypes import CDLL, POINTER, c_void_p, Structure, byref, cast
+from ctypes import CDLL, POINTER, CFUNCTYPE, c_void_p, Structure, Union
+from ctypes import byref, cast
 from ctypes import c_long, c_ulong, c_int, c_uint, c_short, c_char_p
 from ctypes import c_ushort, c_ubyte, c_char_p, c_bool
 
@@ -108,6 +109,26 @@ class XWindowAttributes(Structure):
 		('screen', c_void_p)
 	]
 
+class XPropertyEvent(Structure):
+	_fields_ = [
+		('type', c_int),
+		('serial', c_ulong),
+		('send_event', c_int),
+		('display', c_void_p),
+		('window', XID),
+		('atom', Atom),
+		('time', c_ulong),
+		('state', c_int),
+	]
+
+class XEvent(Union):
+	""" Only PropertyNotify is used, everything else is just padding """
+	_fields_ = [
+		('type', c_int),
+		('xproperty', XPropertyEvent),
+		('pad', c_long * 24),
+	]
+
 
 # Consants
 SHAPE_BOUNDING	= 0
@@ -121,6 +142,10 @@ SUCCESS			= 0
 
 ISVIEWABLE		= 2
 
+PROPERTYNOTIFY		= 28
+PROPERTYCHANGEMASK	= 1 << 17
+NOEVENTMASK			= 0
+
 
 # Functions
 open_display = libX11.XOpenDisplay
@@ -254,6 +279,34 @@ shape_combine_mask.__doc__ = "Sets 1-bit transparency mask for window"
 shape_combine_mask.argtypes = [ c_void_p, XID, c_int, c_int, c_int, Pixmap, c_int ]
 
 
+select_input = libX11.XSelectInput
+select_input.__doc__ = "Sets events that should be reported for window"
+select_input.argtypes = [ c_void_p, XID, c_long ]
+
+pending = libX11.XPending
+pending.__doc__ = "Returns number of events that were received but not processed yet"
+pending.argtypes = [ c_void_p ]
+pending.restype = c_int
+
+next_event = libX11.XNextEvent
+next_event.__doc__ = "Removes first event from queue and copies it to XEvent. Blocks if queue is empty"
+next_event.argtypes = [ c_void_p, POINTER(XEvent) ]
+
+connection_number = libX11.XConnectionNumber
+connection_number.__doc__ = "Returns file descriptor of connection to XServer"
+connection_number.argtypes = [ c_void_p ]
+connection_number.restype = c_int
+
+ERROR_HANDLER = CFUNCTYPE(c_int, c_void_p, c_void_p)
+set_error_handler = libX11.XSetErrorHandler
+set_error_handler.__doc__ = """Sets function called when XServer reports an error.
+	Default handler terminates process, which is not desired when
+	working with windows that may be destroyed at any time.
+	Handler has to be ERROR_HANDLER instance and reference to it has to be kept.
+	"""
+set_error_handler.argtypes = [ ERROR_HANDLER ]
+set_error_handler.restype = c_void_p
+
 
 # Wrapped functions
 _xkb_get_state = libX11.XkbGetState
@@ -359,9 +412,9 @@ def get_current_window(dpy):
 	# Fall-back to something what probably can't work anyway
 	win, revert_to = XID(), c_int()
 	get_input_focus(dpy, byref(win), byref(revert_to))
-	if win == 0:
+	if win.value == 0:
 		return get_default_root_window(dpy)
-	return win
+	return win.value
 
 
 def get_window_type(dpy, window):
@@ -17,6 +17,10 @@ from scc.profile import Profile
 import traceback, logging, time, os
 log = logging.getLogger("Mapper")
 
+# Maps single bit of 'buttons' field to SCButtons member. Used to visit
+# only buttons that were changed, instead of iterating over all of them.
+BIT_TO_BUTTON = { int(x) : x for x in SCButtons }
+
 class Mapper(object):
 	DEBUG = False
 	
@@ -58,6 +62,7 @@ class Mapper(object):
 		self.lpad_touched = False
 		self.state, self.old_state = None, None
 		self.force_event = set()
+		self._set_flags(0)
 	
 	
 	def create_gamepad(self, enabled, poller):
@@ -65,8 +70,7 @@ class Mapper(object):
 		if not enabled or "SCC_NOGAMEPAD" in os.environ:
 			# Completly undocumented and for debuging purposes only.
 			# If set, no gamepad is emulated
-			self.gamepad = Dummy()
-			return
+			return Dummy()
 		cfg = Config()
 		keys = ALL_BUTTONS[0:cfg["output"]["buttons"]]
 		vendor = int(cfg["output"]["vendor"], 16)
@@ -124,16 +128,34 @@ class Mapper(object):
 	
 	
 	def sync(self):
-		""" Syncs generated events """
+		"""
+		Syncs generated events and writes everything generated so far
+		to virtual devices, using single write per device.
+		"""
 		if len(self.syn_list):
 			for dev in self.syn_list:
 				dev.synEvent()
 			self.syn_list = set()
+		self.keyboard.flush()
+		self.mouse.flush()
+		self.gamepad.flush()
 	
 	
 	def set_controller(self, c):
 		""" Sets controller device, used by some (one so far) actions """
 		self.controller = c
+		self._set_flags(0 if c is None else c.flags)
+	
+	
+	def _set_flags(self, flags):
+		"""
+		Precomputes which branches of input() are taken for
+		controller with given flags.
+		"""
+		self._separate_stick = bool(flags & ControllerFlags.SEPARATE_STICK)
+		self._is_deck = bool(flags & ControllerFlags.IS_DECK)
+		self._has_rstick = bool(flags & ControllerFlags.HAS_RSTICK)
+		self._has_cpad = bool(flags & ControllerFlags.HAS_CPAD)
 	
 	
 	def get_controller(self):
@@ -371,23 +393,30 @@ class Mapper(object):
 		btn_add = xor & self.buttons
 		
 		try:
-			if btn_add or btn_rem:
-				# At least one button was pressed
-				for x in self.profile.buttons:
-					if x & btn_add:
-						self.profile.buttons[x].button_press(self)
-					elif x & btn_rem:
-						self.profile.buttons[x].button_release(self)
+			if xor:
+				# At least one button was pressed or released.
+				# Only changed bits are visited, from lowest one up.
+				buttons = self.profile.buttons
+				while xor:
+					bit = xor & -xor
+					xor ^= bit
+					action = buttons.get(BIT_TO_BUTTON.get(bit))
+					if action is None:
+						continue
+					if bit & btn_add:
+						action.button_press(self)
+					else:
+						action.button_release(self)
 			
 			
 			# Check sticks
-			if self.controller.flags & ControllerFlags.SEPARATE_STICK:
+			if self._separate_stick:
 				if FE_STICK in fe or self.old_state.stick_x != state.stick_x or self.old_state.stick_y != state.stick_y:
 					self.profile.stick.whole(self, state.stick_x, state.stick_y, STICK)
 			elif not self.buttons & SCButtons.LPADTOUCH:
 				if FE_STICK in fe or self.old_state.lpad_x != state.lpad_x or self.old_state.lpad_y != state.lpad_y:
 					self.profile.stick.whole(self, state.lpad_x, state.lpad_y, STICK)
-			if self.controller.flags & ControllerFlags.IS_DECK:
+			if self._is_deck:
 				if FE_STICK in fe or self.old_state.rstick_x != state.rstick_x or self.old_state.rstick_y != state.rstick_y:
 					self.profile.rstick.whole(self, state.rstick_x, state.rstick_y, RSTICK)
 			
@@ -405,18 +434,18 @@ class Mapper(object):
 			
 			# Check pads
 			# RPAD
-			if controller.flags & ControllerFlags.HAS_RSTICK:
+			if self._has_rstick:
 				if FE_PAD in fe or self.old_state.rpad_x != state.rpad_x or self.old_state.rpad_y != state.rpad_y:
 					self.profile.pads[RIGHT].whole(self, state.rpad_x, state.rpad_y, RIGHT)
 			elif FE_PAD in fe or self.buttons & SCButtons.RPADTOUCH or SCButtons.RPADTOUCH & btn_rem:
 				self.profile.pads[RIGHT].whole(self, state.rpad_x, state.rpad_y, RIGHT)
 			# DPAD
-			if controller.flags & ControllerFlags.IS_DECK:
+			if self._is_deck:
 				if FE_PAD in fe or self.old_state.dpad_x != state.dpad_x or self.old_state.dpad_y != state.dpad_y:
 					self.profile.pads[DPAD].whole(self, state.dpad_x, state.dpad_y, DPAD)
 			
 			# LPAD
-			if self.controller.flags & ControllerFlags.SEPARATE_STICK:
+			if self._separate_stick:
 				if FE_PAD in fe or self.old_state.lpad_x != state.lpad_x or self.old_state.lpad_y != state.lpad_y:
 					self.profile.pads[LEFT].whole(self, state.lpad_x, state.lpad_y, LEFT)
 			else:
@@ -436,7 +465,7 @@ class Mapper(object):
 						self.profile.pads[LEFT].whole(self, 0, 0, LEFT)
 					
 			# CPAD (touchpad on DS4 controller)
-			if controller.flags & ControllerFlags.HAS_CPAD:
+			if self._has_cpad:
 				if ((FE_PAD in fe)
 						or (self.old_state.cpad_x != state.cpad_x)
 						or (self.old_state.cpad_y != state.cpad_y)
@@ -416,6 +416,8 @@ class BallModifier(Modifier, WholeHapticAction):
 		self._a = self._r * self.friction / self._I
 		self._xvel_dq = deque(maxlen=mean_len)
 		self._yvel_dq = deque(maxlen=mean_len)
+		self._xvel_sum = 0.0		# Running sums of values in _xvel_dq
+		self._yvel_sum = 0.0		# and _yvel_dq
 		self._lastTime = time.time()
 		self._old_pos = None
 	
@@ -434,10 +436,15 @@ class BallModifier(Modifier, WholeHapticAction):
 			| Modifier.get_compatible_modifiers(self) )
 	
 	
-	def _stop(self):
-		""" Stops rolling of the 'ball' """
+	def _clear_velocity(self):
 		self._xvel_dq.clear()
 		self._yvel_dq.clear()
+		self._xvel_sum, self._yvel_sum = 0.0, 0.0
+	
+	
+	def _stop(self):
+		""" Stops rolling of the 'ball' """
+		self._clear_velocity()
 		if self._roll_task:
 			self._roll_task.cancel()
 			self._roll_task = None
@@ -445,15 +452,23 @@ class BallModifier(Modifier, WholeHapticAction):
 	
 	def _add(self, dx, dy):
 		# Compute instant velocity
-		try:
-			self._xvel = sum(self._xvel_dq) / len(self._xvel_dq)
-			self._yvel = sum(self._yvel_dq) / len(self._yvel_dq)
-		except ZeroDivisionError:
+		count = len(self._xvel_dq)
+		if count:
+			self._xvel = self._xvel_sum / count
+			self._yvel = self._yvel_sum / count
+		else:
 			self._xvel = 0.0
 			self._yvel = 0.0
 		
-		self._xvel_dq.append(dx * self._radscale)
-		self._yvel_dq.append(dy * self._radscale)
+		if count == self._xvel_dq.maxlen:
+			# Oldest value is about to drop out
+			self._xvel_sum -= self._xvel_dq[0]
+			self._yvel_sum -= self._yvel_dq[0]
+		dx, dy = dx * self._radscale, dy * self._radscale
+		self._xvel_dq.append(dx)
+		self._yvel_dq.append(dy)
+		self._xvel_sum += dx
+		self._yvel_sum += dy
 	
 	
 	def _roll(self, mapper):
@@ -462,8 +477,7 @@ class BallModifier(Modifier, WholeHapticAction):
 		dt, self._lastTime = t - self._lastTime, t
 		
 		# Free movement update velocity and compute movement
-		self._xvel_dq.clear()
-		self._yvel_dq.clear()
+		self._clear_velocity()
 		
 		_hyp = sqrt((self._xvel**2) + (self._yvel**2))
 		if _hyp != 0.0:
@@ -848,6 +862,18 @@ class ModeModifier(Modifier):
 				self.checks.append(( self.make_button_check(c), action ))
 	
 	
+	def __getstate__(self):
+		# Checks are closures that cannot be pickled. See scc.profile_cache
+		state = self.__dict__.copy()
+		del state['checks']
+		return state
+	
+	
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.make_checks()
+	
+	
 	def get_child_actions(self):
 		rv = list(self.mods.values()) + list(self.shell_commands.values())
 		if self.default is not None:
@@ -1478,6 +1504,9 @@ class SmoothModifier(Modifier):
 	"""
 	COMMAND = "smooth"
 	PROFILE_KEY_PRIORITY = 11	# Before sensitivity
+	# Weighted sums are recomputed from scratch after this many pushes,
+	# so rounding errors can't pile up
+	RESYNC_INTERVAL = 1024
 	
 	def _mod_init(self, level=8, multiplier=0.75, filter=2.0):
 		self.level = level
@@ -1488,6 +1517,10 @@ class SmoothModifier(Modifier):
 		self._range = list(xrange(level))
 		self._weights = [ multiplier ** x for x in reversed(self._range) ]
 		self._w_sum = sum(self._weights)
+		self._w_oldest = self._weights[0] if level else 0.0
+		# Weighted sums of values in _deq_x and _deq_y, updated on every push
+		self._sum_x, self._sum_y = 0.0, 0.0
+		self._resync = SmoothModifier.RESYNC_INTERVAL
 		self._last_pos = None
 		self._moving = False
 	
@@ -1507,11 +1540,35 @@ class SmoothModifier(Modifier):
 		return SmoothModifier(*pars)
 	
 	
+	def _fill(self, x, y):
+		""" Fills deque with single position """
+		for i in self._range:
+			self._deq_x.append(x)
+			self._deq_y.append(y)
+		self._sum_x, self._sum_y = x * self._w_sum, y * self._w_sum
+	
+	
+	def _push(self, x, y):
+		"""
+		Adds position to deque. As weights are powers of multiplier,
+		weight of every position already in deque gets multiplied by it,
+		so weighted sum can be updated without summing entire deque again.
+		"""
+		m = self.multiplier
+		self._sum_x = (self._sum_x - self._deq_x[0] * self._w_oldest) * m + x
+		self._sum_y = (self._sum_y - self._deq_y[0] * self._w_oldest) * m + y
+		self._deq_x.append(x)
+		self._deq_y.append(y)
+		self._resync -= 1
+		if self._resync <= 0:
+			self._resync = SmoothModifier.RESYNC_INTERVAL
+			self._sum_x = sum(( self._deq_x[i] * self._weights[i] for i in self._range ))
+			self._sum_y = sum(( self._deq_y[i] * self._weights[i] for i in self._range ))
+	
+	
 	def _get_pos(self):
 		""" Computes average x,y from all accumulated positions """
-		x = sum(( self._deq_x[i] * self._weights[i] for i in self._range ))
-		y = sum(( self._deq_y[i] * self._weights[i] for i in self._range ))
-		return x / self._w_sum, y / self._w_sum
+		return self._sum_x / self._w_sum, self._sum_y / self._w_sum
 	
 	
 	def whole(self, mapper, x, y, what):
@@ -1520,15 +1577,12 @@ class SmoothModifier(Modifier):
 		if mapper.is_touched(what):
 			if self._last_pos is None:
 				# Just pressed - fill deque with current position
-				for i in self._range:
-					self._deq_x.append(x)
-					self._deq_y.append(y)
+				self._fill(x, y)
 				x, y = self._get_pos()
 				self._last_pos = 0
 			else:
 				# Pressed for longer time
-				self._deq_x.append(x)
-				self._deq_y.append(y)
+				self._push(x, y)
 				x, y = self._get_pos()
 			if abs(x + y - self._last_pos) > self.filter:
 				self.action.whole(mapper, x, y, what)
@@ -1542,6 +1596,82 @@ class SmoothModifier(Modifier):
 			self._last_pos = None
 
 
+class OneEuroModifier(Modifier):
+	"""
+	Smooths pad movements using 1 Euro filter. Unlike smooth(), amount of
+	smoothing adapts to speed of movement; slow movements are heavily
+	smoothed, fast movements are delayed as little as possible.
+	"""
+	COMMAND = "oneeuro"
+	PROFILE_KEY_PRIORITY = 11	# Before sensitivity
+	
+	def _mod_init(self, min_cutoff=1.0, beta=0.007, d_cutoff=1.0):
+		self.min_cutoff = min_cutoff
+		self.beta = beta
+		self.d_cutoff = d_cutoff
+		self._last_time = None
+		self._pos = None		# Filtered x, y
+		self._dpos = 0.0, 0.0	# Filtered speed
+	
+	
+	def __str__(self):
+		return "<OneEuro %s>" % (self.action,)
+	
+	
+	def describe(self, context):
+		if self.name: return self.name
+		return "%s (smooth)" % (self.action.describe(context),)
+	
+	
+	@staticmethod
+	def decode(data, a, *b):
+		pars = data[OneEuroModifier.COMMAND] + [ a ]
+		return OneEuroModifier(*pars)
+	
+	
+	@staticmethod
+	def _alpha(cutoff, dt):
+		tau = 1.0 / (2.0 * PI * cutoff)
+		return 1.0 / (1.0 + tau / dt)
+	
+	
+	def _filter(self, x, y):
+		""" Returns filtered position """
+		t = time.time()
+		dt, self._last_time = max(0.0001, t - self._last_time), t
+		px, py = self._pos
+		a = OneEuroModifier._alpha(self.d_cutoff, dt)
+		dx = self._dpos[0] + a * ((x - px) / dt - self._dpos[0])
+		dy = self._dpos[1] + a * ((y - py) / dt - self._dpos[1])
+		self._dpos = dx, dy
+		cutoff = self.min_cutoff + self.beta * sqrt(dx * dx + dy * dy)
+		a = OneEuroModifier._alpha(cutoff, dt)
+		self._pos = px + a * (x - px), py + a * (y - py)
+		return self._pos
+	
+	
+	def whole(self, mapper, x, y, what):
+		if mapper.controller_flags() & ControllerFlags.HAS_RSTICK and what == RIGHT:
+			return self.action.whole(mapper, x, y, what)
+		if mapper.is_touched(what):
+			if self._pos is None:
+				# Just pressed - start filtering from current position
+				self._pos = x, y
+				self._dpos = 0.0, 0.0
+				self._last_time = time.time()
+			else:
+				x, y = self._filter(x, y)
+			self.action.whole(mapper, x, y, what)
+		elif what == STICK:
+			return self.action.whole(mapper, x, y, what)
+		else:
+			# Pad was just released
+			if self._pos is not None:
+				x, y = self._pos
+				self._pos = None
+			self.action.whole(mapper, x, y, what)
+
+
 class CircularModifier(Modifier, HapticEnabledAction):
 	"""
 	Designed to translate rotating finger over pad to mouse wheel movement.
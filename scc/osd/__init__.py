@@ -189,6 +189,7 @@ class OSDWindow(Gtk.Window):
 	
 	
 	def show(self):
+		self.exit_code = -1
 		self.get_children()[0].show_all()
 		self.realize()
 		self.get_window().set_override_redirect(True)
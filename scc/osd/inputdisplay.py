@@ -82,7 +82,7 @@ class InputDisplay(OSDWindow):
 	def on_daemon_connected(self, *a):
 		c = self.daemon.get_controllers()[0]
 		c.unlock_all()
-		c.observe(DaemonManager.nocallback, self.on_observe_failed,
+		c.observe(DaemonManager.nocallback, self.on_observe_failed, '@60Hz',
 			'A', 'B', 'C', 'X', 'Y', 'START', 'BACK', 'LB', 'RB',
 			'LPAD', 'RPAD', 'LGRIP', 'RGRIP', 'LT', 'RT', 'LEFT',
 			'RIGHT', 'STICK', 'STICKPRESS')	
@@ -8,7 +8,7 @@ Display menu that user can navigate through and print chosen item id to stdout
 from __future__ import unicode_literals
 from scc.tools import _, set_logging_level
 
-from gi.repository import Gtk, Gdk, GdkX11, GObject, GLib, GdkPixbuf, cairo
+from gi.repository import Gtk, Gdk, GdkX11, GObject, GLib, GdkPixbuf
 from xml.etree import ElementTree as ET
 from scc.constants import LEFT, RIGHT, STICK, STICK_PAD_MIN, STICK_PAD_MAX
 from scc.constants import STICK_PAD_MIN_HALF, STICK_PAD_MAX_HALF, CPAD
@@ -33,7 +33,7 @@ from scc.osd.slave_mapper import SlaveMapper
 from scc.osd import OSDWindow
 import scc.osd.osk_actions
 
-import os, sys, json, logging
+import os, sys, json, cairo, logging
 log = logging.getLogger("osd.keyboard")
 
 SPECIAL_KEYS = {
@@ -48,8 +48,19 @@ SPECIAL_KEYS = {
 
 
 class KeyboardImage(Gtk.DrawingArea):
+	"""
+	Draws keyboard. Whole image is rendered only when colors, labels or help
+	changes - once with all keys in normal state, once with all keys
+	hilighted and once with all keys pressed. Drawing then only copies
+	those images, and when hilighted or pressed keys change, only area of
+	keys that changed is redrawn.
+	"""
 	LINE_WIDTH = 2
 	
+	NORMAL = 0
+	HILIGHT = 1
+	PRESSED = 2
+	
 	__gsignals__ = {}
 	
 	
@@ -73,6 +84,7 @@ class KeyboardImage(Gtk.DrawingArea):
 		
 		self._hilight = ()
 		self._pressed = ()
+		self._cache = {}		# state -> cairo surface with whole keyboard
 		self._button_images = {}
 		self._help_areas = [ self.get_limit("HELP_LEFT"), self.get_limit("HELP_RIGHT") ]
 		self._help_lines = ( [], [] )
@@ -90,21 +102,34 @@ class KeyboardImage(Gtk.DrawingArea):
 		
 		self.buttons = [ Button(self.tree, area) for area in areas ]
 		background = SVGEditor.find_by_id(self.tree, "BACKGROUND")
-		self.set_size_request(*SVGEditor.get_size(background))
+		self.size = SVGEditor.get_size(background)
+		self.set_size_request(*self.size)
 		self.overlay.edit().keep("overlay").commit()
 		self.overlay.hilight({})
 		# open("/tmp/a.svg", "w").write(self.overlay.current_svg.encode("utf-8"))
 	
 	
 	def hilight(self, hilight, pressed):
+		""" Redraws only keys that were or are hilighted or pressed """
+		changed = (set(hilight) ^ set(self._hilight)) | (set(pressed) ^ set(self._pressed))
 		self._hilight = hilight
 		self._pressed = pressed
+		for button in changed:
+			self.queue_draw_area(*button.get_damage(self.LINE_WIDTH))
+	
+	
+	def invalidate(self):
+		"""
+		Drops cached images so everything is rendered again.
+		Has to be called after colors are changed.
+		"""
+		self._cache = {}
 		self.queue_draw()
 	
 	
 	def set_help(self, left, right):
 		self._help_lines = ( left, right )
-		self.queue_draw()
+		self.invalidate()
 	
 	
 	def set_labels(self, labels):
@@ -114,7 +139,7 @@ class KeyboardImage(Gtk.DrawingArea):
 				pass
 			elif label:
 				b.label = label.encode("utf-8")
-		self.queue_draw()
+		self.invalidate()
 	
 	
 	def get_limit(self, id):
@@ -175,6 +200,41 @@ class KeyboardImage(Gtk.DrawingArea):
 	
 	
 	def on_draw(self, self2, ctx):
+		ctx.set_source_surface(self.get_surface(ctx, self.NORMAL), 0, 0)
+		ctx.paint()
+		for button in self.buttons:
+			if button in self._pressed:
+				state = self.PRESSED
+			elif button in self._hilight:
+				state = self.HILIGHT
+			else:
+				continue
+			# Only area inside of border is copied, so neighbouring
+			# keys are not touched even if there is no space between them
+			ctx.save()
+			ctx.rectangle(*button)
+			ctx.clip()
+			ctx.set_source_surface(self.get_surface(ctx, state), 0, 0)
+			ctx.paint()
+			ctx.restore()
+	
+	
+	def get_surface(self, ctx, state):
+		"""
+		Returns cached image of whole keyboard with all keys in given state,
+		rendering it first if needed.
+		"""
+		if state not in self._cache:
+			w, h = int(self.size[0]), int(self.size[1])
+			surface = ctx.get_target().create_similar(
+				cairo.CONTENT_COLOR_ALPHA, w, h)
+			self.render(cairo.Context(surface), state)
+			self._cache[state] = surface
+		return self._cache[state]
+	
+	
+	def render(self, ctx, state):
+		""" Renders whole keyboard with all keys in given state """
 		ctx.select_font_face(self.font_face, 0, 0)
 		
 		ctx.set_line_width(self.LINE_WIDTH)
@@ -183,9 +243,9 @@ class KeyboardImage(Gtk.DrawingArea):
 		
 		# Buttons
 		for button in self.buttons:
-			if button in self._pressed:
+			if state == self.PRESSED:
 				ctx.set_source_rgba(*self.color_pressed)
-			elif button in self._hilight:
+			elif state == self.HILIGHT:
 				ctx.set_source_rgba(*self.color_hilight)
 			elif button.dark:
 				ctx.set_source_rgba(*self.color_button2)
@@ -279,6 +339,16 @@ class Button:
 	
 	def __iter__(self):
 		return iter(( self.x, self.y, self.w, self.h ))
+	
+	
+	def get_damage(self, line_width):
+		"""
+		Returns (x, y, width, height) of area covered by button
+		including its border, rounded to whole pixels.
+		"""
+		x, y = int(self.x - line_width), int(self.y - line_width)
+		return (x, y, int(self.x + self.w + line_width) - x + 1,
+			int(self.y + self.h + line_width) - y + 1)
 
 
 class Keyboard(OSDWindow, TimerManager):
@@ -371,6 +441,7 @@ class Keyboard(OSDWindow, TimerManager):
 		self.background.color_hilight = _get("hilight")
 		self.background.color_pressed = _get("pressed")
 		self.background.color_text = _get("text")
+		self.background.invalidate()
 	
 	
 	def use_daemon(self, d):
@@ -7,12 +7,12 @@ Display menu that user can navigate through and prints chosen item id to stdout
 from __future__ import unicode_literals
 from scc.tools import _
 
-from gi.repository import Gtk, GLib, Gio, Gdk, GdkX11, GdkPixbuf
+from gi.repository import Gtk, GLib, GObject, Gio, Gdk, GdkX11, GdkPixbuf
 from scc.tools import point_in_gtkrect, find_menu, find_icon
 from scc.tools import circle_to_square, clamp
 from scc.constants import LEFT, RIGHT, SAME, STICK, ControllerFlags
 from scc.constants import DEFAULT, STICK_PAD_MAX, SCButtons
-from scc.menu_data import MenuData, Separator, Submenu
+from scc.menu_data import MenuData, MenuGenerator, Separator, Submenu
 from scc.gui.daemon_manager import DaemonManager
 from scc.osd import OSDWindow, StickController
 from scc.paths import get_share_path
@@ -29,6 +29,10 @@ import scc.x11.autoswitcher
 
 
 class Menu(OSDWindow):
+	__gsignals__ = {
+		# Emitted instead of destroying menu marked as reusable
+		b"closed"			: (GObject.SignalFlags.RUN_FIRST, None, ()),
+	}
 	EPILOG="""Exit codes:
    0  - clean exit, user selected option
   -1  - clean exit, user canceled menu
@@ -62,6 +66,9 @@ class Menu(OSDWindow):
 		self._scon = StickController()
 		self._scon.connect("direction", self.on_stick_direction)
 		self._is_submenu = False
+		self._reusable = False
+		self._generated = False		# Set if menu has generated items
+		self._submenu_used = False
 		self._selected = None
 		self._menuid = None
 		self._use_cursor = False
@@ -80,6 +87,23 @@ class Menu(OSDWindow):
 		self._is_submenu = True
 	
 	
+	def set_reusable(self):
+		"""
+		Marks menu as reusable. Reusable menu is only hidden when closed and
+		emits 'closed' signal instead of being destroyed. It can be then
+		displayed again by calling show() and use_daemon().
+		"""
+		self._reusable = True
+	
+	
+	def can_be_reused(self):
+		"""
+		Returns True if menu displays only items that cannot change and
+		nothing was changed by submenu, so it can be displayed again.
+		"""
+		return not self._generated and not self._submenu_used
+	
+	
 	def create_parent(self):
 		v = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
 		v.set_name("osd-menu")
@@ -198,6 +222,7 @@ class Menu(OSDWindow):
 			except ValueError:
 				print >>sys.stderr, '%s: error: invalid number of arguments' % (sys.argv[0])
 				return False
+		self._generated = any([ isinstance(i, MenuGenerator) for i in self.items ])
 		return True
 	
 	
@@ -429,7 +454,14 @@ class Menu(OSDWindow):
 			for source, eid in self._eh_ids:
 				source.disconnect(eid)
 			self._eh_ids = []
-		OSDWindow.quit(self, code)
+		self._scon.set_stick(0, 0)
+		if self._reusable:
+			if self.get_visible():
+				self.exit_code = code
+				self.hide()
+				self.emit("closed")
+		else:
+			OSDWindow.quit(self, code)
 	
 	
 	def next_item(self, direction):
@@ -472,6 +504,7 @@ class Menu(OSDWindow):
 		""" Called when user chooses menu item pointing to submenu """
 		filename = find_menu(menuitem.filename)
 		if filename:
+			self._submenu_used = True
 			self._submenu = self.__class__()
 			sub_pos = list(self.position)
 			for i in (0, 1):
@@ -169,6 +169,7 @@ class QuickMenu(Menu):
 		""" Called when user chooses menu item pointing to submenu """
 		filename = find_menu(menuitem.filename)
 		if filename:
+			self._submenu_used = True
 			self._submenu = QuickMenu()
 			sub_pos = list(self.position)
 			for i in (0, 1):
@@ -231,9 +232,18 @@ class QuickMenu(Menu):
 	
 	
 	def on_timeout(self, *a):
+		self._timer = None
 		self.quit(-1)
 	
 	
+	def quit(self, code=-2):
+		self.cancel_timer()
+		for item in self._pressed:
+			item.widget.set_name("osd-menu-item")
+		self._pressed = []
+		Menu.quit(self, code)
+	
+	
 	def show(self, *a):
 		Menu.show(self, *a)
 		self.restart_timer()
@@ -192,6 +192,12 @@ class RadialMenu(Menu):
 	
 	
 	def show(self):
+		if self._selected:
+			# Reused menu starts with nothing selected, as new one
+			if getattr(self._selected, "icon_widget", None):
+				self._selected.icon_widget.set_name("osd-radial-menu-icon")
+			self._selected = None
+			self.b.hilight({})
 		OSDWindow.show(self)
 		
 		from ctypes import byref
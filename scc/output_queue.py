@@ -0,0 +1,189 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Output Queue
+
+Replaces socket file of client connected to daemon. Writing never blocks,
+data is only queued and daemon sends it later from mainloop using
+non-blocking send, so client that stopped reading cannot stall input
+processing.
+
+Input events written with key replace previous, not yet sent event with
+same key, so only latest position of axis is sent to slow client.
+Events are also marked as droppable and when more than MAX_SIZE bytes is
+queued, oldest droppable data is discarded. Responses and other messages
+are never dropped, but if client doesn't read anything while more than
+HARD_LIMIT bytes is queued, it's considered dead and disconnected.
+"""
+from collections import deque
+import socket, errno, threading, logging
+log = logging.getLogger("Output")
+
+SEND_CHUNK = 64 * 1024
+COMPACT_AFTER = 1024	# Number of discarded entries that triggers compaction
+
+
+class OutputQueue(object):
+	MAX_SIZE = 256 * 1024
+	HARD_LIMIT = 4 * 1024 * 1024
+	
+	def __init__(self, connection, on_dirty):
+		"""
+		'on_dirty' is called with this instance as only argument when there
+		is new data to be sent (or when client should be disconnected)
+		and send() has to be called from mainloop. It may be called
+		from any thread.
+		"""
+		self.connection = connection
+		self.fd = connection.fileno()
+		self.on_dirty = on_dirty
+		self.size = 0			# Bytes queued, without discarded entries
+		self.dropped = 0		# Number of entries dropped so far
+		self.closed = False
+		self.broken = False		# Set if client should be disconnected
+		self._queue = deque()	# of [ key, data, droppable ]
+		self._discarded = 0		# Entries in queue with data set to None
+		self._droppable = deque()	# Droppable entries, oldest first
+		self._keys = {}
+		self._offset = 0		# How much of first entry was already sent
+		self._dirty = False
+		self._lock = threading.Lock()
+	
+	
+	def write(self, data, key=None, droppable=False):
+		"""
+		Queues data. If key is set, not yet sent data written with same key
+		is discarded.
+		"""
+		with self._lock:
+			if self.closed or self.broken:
+				return
+			if key is not None:
+				old = self._keys.get(key)
+				if old is not None and old[1] is not None and (old is not self._queue[0] or self._offset == 0):
+					self._discard(old)
+			entry = [ key, data, droppable ]
+			self._queue.append(entry)
+			if droppable:
+				self._droppable.append(entry)
+			self.size += len(data)
+			if key is not None:
+				self._keys[key] = entry
+			if self.size > self.MAX_SIZE:
+				self._drop_oldest()
+			if self.size > self.HARD_LIMIT:
+				log.warning("Client is not reading, disconnecting")
+				self.broken = True
+			notify = not self._dirty
+			self._dirty = True
+		if notify:
+			self.on_dirty(self)
+	
+	
+	def _discard(self, entry):
+		""" Has to be called with lock held """
+		self.size -= len(entry[1])
+		entry[1] = None
+		self._discarded += 1
+		if entry[0] is not None and self._keys.get(entry[0]) is entry:
+			del self._keys[entry[0]]
+		if self._discarded > COMPACT_AFTER and self._discarded > len(self._queue) / 2:
+			# Partially sent entry is never discarded, so it stays first
+			self._queue = deque([ x for x in self._queue if x[1] is not None ])
+			self._droppable = deque([ x for x in self._droppable if x[1] is not None ])
+			self._discarded = 0
+	
+	
+	def _drop_oldest(self):
+		""" Discards oldest droppable entries until queue fits to MAX_SIZE """
+		while self._droppable and self.size > self.MAX_SIZE:
+			entry = self._droppable.popleft()
+			if not entry[2] or entry[1] is None:
+				# Already sent or discarded
+				continue
+			if self._offset > 0 and entry is self._queue[0]:
+				# Partially sent
+				continue
+			self._discard(entry)
+			self.dropped += 1
+	
+	
+	def send(self):
+		"""
+		Sends as much of queued data as possible without blocking.
+		Returns True if everything was sent, False if socket is not
+		writable and send() has to be called again when it is.
+		Raises socket.error if connection is broken.
+		"""
+		with self._lock:
+			if self.broken:
+				raise socket.error(errno.EPIPE, "Client is not reading")
+			while self._queue:
+				chunk, count, offset = [], 0, self._offset
+				for entry in self._queue:
+					if entry[1] is not None:
+						chunk.append(entry[1][offset:])
+						count += len(entry[1]) - offset
+					offset = 0
+					if count >= SEND_CHUNK:
+						break
+				if count == 0:
+					self._queue.clear()
+					self._droppable.clear()
+					self._discarded = 0
+					self._offset = 0
+					break
+				try:
+					sent = self.connection.send(b"".join(chunk), socket.MSG_DONTWAIT)
+				except socket.error, e:
+					if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+						return False
+					raise
+				self._consume(sent)
+			self._dirty = False
+			return True
+	
+	
+	def _consume(self, sent):
+		""" Removes 'sent' bytes from start of queue. Called with lock held """
+		while sent > 0:
+			self._pop_discarded()
+			entry = self._queue[0]
+			remaining = len(entry[1]) - self._offset
+			if sent < remaining:
+				self._offset += sent
+				self.size -= sent
+				return
+			sent -= remaining
+			self.size -= remaining
+			self._offset = 0
+			self._queue.popleft()
+			entry[2] = False
+			if entry[0] is not None and self._keys.get(entry[0]) is entry:
+				del self._keys[entry[0]]
+		# Skip discarded entries, so partially sent entry is always first
+		self._pop_discarded()
+		while self._droppable and (not self._droppable[0][2] or self._droppable[0][1] is None):
+			self._droppable.popleft()
+	
+	
+	def _pop_discarded(self):
+		""" Removes discarded entries from start of queue """
+		while self._queue and self._queue[0][1] is None:
+			self._queue.popleft()
+			self._discarded -= 1
+	
+	
+	def flush(self):
+		""" Does nothing, data is sent by daemon mainloop """
+		pass
+	
+	
+	def close(self):
+		""" Discards everything queued. Socket itself is not closed """
+		with self._lock:
+			self.closed = True
+			self._queue.clear()
+			self._droppable.clear()
+			self._discarded = 0
+			self._keys = {}
+			self.size = 0
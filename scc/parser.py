@@ -24,6 +24,33 @@ import sys
 class ParseError(Exception): pass
 
 
+class ParsedAction(object):
+	"""
+	Result of parsing action string, kept in ActionParser cache.
+	Stores class and parameters instead of Action instance, so every call
+	to build() creates new instances and (stateful) actions are never shared
+	between places where same string is used.
+	"""
+	__slots__ = ('cls', 'parameters')
+	
+	def __init__(self, cls, parameters):
+		self.cls = cls
+		self.parameters = parameters
+	
+	
+	def build(self):
+		""" Creates Action instance. May throw ParseError """
+		pars = [ p.build() if isinstance(p, ParsedAction) else p
+				for p in self.parameters ]
+		try:
+			return self.cls(*pars)
+		except ValueError, e:
+			raise ParseError(unicode(e))
+		except TypeError, e:
+			print >>sys.stderr, e
+			raise ParseError("Invalid number of parameters for '%s'" % (self.cls.COMMAND))
+
+
 def build_action_constants():
 	""" Generates dicts for ActionParser.CONSTS """
 	rv = {
@@ -60,6 +87,10 @@ class ActionParser(object):
 	Token = namedtuple('Token', 'type value')
 	
 	CONSTS = build_action_constants()
+	# Shared by all instances. Maps action string to ParsedAction and is
+	# simply emptied when it grows over CACHE_SIZE
+	CACHE_SIZE = 2048
+	_cache = {}
 	
 	
 	def __init__(self, string=""):
@@ -101,18 +132,29 @@ class ActionParser(object):
 		Restarts parsing with new string
 		Returns self for chaining.
 		"""
-		
+		self._string = string
+		self.tokens = None
+		self.index = 0
+		return self
+	
+	
+	def _tokenize(self):
 		try:
 			self.tokens = [
 				ActionParser.Token(type, string)
 				for (type, string, trash, trash, trash)
-				in generate_tokens( iter([string]).next )
+				in generate_tokens( iter([self._string]).next )
 				if type != TokenType.ENDMARKER
 			]
 		except TokenError:
-			self.tokens = None
+			raise ParseError("Syntax error")
 		self.index = 0
-		return self
+	
+	
+	@staticmethod
+	def clear_cache():
+		""" Drops all cached parse results """
+		ActionParser._cache.clear()
 	
 	
 	def _next_token(self):
@@ -179,7 +221,7 @@ class ActionParser(object):
 						number = float(self._next_token().value)
 					except ValueError:
 						raise ParseError("Excepted number after '%s'" % (op, ))
-					parameter = RangeOP(parameter, op, number)
+					parameter = ParsedAction(RangeOP, (parameter, op, number))
 			
 			return parameter
 		
@@ -251,13 +293,7 @@ class ActionParser(object):
 	
 	
 	def _create_action(self, cls, *pars):
-		try:
-			return cls(*pars)
-		except ValueError, e:
-			raise ParseError(unicode(e))
-		except TypeError, e:
-			print >>sys.stderr, e
-			raise ParseError("Invalid number of parameters for '%s'" % (cls.COMMAND))
+		return ParsedAction(cls, pars)
 	
 	
 	def _parse_action(self, frm=Action.ALL):
@@ -306,7 +342,7 @@ class ActionParser(object):
 				raise ParseError("Expected action after 'and'")
 			action1 = self._create_action(action_class, *parameters)
 			action2 = self._parse_action()
-			return MultiAction(action1, action2)
+			return ParsedAction(MultiAction, (action1, action2))
 		
 		if t.type == TokenType.NEWLINE or t.value == "\n":
 			# Newline can be used to join actions instead of 'and'
@@ -320,7 +356,7 @@ class ActionParser(object):
 				return self._create_action(action_class, *parameters)
 			action1 = self._create_action(action_class, *parameters)
 			action2 = self._parse_action()
-			return MultiAction(action1, action2)
+			return ParsedAction(MultiAction, (action1, action2))
 		
 		if t.type == TokenType.OP and t.value == ';':
 			# Two (or more) actions joined by ';'
@@ -332,7 +368,7 @@ class ActionParser(object):
 				return self._create_action(action_class, *parameters)
 			action1 = self._create_action(action_class, *parameters)
 			action2 = self._parse_action()
-			return Macro(action1, action2)
+			return ParsedAction(Macro, (action1, action2))
 		
 		return self._create_action(action_class, *parameters)
 	
@@ -342,11 +378,17 @@ class ActionParser(object):
 		Returns parsed action.
 		Throws ParseError if action cannot be parsed.
 		"""
-		if self.tokens == None:
-			raise ParseError("Syntax error")
-		a = self._parse_action()
+		parsed = ActionParser._cache.get(self._string)
+		if parsed is not None:
+			return parsed.build()
+		self._tokenize()
+		parsed = self._parse_action()
 		if self._tokens_left():
 			raise ParseError("Unexpected '%s'" % (self._next_token().value, ))
+		a = parsed.build()
+		if len(ActionParser._cache) >= ActionParser.CACHE_SIZE:
+			ActionParser._cache.clear()
+		ActionParser._cache[self._string] = parsed
 		return a
 
 
@@ -2,57 +2,233 @@
 """
 SC-Controller - Poller
 
-Uses select to pool for file descriptors. Driver classes can use
+Uses epoll to pool for file descriptors. Driver classes can use
 daemon.get_poller().register and .unregister to add file descriptors and
 register callbacks to be called when data is available in them.
 
 Callback is called as callback(fd, event) where event is one of select.POLL*
+
+Poller can also sleep until specific (time.time() based) deadline using
+timerfd, so daemon mainloop can block until either some descriptor is ready
+or next scheduled task is due. If timerfd is not available, epoll timeout
+is used instead.
 """
-import select, logging
+from ctypes.util import find_library
+import os, select, fcntl, ctypes, time, logging
 log = logging.getLogger("Poller")
 
 
 DO_NOTHING = lambda *a: False
 
+# timerfd.h
+CLOCK_REALTIME = 0
+TFD_TIMER_ABSTIME = 1 << 0
+TFD_NONBLOCK = os.O_NONBLOCK
+TFD_CLOEXEC = 0o2000000
+
+
+class _timespec(ctypes.Structure):
+	_fields_ = [
+		('tv_sec', ctypes.c_long),
+		('tv_nsec', ctypes.c_long),
+	]
+
+
+class _itimerspec(ctypes.Structure):
+	_fields_ = [
+		('it_interval', _timespec),
+		('it_value', _timespec),
+	]
+
+
+class TimerFD(object):
+	"""
+	Minimal ctypes wrapper around timerfd_create & co.
+	Timer is armed to absolute CLOCK_REALTIME time, what matches
+	time.time() values used by Scheduler.
+	"""
+	_libc = None
+	
+	def __init__(self):
+		if TimerFD._libc is None:
+			TimerFD._libc = ctypes.CDLL(find_library("c"), use_errno=True)
+		self._lib = TimerFD._libc
+		self._lib.timerfd_settime.argtypes = [ ctypes.c_int, ctypes.c_int,
+			ctypes.POINTER(_itimerspec), ctypes.POINTER(_itimerspec) ]
+		self.fd = self._lib.timerfd_create(CLOCK_REALTIME, TFD_NONBLOCK | TFD_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "timerfd_create failed")
+		self._spec = _itimerspec()
+		self.armed_to = None
+	
+	
+	def arm(self, when):
+		"""
+		Arms timer to fire at 'when' (time.time() based value).
+		Passing None disarms timer.
+		"""
+		if when == self.armed_to:
+			return
+		if when is None:
+			self._spec.it_value.tv_sec, self._spec.it_value.tv_nsec = 0, 0
+		else:
+			sec = int(when)
+			self._spec.it_value.tv_sec = sec
+			# 1ns is added so zero-deadline doesn't disarm timer
+			self._spec.it_value.tv_nsec = int((when - sec) * 1000000000) or 1
+		if self._lib.timerfd_settime(self.fd, TFD_TIMER_ABSTIME,
+				ctypes.byref(self._spec), None) < 0:
+			raise OSError(ctypes.get_errno(), "timerfd_settime failed")
+		self.armed_to = when
+	
+	
+	def clear(self):
+		""" Reads expiration counter so timer is no longer readable """
+		try:
+			os.read(self.fd, 8)
+		except OSError:
+			# EAGAIN, timer has not expired
+			pass
+		self.armed_to = None
+	
+	
+	def close(self):
+		os.close(self.fd)
+
+
 class Poller(object):
 	POLLIN = select.POLLIN
 	POLLOUT = select.POLLOUT
 	POLLPRI = select.POLLPRI
 	
+	# epoll and poll constants are the same on Linux, but this allows
+	# translating them in case they are not.
+	_TO_EPOLL = (
+		(select.POLLIN, select.EPOLLIN),
+		(select.POLLOUT, select.EPOLLOUT),
+		(select.POLLPRI, select.EPOLLPRI),
+	)
+	
 	def __init__(self):
-		self._events = {}
 		self._callbacks = {}
-		self._pool_in = ()
-		self._pool_out = ()
-		self._pool_pri = ()
+		self._epoll = select.epoll()
+		# Pipe used by other threads to interrupt sleeping poll()
+		self._wakeup_r, self._wakeup_w = os.pipe()
+		for fd in (self._wakeup_r, self._wakeup_w):
+			flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+			fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+		self._epoll.register(self._wakeup_r, select.EPOLLIN | select.EPOLLET)
+		self._sleeping = False
+		self._pending = False
+		try:
+			self._timer = TimerFD()
+			self._epoll.register(self._timer.fd, select.EPOLLIN | select.EPOLLET)
+		except Exception, e:
+			log.warning("timerfd not available, using epoll timeout: %s", e)
+			self._timer = None
 	
 	
 	def register(self, fd, events, callback):
 		if fd < 0:
 			raise ValueError("Invalid file descriptor")
-		self._events[fd] = events
+		eevents = 0
+		for p, e in Poller._TO_EPOLL:
+			if events & p:
+				eevents |= e
+		if fd in self._callbacks:
+			self._epoll.modify(fd, eevents)
+		else:
+			try:
+				self._epoll.register(fd, eevents)
+			except IOError:
+				# Descriptor was closed and reused without unregistering
+				self._epoll.modify(fd, eevents)
 		self._callbacks[fd] = callback
-		self._generate_lists()
 	
 	
 	def unregister(self, fd):
-		if fd in self._events: del self._events[fd]
-		if fd in self._callbacks: del self._callbacks[fd]
-		self._generate_lists()
+		if fd in self._callbacks:
+			del self._callbacks[fd]
+			try:
+				self._epoll.unregister(fd)
+			except (IOError, OSError, ValueError):
+				# Descriptor is already closed
+				pass
 	
 	
-	def _generate_lists(self):
-		self._pool_in = [ fd for fd, events in self._events.iteritems() if events & Poller.POLLIN ]
-		self._pool_out = [ fd for fd, events in self._events.iteritems() if events & Poller.POLLOUT ]
-		self._pool_pri = [ fd for fd, events in self._events.iteritems() if events & Poller.POLLPRI ]
+	def wakeup(self):
+		"""
+		Interrupts poll() sleeping on main thread. Safe to call from any
+		thread. If poller is not sleeping at the moment, next poll() returns
+		without waiting.
+		"""
+		self._pending = True
+		if self._sleeping:
+			try:
+				os.write(self._wakeup_w, b"\x00")
+			except OSError:
+				# Pipe full, poller will wake up anyway
+				pass
 	
 	
-	def poll(self, timeout=0.01):
-		inn, out, pri = select.select( self._pool_in, self._pool_out, self._pool_pri, timeout )
+	def poll(self, timeout=0.01, deadline=None):
+		"""
+		Waits until any registered descriptor is ready and calls its callback.
 		
-		for fd in inn:
-			self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLIN)
-		for fd in out:
-			self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLOUT)
-		for fd in pri:
-			self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLPRI)
+		If 'deadline' is set, poll returns no later than at that time.time()
+		based time. Otherwise, 'timeout' in seconds is used. None timeout
+		blocks indefinitely.
+		"""
+		self.dispatch(self.wait(timeout, deadline))
+	
+	
+	def wait(self, timeout=0.01, deadline=None):
+		"""
+		As poll, but only waits and returns list of ready events without
+		calling any callback. Returned list should be passed to dispatch()
+		"""
+		if deadline is not None and self._timer:
+			self._timer.arm(deadline)
+			timeout = -1
+		elif deadline is not None:
+			timeout = max(0, deadline - time.time())
+		elif timeout is None:
+			timeout = -1
+		
+		self._sleeping = True
+		if self._pending:
+			# Woken up before going to sleep
+			self._pending = False
+			timeout = 0
+		try:
+			return self._epoll.poll(timeout)
+		except IOError:
+			# EINTR
+			return ()
+		finally:
+			self._sleeping = False
+	
+	
+	def dispatch(self, events):
+		""" Calls callbacks for events returned by wait() """
+		for fd, event in events:
+			if fd == self._wakeup_r:
+				# Already woken up, no need to skip next wait
+				self._pending = False
+				try:
+					while os.read(self._wakeup_r, 64): pass
+				except OSError:
+					pass
+			elif self._timer and fd == self._timer.fd:
+				self._timer.clear()
+			else:
+				cb = self._callbacks.get(fd, DO_NOTHING)
+				if event & select.EPOLLIN:
+					cb(fd, Poller.POLLIN)
+				if event & select.EPOLLOUT:
+					cb(fd, Poller.POLLOUT)
+				if event & select.EPOLLPRI:
+					cb(fd, Poller.POLLPRI)
+				if event & (select.EPOLLERR | select.EPOLLHUP) and not event & select.EPOLLIN:
+					# Let callback to find out that descriptor is dead
+					cb(fd, Poller.POLLIN)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Profile Cache
+
+Keeps parsed and compressed profiles so switching to profile that was
+already loaded doesn't require parsing it again.
+
+Two levels are used:
+ - on-disk cache, ~/.config/scc/profile-cache/, holding pickled profiles
+   keyed by path, mtime and size of profile file and by DAEMON_VERSION.
+ - in-memory LRU of recently used profiles, holding pickled data and
+   one pristine, never used Profile instance for each.
+
+As actions are stateful, Profile instance is never given out twice.
+ProfileCache.load removes returned instance from cache and preload()
+(called by ProfilePreloader once profile switch is done) unpickles new one.
+"""
+from __future__ import unicode_literals
+
+from scc.constants import DAEMON_VERSION
+from scc.paths import get_config_path
+from scc.parser import TalkingActionParser
+from scc.profile import Profile
+from collections import OrderedDict
+from hashlib import sha1
+import os, types, copy_reg, cPickle, threading, logging
+log = logging.getLogger("ProfileCache")
+
+CACHE_SIZE = 8			# Number of profiles kept in memory
+PICKLE_PROTOCOL = 2
+
+
+def _reduce_method(m):
+	# Few actions store bound methods, what pickle doesn't handle by default
+	return getattr, (m.im_self, m.im_func.__name__)
+
+copy_reg.pickle(types.MethodType, _reduce_method)
+
+
+class CacheEntry(object):
+	__slots__ = ('key', 'data', 'profile')
+	
+	def __init__(self, key, data):
+		self.key = key			# (DAEMON_VERSION, path, mtime, size)
+		self.data = data		# pickled profile
+		self.profile = None		# unused Profile instance, if available
+
+
+class ProfileCache(object):
+	
+	def __init__(self, size=CACHE_SIZE, directory=None):
+		self.size = size
+		self.directory = directory or os.path.join(get_config_path(), "profile-cache")
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+	
+	
+	@staticmethod
+	def _key(filename):
+		st = os.stat(filename)
+		return DAEMON_VERSION, os.path.abspath(filename), st.st_mtime, st.st_size
+	
+	
+	def _cache_filename(self, key):
+		path = key[1].encode("utf-8") if type(key[1]) == unicode else key[1]
+		return os.path.join(self.directory, "%s.pickle" % (sha1(path).hexdigest(),))
+	
+	
+	def _read(self, key):
+		""" Returns pickled data from on-disk cache or None """
+		try:
+			with open(self._cache_filename(key), "rb") as f:
+				if cPickle.load(f) == key:
+					return f.read()
+		except Exception:
+			# Not cached or unreadable
+			pass
+		return None
+	
+	
+	def _write(self, key, data):
+		""" Stores pickled data in on-disk cache. Failing to do so is not fatal """
+		filename = self._cache_filename(key)
+		try:
+			if not os.path.exists(self.directory):
+				os.makedirs(self.directory)
+			tmp = "%s.%s.tmp" % (filename, os.getpid())
+			with open(tmp, "wb") as f:
+				cPickle.dump(key, f, PICKLE_PROTOCOL)
+				f.write(data)
+			os.rename(tmp, filename)
+		except Exception, e:
+			log.warning("Failed to write profile cache: %s", e)
+	
+	
+	@staticmethod
+	def _unpickle(data, parser):
+		profile = cPickle.loads(data)
+		profile.parser = parser
+		return profile
+	
+	
+	def _parse(self, filename, parser):
+		""" Loads profile from file and returns (profile, pickled data) """
+		profile = Profile(parser).load(filename)
+		profile.compress()
+		profile.parser = None
+		try:
+			data = cPickle.dumps(profile, PICKLE_PROTOCOL)
+		except Exception, e:
+			# Some action is not picklable. Profile is still usable.
+			log.warning("Cannot cache profile '%s': %s", filename, e)
+			data = None
+		finally:
+			profile.parser = parser
+		return profile, data
+	
+	
+	def _store(self, key, data):
+		""" Has to be called with self._lock held """
+		entry = self._entries[key[1]] = CacheEntry(key, data)
+		while len(self._entries) > self.size:
+			self._entries.popitem(last=False)
+		return entry
+	
+	
+	def _get_data(self, filename, key, parser):
+		"""
+		Returns (profile, data) for profile that is not in memory cache,
+		reading it from on-disk cache or parsing it. 'data' may be None
+		if profile cannot be pickled.
+		"""
+		data = self._read(key)
+		if data is not None:
+			try:
+				return ProfileCache._unpickle(data, parser), data
+			except Exception, e:
+				log.warning("Failed to load cached profile '%s': %s", filename, e)
+		profile, data = self._parse(filename, parser)
+		if data is not None:
+			self._write(key, data)
+		return profile, data
+	
+	
+	def load(self, filename, parser):
+		"""
+		Returns loaded and compressed profile, from cache if possible.
+		Returned instance is not kept in cache and so it can be freely used.
+		
+		Raises same exceptions as Profile.load would.
+		"""
+		key = ProfileCache._key(filename)
+		with self._lock:
+			entry = self._entries.pop(key[1], None)
+			if entry is not None and entry.key == key:
+				# Move to end of LRU
+				self._entries[key[1]] = entry
+				if entry.profile is not None:
+					profile, entry.profile = entry.profile, None
+					profile.parser = parser
+					return profile
+				data = entry.data
+			else:
+				data = None
+		if data is not None:
+			return ProfileCache._unpickle(data, parser)
+		
+		profile, data = self._get_data(filename, key, parser)
+		if data is not None:
+			with self._lock:
+				self._store(key, data)
+		return profile
+	
+	
+	def preload(self, filename):
+		"""
+		Loads profile into memory cache and prepares unused Profile
+		instance for it, so next load() is just lookup. Does nothing if
+		such instance is already prepared.
+		
+		Thread-safe, meant to be called from background thread.
+		Raises same exceptions as Profile.load would.
+		"""
+		key = ProfileCache._key(filename)
+		with self._lock:
+			entry = self._entries.get(key[1])
+			if entry is not None and entry.key == key:
+				if entry.profile is not None:
+					return
+				data = entry.data
+			else:
+				data = None
+		if data is None:
+			profile, data = self._get_data(filename, key, TalkingActionParser())
+			if data is None:
+				# Cannot be cached
+				return
+		else:
+			profile = ProfileCache._unpickle(data, None)
+		with self._lock:
+			entry = self._entries.get(key[1])
+			if entry is None or entry.key != key:
+				entry = self._store(key, data)
+			if entry.profile is None:
+				entry.profile = profile
+	
+	
+	def warm(self, filename):
+		"""
+		As preload, but does nothing for profile that is not
+		in memory cache.
+		"""
+		if self.contains(filename):
+			try:
+				self.preload(filename)
+			except Exception, e:
+				log.warning("Failed to load cached profile '%s': %s", filename, e)
+	
+	
+	def contains(self, filename):
+		""" Returns True if profile is in memory cache """
+		return os.path.abspath(filename) in self._entries
+	
+	
+	def invalidate(self, filename):
+		""" Removes profile from memory cache """
+		with self._lock:
+			self._entries.pop(os.path.abspath(filename), None)
+	
+	
+	def clear(self):
+		""" Drops in-memory cache. On-disk cache is kept """
+		with self._lock:
+			self._entries = OrderedDict()
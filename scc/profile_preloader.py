@@ -0,0 +1,173 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Profile Preloader
+
+Loads profiles that are likely to be switched to into ProfileCache,
+on background thread, so switching to them doesn't block anything.
+
+Preloaded are profiles used by autoswitcher conditions, recently used
+profiles and profile that was just switched away from. Directory with
+user profiles is watched using inotify and changed profiles are loaded
+again as soon as they are saved.
+"""
+from __future__ import unicode_literals
+
+from scc.special_actions import ChangeProfileAction
+from scc.tools import find_profile
+from ctypes.util import find_library
+from Queue import Queue
+import os, struct, ctypes, threading, logging
+log = logging.getLogger("Preloader")
+
+# inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+EVENT_BUFFER = 4096
+
+
+class Inotify(object):
+	"""
+	Minimal ctypes wrapper around inotify_init1 & co.
+	Watches single directory for files being written, moved or deleted.
+	"""
+	_libc = None
+	
+	def __init__(self, path):
+		if Inotify._libc is None:
+			Inotify._libc = ctypes.CDLL(find_library("c"), use_errno=True)
+		self.path = path
+		self.fd = Inotify._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		bpath = path.encode("utf-8") if type(path) == unicode else path
+		if Inotify._libc.inotify_add_watch(self.fd, bpath,
+				IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE) < 0:
+			errno = ctypes.get_errno()
+			os.close(self.fd)
+			raise OSError(errno, "inotify_add_watch failed")
+	
+	
+	def read(self):
+		""" Returns list of full paths of changed files """
+		rv = []
+		try:
+			data = os.read(self.fd, EVENT_BUFFER)
+		except OSError:
+			# EAGAIN
+			return rv
+		offset = 0
+		while offset + EVENT_HEADER.size <= len(data):
+			wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+			offset += EVENT_HEADER.size
+			name = data[offset:offset + length].rstrip(b"\x00")
+			offset += length
+			if name:
+				rv.append(os.path.join(self.path, name.decode("utf-8", "replace")))
+		return rv
+	
+	
+	def close(self):
+		os.close(self.fd)
+
+
+def find_switch_profiles(action):
+	""" Yields names of all profiles that action can switch to """
+	if isinstance(action, ChangeProfileAction):
+		yield action.profile
+	for child in action.get_child_actions():
+		for x in find_switch_profiles(child):
+			yield x
+
+
+def collect_profiles(config):
+	"""
+	Returns list of filenames of profiles used by autoswitcher
+	and recently used profiles. Profiles that cannot be found are skipped.
+	"""
+	from scc.x11.autoswitcher import AutoSwitcher
+	names = list(config["recent_profiles"])
+	for action in AutoSwitcher.parse_conditions(config).values():
+		names += list(find_switch_profiles(action))
+	rv = []
+	for name in names:
+		path = find_profile(name)
+		if path and path not in rv:
+			rv.append(path)
+	return rv
+
+
+class ProfilePreloader(object):
+	"""
+	Loads profiles into ProfileCache on background thread.
+	Thread is started by first call to add() or set_profiles().
+	"""
+	
+	def __init__(self, cache):
+		self.cache = cache
+		self.profiles = set()
+		self.inotify = None
+		self._queue = Queue()
+		self._thread = None
+		self._base_size = cache.size
+	
+	
+	def set_profiles(self, filenames):
+		"""
+		Sets list of profiles that should be always kept ready
+		and starts loading them.
+		"""
+		self.profiles = set([ os.path.abspath(x) for x in filenames ])
+		# Make sure preloaded profiles are not pushed out from cache by each other
+		self.cache.size = self._base_size + len(self.profiles)
+		for filename in filenames:
+			self.add(filename)
+	
+	
+	def add(self, filename):
+		""" Queues profile to be preloaded """
+		if self._thread is None:
+			self._thread = threading.Thread(target=self._run, name="Preloader")
+			self._thread.daemon = True
+			self._thread.start()
+		self._queue.put(filename)
+	
+	
+	def watch(self, path, poller):
+		"""
+		Starts watching directory for changed profiles, using inotify
+		descriptor registered with poller. Returns False if that's not possible.
+		"""
+		try:
+			self.inotify = Inotify(path)
+		except Exception, e:
+			log.warning("Cannot watch '%s' for changes: %s", path, e)
+			return False
+		poller.register(self.inotify.fd, poller.POLLIN, self._on_inotify)
+		return True
+	
+	
+	def _on_inotify(self, *a):
+		for filename in self.inotify.read():
+			if not filename.endswith(".sccprofile"):
+				continue
+			if os.path.abspath(filename) in self.profiles or self.cache.contains(filename):
+				log.debug("Profile '%s' changed", filename)
+				self.cache.invalidate(filename)
+				if os.path.exists(filename):
+					self.add(filename)
+	
+	
+	def _run(self):
+		while True:
+			filename = self._queue.get()
+			try:
+				self.cache.preload(filename)
+			except Exception, e:
+				log.warning("Failed to preload profile '%s': %s", filename, e)
+			finally:
+				self._queue.task_done()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Input Recorder
+
+Records ControllerInput frames fed to Mapper.input() into compact binary file
+and replays them back through Mapper using virtual clock, so results are
+reproducible and don't depend on speed of machine running the replay.
+
+File format:
+	header:	MAGIC, version (uint8), controller flags (uint32)
+	frame:	time since start of recording (double), frame flags (uint8),
+			buttons (uint32), then rest of RECORDED_FIELDS as int32
+All values are little-endian.
+"""
+from scc.uinput import Gamepad, Mouse, Keyboard
+from scc.controller import Controller
+from scc.tools import nameof, wrap_method, unwrap_method
+from collections import namedtuple
+import struct, time, logging
+log = logging.getLogger("Recorder")
+
+MAGIC = b"SCCREC"
+VERSION = 1
+
+RECORDED_FIELDS = ( 'buttons', 'ltrig', 'rtrig', 'stick_x', 'stick_y',
+	'lpad_x', 'lpad_y', 'rpad_x', 'rpad_y', 'cpad_x', 'cpad_y',
+	'dpad_x', 'dpad_y', 'rstick_x', 'rstick_y',
+	'gpitch', 'groll', 'gyaw', 'q1', 'q2', 'q3', 'q4' )
+RecordedInput = namedtuple('RecordedInput', RECORDED_FIELDS)
+NULL_INPUT = RecordedInput(*[ 0 ] * len(RECORDED_FIELDS))
+
+HEADER = struct.Struct("<%ssBI" % (len(MAGIC),))
+FRAME = struct.Struct("<dBI" + "i" * (len(RECORDED_FIELDS) - 1))
+FF_GYRO = 1 << 0		# Frame flag set when gyro was enabled on controller
+
+
+class InputRecorder(object):
+	"""
+	Writes frames to file. Use attach(mapper) to start recording everything
+	that mapper receives and close() to stop.
+	"""
+	
+	def __init__(self, filename):
+		self._file = open(filename, "wb")
+		self._start = None
+		self._mapper = None
+		self._wrapper = None
+	
+	
+	def attach(self, mapper):
+		"""
+		Starts recording by wrapping mapper.input. Mapper is not slowed down
+		in any way while recorder is not attached.
+		"""
+		def make_wrapper(original):
+			def input(controller, old_state, state):
+				self.frame(controller, state)
+				return original(controller, old_state, state)
+			return input
+		
+		self._mapper = mapper
+		self._wrapper = wrap_method(mapper, "input", make_wrapper)
+	
+	
+	def detach(self):
+		"""
+		Stops recording, removing wrapper from mapper.input. Anything else
+		that wrapped mapper.input in meantime is kept.
+		"""
+		if self._mapper is not None:
+			unwrap_method(self._mapper, "input", self._wrapper)
+			self._mapper, self._wrapper = None, None
+	
+	
+	def frame(self, controller, state):
+		""" Writes single frame """
+		if self._file is None:
+			return
+		t = time.time()
+		if self._start is None:
+			self._start = t
+			flags = controller.flags if controller else 0
+			self._file.write(HEADER.pack(MAGIC, VERSION, flags))
+		fflags = FF_GYRO if controller and controller.get_gyro_enabled() else 0
+		self._file.write(FRAME.pack(t - self._start, fflags,
+			*[ int(getattr(state, x, 0)) for x in RECORDED_FIELDS ]))
+	
+	
+	def close(self):
+		self.detach()
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+
+def load_recording(filename):
+	"""
+	Loads recording from file.
+	Returns (flags, frames) where frames is list of (time, frame_flags, state)
+	tuples and state is RecordedInput.
+	
+	Raises ValueError if file is not valid recording.
+	"""
+	data = open(filename, "rb").read()
+	if len(data) < HEADER.size:
+		# Nothing was recorded
+		return 0, []
+	magic, version, flags = HEADER.unpack_from(data, 0)
+	if magic != MAGIC:
+		raise ValueError("Not a recording: %s" % (filename,))
+	if version != VERSION:
+		raise ValueError("Unsupported recording version: %s" % (version,))
+	frames = []
+	for offset in xrange(HEADER.size, len(data) - FRAME.size + 1, FRAME.size):
+		values = FRAME.unpack_from(data, offset)
+		frames.append(( values[0], values[1], RecordedInput(*values[2:]) ))
+	return flags, frames
+
+
+class VirtualClock(object):
+	"""
+	Replaces time.time while replaying, as both Scheduler and modifiers
+	read time directly from there. Clock starts at current (real) time
+	if 'now' is not set.
+	"""
+	
+	def __init__(self, now=None):
+		self.now = time.time() if now is None else now
+		self._original = None
+	
+	
+	def time(self):
+		return self.now
+	
+	
+	def __enter__(self):
+		self._original, time.time = time.time, self.time
+		return self
+	
+	
+	def __exit__(self, *a):
+		time.time = self._original
+
+
+class ReplayController(Controller):
+	""" Controller that exists only to carry flags and gyro state """
+	
+	def __init__(self, flags):
+		Controller.__init__(self)
+		self.flags = flags
+		self.gyro_enabled = False
+	
+	
+	def get_type(self):
+		return "replay"
+	
+	
+	def get_gyro_enabled(self):
+		return self.gyro_enabled
+
+
+class ReplayDevice(object):
+	"""
+	Mixin that replaces writing to uinput with appending
+	(device name, event type, code, value) tuples to 'events' list.
+	"""
+	
+	def __init__(self, name, events):
+		self.name = name
+		self.events = events
+	
+	
+	def keyEvent(self, key, val):
+		self.events.append(( self.name, "EV_KEY", nameof(key), val ))
+	
+	
+	def axisEvent(self, axis, val):
+		self.events.append(( self.name, "EV_ABS", nameof(axis), val ))
+	
+	
+	def relEvent(self, rel, val):
+		self.events.append(( self.name, "EV_REL", nameof(rel), val ))
+	
+	
+	def scanEvent(self, val):
+		self.events.append(( self.name, "EV_MSC", "MSC_SCAN", val ))
+	
+	
+	def synEvent(self):
+		self.events.append(( self.name, "EV_SYN", "SYN_REPORT", 0 ))
+	
+	
+	def __del__(self): pass
+	def flush(self): pass
+	def setDelayPeriod(self, *a): pass
+	def keyManaged(self, ev): return True
+	def axisManaged(self, ev): return True
+	def relManaged(self, ev): return True
+
+
+class ReplayGamepad(ReplayDevice, Gamepad):
+	pass
+
+
+class ReplayMouse(ReplayDevice, Mouse):
+	def __init__(self, name, events):
+		ReplayDevice.__init__(self, name, events)
+		self.updateParams()
+		self.updateScrollParams()
+		self.reset()
+
+
+class ReplayKeyboard(ReplayDevice, Keyboard):
+	def __init__(self, name, events):
+		ReplayDevice.__init__(self, name, events)
+		self._pressed = set()
+
+
+def replay(mapper, clock, events, flags, frames, tail=1.0):
+	"""
+	Drives mapper with recorded frames. Has to be called with VirtualClock
+	installed and mapper should have ReplayDevices appending to 'events'
+	list instead of real virtual devices.
+	
+	Tasks scheduled by actions are executed at exact time they were
+	scheduled for, in between frames. After last frame, scheduler keeps
+	running for another 'tail' seconds.
+	
+	Returns list of (time, device name, event type, code, value) tuples.
+	"""
+	controller = ReplayController(flags)
+	mapper.set_controller(controller)
+	controller.set_mapper(mapper)
+	scheduler = mapper.scheduler
+	start = clock.now
+	rv = []
+	
+	def collect(t):
+		for e in events:
+			rv.append((t - start,) + e)
+		del events[:]
+	
+	def run_until(t):
+		deadline = scheduler.next_deadline()
+		while deadline is not None and deadline <= t:
+			clock.now = deadline
+			scheduler.run()
+			mapper.generate_events()
+			collect(deadline)
+			deadline = scheduler.next_deadline()
+		clock.now = t
+	
+	scheduler.update_time()
+	old_state = NULL_INPUT
+	for t, fflags, state in frames:
+		t += start
+		run_until(t)
+		controller.gyro_enabled = bool(fflags & FF_GYRO)
+		mapper.input(controller, old_state, state)
+		collect(t)
+		old_state = state
+	run_until(start + (frames[-1][0] if frames else 0) + tail)
+	return rv
+
+
+def replay_file(profile_filename, filename, tail=1.0):
+	"""
+	Loads profile and recording and replays it.
+	Everything, including loading profile, happens with virtual clock
+	running from zero, so output is same every time.
+	
+	Returns same list as replay() does.
+	"""
+	from scc.parser import TalkingActionParser
+	from scc.scheduler import Scheduler
+	from scc.profile import Profile
+	from scc.mapper import Mapper
+	flags, frames = load_recording(filename)
+	events = []
+	with VirtualClock(0.0) as clock:
+		profile = Profile(TalkingActionParser()).load(profile_filename)
+		profile.compress()
+		mapper = Mapper(profile, Scheduler(), keyboard=None, mouse=None, gamepad=False)
+		mapper.keyboard = ReplayKeyboard("keyboard", events)
+		mapper.mouse = ReplayMouse("mouse", events)
+		mapper.gamepad = ReplayGamepad("gamepad", events)
+		return replay(mapper, clock, events, flags, frames, tail)
@@ -13,12 +13,19 @@ from scc.tools import find_profile, find_menu, nameof, shsplit, shjoin
 from scc.uinput import CannotCreateUInputException
 from scc.tools import set_logging_level, find_binary, clamp
 from scc.device_monitor import create_device_monitor
+from scc.paths import get_profiles_path
 from scc.cemuhook_server import CemuhookServer
 from scc.custom import load_custom_module
 from scc.gestures import GestureDetector
+from scc.recorder import InputRecorder
+from scc.stats import LatencyStats, ActionProfiler
 from scc.parser import TalkingActionParser
+from scc.profile_preloader import ProfilePreloader, collect_profiles
+from scc.profile_cache import ProfileCache
 from scc.controller import HapticData
 from scc.scheduler import Scheduler
+from scc.framing import FramedWriter, FrameReader, FT_MESSAGE
+from scc.output_queue import OutputQueue
 from scc.menu_data import MenuData
 from scc.profile import Profile
 from scc.actions import Action
@@ -27,16 +34,19 @@ from scc.poller import Poller
 from scc.mapper import Mapper
 from scc import drivers
 
-from SocketServer import UnixStreamServer, ThreadingMixIn, StreamRequestHandler
-import os, sys, pkgutil, signal, time, json, logging
-import threading, traceback, subprocess, shlex
+import os, re, sys, pkgutil, signal, time, json, logging
+import threading, traceback, subprocess, shlex, socket, errno
 log = logging.getLogger("SCCDaemon")
-tlog = logging.getLogger("Socket Thread")
 
-class ThreadingUnixStreamServer(ThreadingMixIn, UnixStreamServer): daemon_threads = True
+COMMAND_RE = re.compile(r"^[A-Za-z]+[.:]")
+RATE_RE = re.compile(r"^@([0-9]+(?:\.[0-9]+)?)Hz$", re.IGNORECASE)
+LISTEN_BACKLOG = 16
+RECV_SIZE = 64 * 1024
 
 
 class SCCDaemon(Daemon):
+	# Longest time mainloop sleeps when there is nothing to do
+	MAX_SLEEP = 1.0
 	
 	def __init__(self, piddile, socket_file):
 		set_logging_level(True, True)
@@ -48,27 +58,64 @@ class SCCDaemon(Daemon):
 		self.poller = Poller()
 		self.dev_monitor = create_device_monitor(self)
 		self.scheduler = Scheduler()
+		self.scheduler.set_wakeup_callback(self.poller.wakeup)
 		self.xdisplay = None
-		self.sserver = None			# UnixStreamServer instance
+		self.ssocket = None			# Listening control socket
 		self.errors = []
 		self.alone = False			# Set by launching script from --alone flag
 		self.custom_py_loaded = False
 		self.osd_daemon = None
 		self.default_profile = None
+		self.profile_cache = ProfileCache()
+		self.preloader = ProfilePreloader(self.profile_cache)
 		self.autoswitch_daemon = None
 		# TODO: Use osd_ids for all menus
 		self.osd_ids = {}
 		self.controllers = []
-		self.mainloops = [ self.poller.poll, self.scheduler.run ]
+		self.mainloops = [ self._poll, self.scheduler.run, self._send_queued ]
+		self._dirty_outputs = set()	# OutputQueues with data to send
+		self._dirty_lock = threading.Lock()
+		self._waiting_outputs = set()	# OutputQueues waiting for POLLOUT
+		self._client_fds = {}		# Maps client socket fd to Client
 		self.rescan_cbs = [ ]
 		self.on_exit_cbs = []
 		self.subprocs = []
-		self.lock = threading.Lock()
 		self.cemuhook = None
+		self.stats = None			# LatencyStats, if enabled
+		self.profiler = None		# ActionProfiler, if enabled
 		self.default_mapper = None
 		self.free_mappers = [ ]
 		self.clients = set()
 		self.cwd = os.getcwd()
+		# Maps message type (everything up to first ':' or '.') to handler
+		self._handlers = {
+			"Binary."			: self._handle_binary,
+			"Profile:"			: self._handle_profile,
+			"OSD:"				: self._handle_osd,
+			"Feedback:"			: self._handle_feedback,
+			"Controller."		: self._handle_controller_reset,
+			"Controller:"		: self._handle_controller,
+			"State."			: self._handle_state,
+			"Led:"				: self._handle_led,
+			"Observe:"			: self._handle_observe,
+			"Record:"			: self._handle_record,
+			"Record."			: self._handle_record_stop,
+			"Stats:"			: self._handle_stats,
+			"Stats."			: self._handle_stats_report,
+			"Profiling:"		: self._handle_profiling,
+			"Profiling."		: self._handle_profiling_report,
+			"Replace:"			: self._handle_replace,
+			"Lock:"				: self._handle_lock,
+			"Unlock."			: self._handle_unlock,
+			"Reconfigure."		: self._handle_reconfigure,
+			"Rescan."			: self._handle_rescan,
+			"Turnoff."			: self._handle_turnoff,
+			"Gesture:"			: self._handle_gesture,
+			"Restart."			: self._handle_restart,
+			"Gestured:"			: self._handle_gestured,
+			"Selected:"			: self._handle_selected,
+			"Register:"			: self._handle_register,
+		}
 	
 	
 	def init_drivers(self):
@@ -146,9 +193,27 @@ class SCCDaemon(Daemon):
 		return self.scheduler
 	
 	
+	def _poll(self):
+		"""
+		Sleeps until any registered descriptor is ready, next scheduled task
+		is due or MAX_SLEEP is elapsed, whichever comes first.
+		"""
+		deadline = self.scheduler.next_deadline()
+		limit = time.time() + SCCDaemon.MAX_SLEEP
+		if deadline is None or deadline > limit:
+			deadline = limit
+		events = self.poller.wait(deadline=deadline)
+		# Tasks scheduled by callbacks should count from when they are called
+		self.scheduler.update_time()
+		self.poller.dispatch(events)
+	
+	
 	def add_mainloop(self, fn):
 		"""
 		Adds function that is called in every mainloop iteration.
+		Mainloop iterates every time when any descriptor registered in poller
+		is ready or when scheduled task is due, but at least once per
+		MAX_SLEEP seconds.
 		Can be called only durring initialization, in driver 'init' method.
 		"""
 		if fn not in self.mainloops:
@@ -181,9 +246,9 @@ class SCCDaemon(Daemon):
 	
 	
 	def _set_profile(self, mapper, filename):
-		# Called from socket server thread
-		p = Profile(TalkingActionParser())
-		p.load(filename).compress()
+		# Called from mainloop, while handling control socket message
+		p = self.profile_cache.load(filename, TalkingActionParser())
+		previous = mapper.profile.filename
 		self.profile_file = filename
 		
 		if mapper.profile.gyro and not p.gyro:
@@ -203,6 +268,8 @@ class SCCDaemon(Daemon):
 		# Reset mouse (issue #222)
 		mapper.mouse.reset()
 		
+		if self.profiler:
+			self.profiler.attach(mapper, p)
 		# This last line kinda depends on GIL...
 		mapper.profile = p
 		# Re-apply all locks
@@ -212,12 +279,57 @@ class SCCDaemon(Daemon):
 			self.send_profile_info(mapper.get_controller(), self._send_to_all)
 		else:
 			self.send_profile_info(None, self._send_to_all, mapper=mapper)
+		# Prepares fresh copies for when any of these is loaded again
+		self.preloader.add(filename)
+		if previous and previous != filename:
+			self.preloader.add(previous)
+	
+	
+	def _on_output_dirty(self, output):
+		""" Called by OutputQueue, from any thread, when it has data to send """
+		with self._dirty_lock:
+			self._dirty_outputs.add(output)
+		self.poller.wakeup()
+	
+	
+	def _send_queued(self):
+		"""
+		Sends data queued for clients. Clients that cannot take everything
+		are sent rest when their socket becomes writable.
+		"""
+		if not self._dirty_outputs:
+			return
+		with self._dirty_lock:
+			dirty, self._dirty_outputs = self._dirty_outputs, set()
+		for output in dirty:
+			if output.closed:
+				continue
+			try:
+				done = output.send()
+			except Exception, e:
+				# Client is dead or doesn't read anything
+				log.debug("Disconnecting client: %s", e)
+				client = self._client_fds.get(output.fd)
+				if client:
+					self._disconnect_client(client)
+				else:
+					output.close()
+				continue
+			# Socket is polled for POLLOUT only while there is something
+			# that couldn't be sent
+			if done and output in self._waiting_outputs:
+				self._waiting_outputs.remove(output)
+				self.poller.register(output.fd, self.poller.POLLIN, self._on_client_event)
+			elif not done and output not in self._waiting_outputs:
+				self._waiting_outputs.add(output)
+				self.poller.register(output.fd, self.poller.POLLIN | self.poller.POLLOUT,
+					self._on_client_event)
 	
 	
 	def _send_to_all(self, message_str):
 		"""
 		Sends message to all connect clients.
-		Should be called while lock is acquired.
+		Should be called from main thread.
 		Message should be utf-8 encoded str.
 		"""
 		for client in self.clients:
@@ -234,9 +346,8 @@ class SCCDaemon(Daemon):
 	
 	def on_sa_restart(self, *a):
 		""" Called when 'restart' action is used """
-		with self.lock:
-			for c in self.clients:
-				c.close()
+		for c in self.clients:
+			c.close()
 		os.system("%s %s None restart &" % ( sys.executable, sys.argv[0] ))
 	
 	
@@ -255,24 +366,23 @@ class SCCDaemon(Daemon):
 		""" Called when 'gestures' action is used """
 		# TODO: Take up_direction from action
 		gd = None
-		with self.lock:
-			if action.osd_enabled and self.osd_daemon:
-				# When OSD is enabled, gesture detection is handled
-				# by scc-osd-daemon.
-				self.osd_daemon.gesture_action = action
-				self._osd('gesture',
-					"--controller", mapper.get_controller().get_id(),
-				 	'--control-with', what)
-				log.debug("Gesture detection request sent to scc-osd-daemon")
-			else:
-				# Otherwise it is handled internally
-				up_direction = 0
-				gd = self._start_gesture(
-					mapper,
-					what,
-					up_direction,
-					lambda gesture_string : action.gesture(mapper, gesture_string)
-				)
+		if action.osd_enabled and self.osd_daemon:
+			# When OSD is enabled, gesture detection is handled
+			# by scc-osd-daemon.
+			self.osd_daemon.gesture_action = action
+			self._osd('gesture',
+				"--controller", mapper.get_controller().get_id(),
+			 	'--control-with', what)
+			log.debug("Gesture detection request sent to scc-osd-daemon")
+		else:
+			# Otherwise it is handled internally
+			up_direction = 0
+			gd = self._start_gesture(
+				mapper,
+				what,
+				up_direction,
+				lambda gesture_string : action.gesture(mapper, gesture_string)
+			)
 		if gd:
 			gd.enable()
 			log.debug("Gesture detection started on %s", what)
@@ -290,7 +400,7 @@ class SCCDaemon(Daemon):
 	
 	def _osd(self, *data):
 		"""
-		Has to be called with self.lock held.
+		Has to be called from main thread.
 		Returns True on success.
 		"""
 		# Pre-format data
@@ -303,7 +413,6 @@ class SCCDaemon(Daemon):
 		# Send request
 		try:
 			self.osd_daemon.wfile.write(data)
-			self.osd_daemon.wfile.flush()
 		except Exception, e:
 			log.error("Failed to display OSD: %s", e)
 			self.osd_daemon = None
@@ -313,31 +422,26 @@ class SCCDaemon(Daemon):
 	
 	def on_sa_osd(self, mapper, action):
 		""" Called when 'osd' action is used """
-		with self.lock:
-			self._osd('message', '-t', action.timeout, '-s', action.size, action.text)
+		self._osd('message', '-t', action.timeout, '-s', action.size, action.text)
 	
 	
 	def on_sa_clearosd(self, mapper, action):
 		""" Called when 'clearosd' action is used """
-		with self.lock:
-			self._osd('clear')
+		self._osd('clear')
 	
 	
 	def on_sa_area(self, mapper, action, x1, y1, x2, y2):
 		""" Called when *AreaAction has OSD enabled """
-		with self.lock:
-			self._osd('area', '-x', x1, '-y', y1, '--width', x2-x1, '--height', y2-y1)
+		self._osd('area', '-x', x1, '-y', y1, '--width', x2-x1, '--height', y2-y1)
 	
 	
 	def on_sa_clear_osd(self, *a):
-		with self.lock:
-			self._osd('clear')
+		self._osd('clear')
 	
 	
 	def on_sa_keyboard(self, mapper, action):
 		""" Called when 'keyboard' action is used """
-		with self.lock:
-			self._osd('keyboard')
+		self._osd('keyboard')
 	
 	
 	def on_sa_menu(self, mapper, action, *pars):
@@ -355,8 +459,7 @@ class SCCDaemon(Daemon):
 			p += [ "--from-profile", mapper.profile.get_filename(), action.menu_id ]
 		p += list(pars)
 		
-		with self.lock:
-			self._osd(*p)
+		self._osd(*p)
 	
 	on_sa_gridmenu = on_sa_menu
 	
@@ -373,8 +476,7 @@ class SCCDaemon(Daemon):
 			else:
 				data.append(x)
 		
-		with self.lock:
-			self._osd("dialog", *data)
+		self._osd("dialog", *data)
 	
 	
 	def on_sa_profile(self, mapper, action):
@@ -386,12 +488,11 @@ class SCCDaemon(Daemon):
 			return
 		path = find_profile(name)
 		if path:
-			with self.lock:
-				try:
-					self._set_profile(mapper, path)
-					log.info("Loaded profile '%s'", name)
-				except Exception, e:
-					log.exception(e)
+			try:
+				self._set_profile(mapper, path)
+				log.info("Loaded profile '%s'", name)
+			except Exception, e:
+				log.exception(e)
 			return
 		log.error("Cannot load profile: Profile '%s' not found", name)
 	
@@ -412,7 +513,7 @@ class SCCDaemon(Daemon):
 		for fn in self.on_exit_cbs:
 			fn(self)
 		for d in (self.osd_daemon, self.autoswitch_daemon):
-			if d: d.wfile.close()
+			if d: d.close()
 		self.osd_daemon, self.autoswitch_daemon = None, None
 		for p in self.subprocs:
 			p.kill()
@@ -496,12 +597,38 @@ class SCCDaemon(Daemon):
 				# Broken config is not reason to fail here
 				pass
 		try:
-			mapper.profile.load(self.default_profile).compress()
+			mapper.profile = self.profile_cache.load(self.default_profile,
+					TalkingActionParser())
 		except Exception, e:
 			log.warning("Failed to load profile. Starting with no mappings.")
 			log.warning("Reason: %s", e)
 	
 	
+	def start_preloading(self):
+		""" Starts preloading profiles and watching for their changes """
+		try:
+			self.preloader.set_profiles(collect_profiles(Config()))
+		except Exception, e:
+			# Broken config is not reason to fail here
+			log.warning("Failed to preload profiles: %s", e)
+		if os.path.exists(get_profiles_path()):
+			self.preloader.watch(get_profiles_path(), self.poller)
+	
+	
+	def _enable_stats(self):
+		"""
+		Starts measuring latency on all mappers.
+		Should be called from main thread.
+		"""
+		if self.stats is None:
+			self.stats = LatencyStats()
+			self.stats.attach_poller(self.poller)
+			for c in self.controllers:
+				if c.get_mapper():
+					self.stats.attach(c.get_mapper())
+			log.info("Latency measuring enabled")
+	
+	
 	def add_controller(self, c):
 		if len(self.free_mappers) > 0:
 			# Reuse already created mapper, so SCC will not spam system
@@ -524,9 +651,12 @@ class SCCDaemon(Daemon):
 		c.apply_config(Config().get_controller_config(c.get_id()))
 		self.controllers.append(c)
 		log.debug("Controller added: %s", c)
-		with self.lock:
-			self.send_controller_list(self._send_to_all)
-			self.send_all_profiles(self._send_to_all)
+		if self.stats:
+			self.stats.attach(mapper)
+		if self.profiler:
+			self.profiler.attach(mapper)
+		self.send_controller_list(self._send_to_all)
+		self.send_all_profiles(self._send_to_all)
 	
 	
 	def remove_controller(self, c):
@@ -535,28 +665,27 @@ class SCCDaemon(Daemon):
 			mapper.release_virtual_buttons()
 		c.disconnected()
 		
-		with self.lock:
-			while c in self.controllers:
-				self.controllers.remove(c)
-			log.debug("Controller removed: %s", c)
-			
-			if mapper == self.default_mapper and len(self.controllers) > 0:
-				# Special case, default_mapper should be always
-				# assigned to something, so if controller with default_mapper
-				# is disconnected, it's reassigned to next available controller
-				swap_c = self.controllers[0]
-				swap_mapper = swap_c.get_mapper()
-				swap_mapper.set_controller(None)
-				swap_c.set_mapper(mapper)
-				mapper.set_controller(swap_c)
-				self.free_mappers.append(swap_mapper)
-				log.debug("Reassigned default_mapper to %s", swap_c)
-			else:
-				c.set_mapper(None)
-				if mapper:
-					mapper.set_controller(None)
-					self.free_mappers.append(mapper)
-			self.send_controller_list(self._send_to_all)
+		while c in self.controllers:
+			self.controllers.remove(c)
+		log.debug("Controller removed: %s", c)
+		
+		if mapper == self.default_mapper and len(self.controllers) > 0:
+			# Special case, default_mapper should be always
+			# assigned to something, so if controller with default_mapper
+			# is disconnected, it's reassigned to next available controller
+			swap_c = self.controllers[0]
+			swap_mapper = swap_c.get_mapper()
+			swap_mapper.set_controller(None)
+			swap_c.set_mapper(mapper)
+			mapper.set_controller(swap_c)
+			self.free_mappers.append(swap_mapper)
+			log.debug("Reassigned default_mapper to %s", swap_c)
+		else:
+			c.set_mapper(None)
+			if mapper:
+				mapper.set_controller(None)
+				self.free_mappers.append(mapper)
+		self.send_controller_list(self._send_to_all)
 	
 	
 	def get_active_ids(self):
@@ -572,9 +701,8 @@ class SCCDaemon(Daemon):
 		Every error has id that can be later used to remove it from list to
 		indicate that error has been resolved.
 		"""
-		with self.lock:
-			self.errors.append(( id, error ))
-			self._send_to_all(("Error: %s\n" % (error,)).encode("utf-8"))
+		self.errors.append(( id, error ))
+		self._send_to_all(("Error: %s\n" % (error,)).encode("utf-8"))
 	
 	
 	def remove_error(self, id):
@@ -585,10 +713,9 @@ class SCCDaemon(Daemon):
 		When last error is removed, this method automatically sends "Ready."
 		message to indicate that daemon is ready to serve clients.
 		"""
-		with self.lock:
-			self.errors = [ (_id, error) for (_id, error) in self.errors if _id != id ]
-			if len(self.errors) == 0:
-				self._send_to_all(b"Ready.\n")
+		self.errors = [ (_id, error) for (_id, error) in self.errors if _id != id ]
+		if len(self.errors) == 0:
+			self._send_to_all(b"Ready.\n")
 	
 	
 	def send_controller_list(self, method):
@@ -644,10 +771,9 @@ class SCCDaemon(Daemon):
 		self.default_mapper = self.init_default_mapper()
 		self.free_mappers.append(self.default_mapper)
 		self.load_default_profile()
-		self.lock.acquire()
+		self.start_preloading()
 		self.start_listening()
 		self.connect_x()
-		self.lock.release()
 		self.start_drivers()
 		self.dev_monitor.rescan()
 		
@@ -657,19 +783,19 @@ class SCCDaemon(Daemon):
 	
 	
 	def start_listening(self):
+		"""
+		Creates control socket. Connections are accepted and served from
+		mainloop, so all messages are handled on main thread, in order
+		in which they arrived.
+		"""
 		if os.path.exists(self.socket_file):
 			os.unlink(self.socket_file)
-		instance = self
-		
-		class SSHandler(StreamRequestHandler):
-			def handle(self):
-				instance._sshandler(self.connection, self.rfile, self.wfile)
-		
-		self.sserver = ThreadingUnixStreamServer(self.socket_file, SSHandler)
-		t = threading.Thread(target=self.sserver.serve_forever)
-		t.daemon = True
-		t.start()
+		self.ssocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.ssocket.setblocking(False)
+		self.ssocket.bind(self.socket_file)
+		self.ssocket.listen(LISTEN_BACKLOG)
 		os.chmod(self.socket_file, 0600)
+		self.poller.register(self.ssocket.fileno(), self.poller.POLLIN, self._on_new_client)
 		log.debug("Created control socket %s", self.socket_file)
 	
 	
@@ -678,14 +804,13 @@ class SCCDaemon(Daemon):
 		Starts gesture detection on specified pad.
 		Calls callback with gesture string when finished.
 		
-		Should be called with lock held.
+		Should be called from main thread.
 		"""
 		gd = None
 		
 		def cb(detector, gesture):
-			# This callback is expected to be called with lock held
-			with self.lock:
-				self._apply(mapper, what, lambda a : a.original_action)
+			# Called by mapper, on main thread
+			self._apply(mapper, what, lambda a : a.original_action)
 			log.debug("Gesture detected on %s: %s", what, gesture)
 			callback(gesture)
 		
@@ -704,283 +829,487 @@ class SCCDaemon(Daemon):
 		return gd	
 	
 	
-	def _sshandler(self, connection, rfile, wfile):
-		with self.lock:
-			client = Client(connection, self.default_mapper, rfile, wfile)
-			self.clients.add(client)
-			wfile.write(b"SCCDaemon\n")
-			wfile.write(("Version: %s\n" % (DAEMON_VERSION,)).encode("utf-8"))
-			wfile.write(("PID: %s\n" % (os.getpid(),)).encode("utf-8"))
-			self.send_controller_list(wfile.write)
-			self.send_all_profiles(wfile.write)
+	def _on_new_client(self, fd, event):
+		""" Called from mainloop when control socket has connection to accept """
+		try:
+			connection, trash = self.ssocket.accept()
+		except socket.error:
+			# EAGAIN, other side gave up before connection was accepted
+			return
+		connection.setblocking(False)
+		output = OutputQueue(connection, self._on_output_dirty)
+		client = Client(connection, self.default_mapper, output)
+		self.clients.add(client)
+		self._client_fds[output.fd] = client
+		self.poller.register(output.fd, self.poller.POLLIN, self._on_client_event)
+		try:
+			output.write(b"SCCDaemon\n")
+			output.write(("Version: %s\n" % (DAEMON_VERSION,)).encode("utf-8"))
+			output.write(("PID: %s\n" % (os.getpid(),)).encode("utf-8"))
+			self.send_controller_list(output.write)
+			self.send_all_profiles(output.write)
 			if len(self.errors) == 0:
-				wfile.write(b"Ready.\n")
+				output.write(b"Ready.\n")
 			else:
 				for id, error in self.errors:
-					wfile.write(("Error: %s\n" % (error,)).encode("utf-8"))
-		
-		while True:
-			try:
-				line = rfile.readline().decode("utf-8")
-			except Exception:
-				# Connection terminated
-				break
-			if len(line) == 0: break
-			if len(line.strip("\t\n ")) > 0:
-				self._handle_message(client, line.strip("\n"))
-		
-		with self.lock:
-			client.unlock_actions(self)
-			if self.osd_daemon == client:
-				log.info("scc-osd-daemon lost")
-				self.osd_daemon = None
-			if self.autoswitch_daemon == client:
-				log.info("scc-autoswitch-daemon lost")
-				self.autoswitch_daemon = None
-			self.clients.remove(client)
+					output.write(("Error: %s\n" % (error,)).encode("utf-8"))
+		except Exception, e:
+			log.error("Error while greeting client")
+			log.exception(e)
+			self._disconnect_client(client)
+	
+	
+	def _on_client_event(self, fd, event):
+		"""
+		Called from mainloop when client socket is readable or, if client
+		has data waiting to be sent, writable.
+		"""
+		client = self._client_fds.get(fd)
+		if client is None:
+			return
+		if event == self.poller.POLLOUT:
+			self._on_output_dirty(client.output)
+			return
+		try:
+			data = client.connection.recv(RECV_SIZE)
+		except socket.error, e:
+			if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+				return
+			data = b""
+		if len(data) == 0:
+			# Connection terminated
+			self._disconnect_client(client)
+			return
+		try:
+			for kind, line in client.reader.feed(data):
+				if kind == FT_MESSAGE and len(line.strip("\t\n ")) > 0:
+					self._handle_message(client, line.strip("\n"))
+		except Exception, e:
+			log.error("Error while handling client message")
+			log.exception(e)
+			self._disconnect_client(client)
+	
+	
+	def _disconnect_client(self, client):
+		""" Releases everything used by client and closes its connection """
+		if client not in self.clients:
+			return
+		client.unlock_actions(self)
+		client.stop_recording()
+		if self.osd_daemon == client:
+			log.info("scc-osd-daemon lost")
+			self.osd_daemon = None
+		if self.autoswitch_daemon == client:
+			log.info("scc-autoswitch-daemon lost")
+			self.autoswitch_daemon = None
+		self.clients.remove(client)
+		self.poller.unregister(client.output.fd)
+		del self._client_fds[client.output.fd]
+		self._waiting_outputs.discard(client.output)
+		client.output.close()
+		client.connection.close()
 	
 	
 	def _handle_message(self, client, message):
 		"""
 		Handles message recieved from client.
 		"""
-		if message.startswith("Profile:"):
-			with self.lock:
-				try:
-					filename = message[8:].strip("\t ")
-					self._set_profile(client.mapper, filename)
-					log.info("Loaded profile '%s'", filename)
-					client.wfile.write(b"OK.\n")
-				except Exception, e:
-					exc = traceback.format_exc()
-					log.exception(e)
-					tb = unicode(exc).encode("utf-8").encode('string_escape')
-					client.wfile.write(b"Fail: " + tb + b"\n")
-		elif message.startswith("OSD:"):
-			if not self.osd_daemon:
-				client.wfile.write(b"Fail: Cannot show OSD; there is no scc-osd-daemon registered\n")
-			else:
-				try:
-					text = message[5:].strip("\t ")
-					with self.lock:
-						if not self._osd("message", text):
-							raise Exception()
-					client.wfile.write(b"OK.\n")
-				except Exception:
-					client.wfile.write(b"Fail: cannot display OSD\n")
-		elif message.startswith("Feedback:"):
+		m = COMMAND_RE.match(message)
+		handler = self._handlers.get(m.group(0)) if m else None
+		if handler:
+			handler(client, message)
+		else:
+			client.wfile.write(b"Fail: Unknown command\n")
+	
+	
+	def _handle_binary(self, client, message):
+		""" Handles 'Binary.' message """
+		client.wfile.write(b"OK.\n")
+		if not client.binary:
+			client.wfile = FramedWriter(client.wfile)
+			client.binary = True
+	
+	
+	def _handle_profile(self, client, message):
+		""" Handles 'Profile:' message """
+		try:
+			filename = message[8:].strip("\t ")
+			self._set_profile(client.mapper, filename)
+			log.info("Loaded profile '%s'", filename)
+			client.wfile.write(b"OK.\n")
+		except Exception, e:
+			exc = traceback.format_exc()
+			log.exception(e)
+			tb = unicode(exc).encode("utf-8").encode('string_escape')
+			client.wfile.write(b"Fail: " + tb + b"\n")
+	
+	
+	def _handle_osd(self, client, message):
+		""" Handles 'OSD:' message """
+		if not self.osd_daemon:
+			client.wfile.write(b"Fail: Cannot show OSD; there is no scc-osd-daemon registered\n")
+		else:
 			try:
-				position, amplitude = message[9:].strip().split(" ", 2)
-				data = HapticData(
-					getattr(HapticPos, position.strip(" \t\r")),
-					int(amplitude)
-				)
-				if client.mapper.get_controller():
-					client.mapper.get_controller().feedback(data)
-				client.wfile.write(b"OK.\n")
-			except Exception, e:
-				log.exception(e)
-				client.wfile.write(b"Fail: %s\n" % (e,))
-		elif message.startswith("Controller."):
-			with self.lock:
-				client.mapper = self.default_mapper
+				text = message[5:].strip("\t ")
+				if not self._osd("message", text):
+					raise Exception()
 				client.wfile.write(b"OK.\n")
-		elif message.startswith("Controller:"):
-			with self.lock:
-				try:
-					controller_id = message[11:].strip()
-					for c in self.controllers:
-						if c.get_id() == controller_id:
-							client.mapper = c.get_mapper()
-							client.wfile.write(b"OK.\n")
-							break
-					else:
-						raise Exception("goto fail")
-				except Exception, e:
-					client.wfile.write(b"Fail: no such controller\n")
-		elif message.startswith("State."):
-			if Config()["enable_sniffing"]:
-				client.wfile.write(b"State: %s\n" % (str(client.mapper.state), ))
-			else:
-				log.warning("Refused 'State' request: Sniffing disabled")
-				client.wfile.write(b"Fail: Sniffing disabled.\n")
-		elif message.startswith("Led:"):
-			try:
-				number = int(message[4:])
-				number = clamp(0, number, 100)
-			except Exception, e:
-				client.wfile.write(b"Fail: %s\n" % (e,))
-				return
+			except Exception:
+				client.wfile.write(b"Fail: cannot display OSD\n")
+	
+	
+	def _handle_feedback(self, client, message):
+		""" Handles 'Feedback:' message """
+		try:
+			position, amplitude = message[9:].strip().split(" ", 2)
+			data = HapticData(
+				getattr(HapticPos, position.strip(" \t\r")),
+				int(amplitude)
+			)
 			if client.mapper.get_controller():
-				client.mapper.get_controller().set_led_level(number)
-		elif message.startswith("Observe:"):
-			if Config()["enable_sniffing"]:
-				to_observe = [ x for x in message.split(":", 1)[1].strip(" \t\r").split(" ") ]
-				with self.lock:
-					for l in to_observe:
-						client.observe_action(self, SCCDaemon.source_to_constant(l))
+				client.mapper.get_controller().feedback(data)
+			client.wfile.write(b"OK.\n")
+		except Exception, e:
+			log.exception(e)
+			client.wfile.write(b"Fail: %s\n" % (e,))
+	
+	
+	def _handle_controller_reset(self, client, message):
+		""" Handles 'Controller.' message """
+		client.mapper = self.default_mapper
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_controller(self, client, message):
+		""" Handles 'Controller:' message """
+		try:
+			controller_id = message[11:].strip()
+			for c in self.controllers:
+				if c.get_id() == controller_id:
+					client.mapper = c.get_mapper()
 					client.wfile.write(b"OK.\n")
+					break
 			else:
-				log.warning("Refused 'Observe' request: Sniffing disabled")
-				client.wfile.write(b"Fail: Sniffing disabled.\n")
-		elif message.startswith("Replace:"):
+				raise Exception("goto fail")
+		except Exception, e:
+			client.wfile.write(b"Fail: no such controller\n")
+	
+	
+	def _handle_state(self, client, message):
+		""" Handles 'State.' message """
+		if Config()["enable_sniffing"]:
+			client.wfile.write(b"State: %s\n" % (str(client.mapper.state), ))
+		else:
+			log.warning("Refused 'State' request: Sniffing disabled")
+			client.wfile.write(b"Fail: Sniffing disabled.\n")
+	
+	
+	def _handle_led(self, client, message):
+		""" Handles 'Led:' message """
+		try:
+			number = int(message[4:])
+			number = clamp(0, number, 100)
+		except Exception, e:
+			client.wfile.write(b"Fail: %s\n" % (e,))
+			return
+		if client.mapper.get_controller():
+			client.mapper.get_controller().set_led_level(number)
+	
+	
+	def _handle_observe(self, client, message):
+		""" Handles 'Observe:' message """
+		if Config()["enable_sniffing"]:
+			to_observe = [ x for x in message.split(":", 1)[1].strip(" \t\r").split(" ") ]
+			interval = None
+			for l in to_observe:
+				m = RATE_RE.match(l)
+				if m:
+					rate = float(m.group(1))
+					if rate <= 0:
+						client.wfile.write(b"Fail: invalid rate\n")
+						return
+					interval = 1.0 / rate
+			for l in to_observe:
+				if not RATE_RE.match(l):
+					client.observe_action(self, SCCDaemon.source_to_constant(l), interval)
+			client.wfile.write(b"OK.\n")
+		else:
+			log.warning("Refused 'Observe' request: Sniffing disabled")
+			client.wfile.write(b"Fail: Sniffing disabled.\n")
+	
+	
+	def _handle_record(self, client, message):
+		""" Handles 'Record:' message """
+		if Config()["enable_sniffing"]:
+			filename = message[7:].strip(" \t\r")
 			try:
-				l, actionstr = message.split(":", 1)[1].strip(" \t\r").split(" ", 1)
-				action = TalkingActionParser().restart(actionstr).parse().compress()
+				client.start_recording(filename)
 			except Exception, e:
+				log.error("Failed to start recording: %s", e)
 				e = unicode(e).encode("utf-8").encode('string_escape')
-				client.wfile.write(b"Fail: failed to parse: " + e + "\n")
+				client.wfile.write(b"Fail: " + e + b"\n")
 				return
-			with self.lock:
-				try:
-					if not self._can_lock_action(client.mapper, SCCDaemon.source_to_constant(l)):
-						client.wfile.write(b"Fail: Cannot lock " + l.encode("utf-8") + b"\n")
-						return
-				except ValueError, e:
-					tb = unicode(traceback.format_exc()).encode("utf-8").encode('string_escape')
-					client.wfile.write(b"Fail: " + tb + b"\n")
-					return
-				client.replace_action(self, SCCDaemon.source_to_constant(l), action)
-				client.wfile.write(b"OK.\n")
-		elif message.startswith("Lock:"):
-			to_lock = [ x for x in message.split(":", 1)[1].strip(" \t\r").split(" ") ]
-			with self.lock:
-				try:
-					for l in to_lock:
-						if not self._can_lock_action(client.mapper, SCCDaemon.source_to_constant(l)):
-							client.wfile.write(b"Fail: Cannot lock " + l.encode("utf-8") + b"\n")
-							return
-				except ValueError, e:
-					tb = unicode(traceback.format_exc()).encode("utf-8").encode('string_escape')
-					client.wfile.write(b"Fail: " + tb + b"\n")
-					return
-				for l in to_lock:
-					client.lock_action(self, SCCDaemon.source_to_constant(l))
-				client.wfile.write(b"OK.\n")
-		elif message.startswith("Unlock."):
-			with self.lock:
-				client.unlock_actions(self)
-				client.wfile.write(b"OK.\n")
-		elif message.startswith("Reconfigure."):
-			with self.lock:
-				# Load config
-				cfg = Config()
-				# Reconfigure connected controllers
+			log.info("Recording inputs to '%s'", filename)
+			client.wfile.write(b"OK.\n")
+		else:
+			log.warning("Refused 'Record' request: Sniffing disabled")
+			client.wfile.write(b"Fail: Sniffing disabled.\n")
+	
+	
+	def _handle_record_stop(self, client, message):
+		""" Handles 'Record.' message """
+		client.stop_recording()
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_stats(self, client, message):
+		""" Handles 'Stats:' message """
+		what = message[6:].strip(" \t\r")
+		if what == "on":
+			self._enable_stats()
+		elif what == "off" and self.stats:
+			self.stats.detach()
+			self.stats = None
+		elif what == "reset" and self.stats:
+			self.stats.reset()
+		elif what not in ("off", "reset"):
+			client.wfile.write(b"Fail: Unknown command\n")
+			return
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_stats_report(self, client, message):
+		""" Handles 'Stats.' message """
+		if self.stats:
+			for line in self.stats.report():
+				client.wfile.write(b"Stats: " + line.encode("utf-8") + b"\n")
+			for c in self.controllers:
+				dropped = c.get_dropped()
+				if dropped is not None:
+					client.wfile.write(("Dropped: %s %s\n" % (
+						c.get_id(), dropped)).encode("utf-8"))
+			# Transfers are counted per USB device, which may be shared
+			# by multiple controllers (dongle), so reported separately
+			from scc.drivers import usb
+			client.wfile.write(("Dropped: usb_transfers %s\n" % (
+				usb.get_dropped(),)).encode("utf-8"))
+			client.wfile.write(("Dropped: usb_calls %s\n" % (
+				usb.get_dropped_calls(),)).encode("utf-8"))
+			client.wfile.write(b"OK.\n")
+		else:
+			client.wfile.write(b"Fail: Stats are not enabled\n")
+	
+	
+	def _handle_profiling(self, client, message):
+		""" Handles 'Profiling:' message """
+		what = message[10:].strip(" \t\r")
+		if what == "on":
+			if self.profiler is None:
+				self.profiler = ActionProfiler()
 				for c in self.controllers:
-					c.apply_config(cfg.get_controller_config(c.get_id()))
-				# Start or stop scc-autoswitch-daemon as needed
-				need_autoswitch_daemon = len(cfg["autoswitch"]) > 0
-				if need_autoswitch_daemon and self.xdisplay and not self.autoswitch_daemon:
-					self.subprocs.append(Subprocess("scc-autoswitch-daemon", True))
-				elif not need_autoswitch_daemon and self.autoswitch_daemon:
-					self._remove_subproccess("scc-autoswitch-daemon")
-					self.autoswitch_daemon.close()
-					self.autoswitch_daemon = None
-				# Respond
-				try:
-					client.wfile.write(b"OK.\n")
-					self._send_to_all("Reconfigured.\n".encode("utf-8"))
-				except:
-					pass
-		elif message.startswith("Rescan."):
-			cbs = []
-			with self.lock:
-				cbs += self.rescan_cbs
-				# Respond first
-				try:
-					client.wfile.write(b"OK.\n")
-				except:
-					pass
-			# Do stuff later
-			# (this cannot be done while self.lock is held, as creating new
-			# controller would create race condition)
-			for cb in self.rescan_cbs:
-				try:
-					cb()
-				except Exception, e:
-					log.exception(e)
-			# dev_monitor rescan has to be last to run
+					if c.get_mapper():
+						self.profiler.attach(c.get_mapper())
+				log.info("Action profiling enabled")
+		elif what == "off" and self.profiler:
+			self.profiler.detach()
+			self.profiler = None
+		elif what == "reset" and self.profiler:
+			self.profiler.reset()
+		elif what not in ("off", "reset"):
+			client.wfile.write(b"Fail: Unknown command\n")
+			return
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_profiling_report(self, client, message):
+		""" Handles 'Profiling.' message """
+		if self.profiler:
+			for line in self.profiler.report():
+				client.wfile.write(b"Profiling: " + line.encode("utf-8") + b"\n")
+			client.wfile.write(b"OK.\n")
+		else:
+			client.wfile.write(b"Fail: Profiling is not enabled\n")
+	
+	
+	def _handle_replace(self, client, message):
+		""" Handles 'Replace:' message """
+		try:
+			l, actionstr = message.split(":", 1)[1].strip(" \t\r").split(" ", 1)
+			action = TalkingActionParser().restart(actionstr).parse().compress()
+		except Exception, e:
+			e = unicode(e).encode("utf-8").encode('string_escape')
+			client.wfile.write(b"Fail: failed to parse: " + e + "\n")
+			return
+		try:
+			if not self._can_lock_action(client.mapper, SCCDaemon.source_to_constant(l)):
+				client.wfile.write(b"Fail: Cannot lock " + l.encode("utf-8") + b"\n")
+				return
+		except ValueError, e:
+			tb = unicode(traceback.format_exc()).encode("utf-8").encode('string_escape')
+			client.wfile.write(b"Fail: " + tb + b"\n")
+			return
+		client.replace_action(self, SCCDaemon.source_to_constant(l), action)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_lock(self, client, message):
+		""" Handles 'Lock:' message """
+		to_lock = [ x for x in message.split(":", 1)[1].strip(" \t\r").split(" ") ]
+		try:
+			for l in to_lock:
+				if not self._can_lock_action(client.mapper, SCCDaemon.source_to_constant(l)):
+					client.wfile.write(b"Fail: Cannot lock " + l.encode("utf-8") + b"\n")
+					return
+		except ValueError, e:
+			tb = unicode(traceback.format_exc()).encode("utf-8").encode('string_escape')
+			client.wfile.write(b"Fail: " + tb + b"\n")
+			return
+		for l in to_lock:
+			client.lock_action(self, SCCDaemon.source_to_constant(l))
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_unlock(self, client, message):
+		""" Handles 'Unlock.' message """
+		client.unlock_actions(self)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_reconfigure(self, client, message):
+		""" Handles 'Reconfigure.' message """
+		# Load config
+		cfg = Config()
+		# Reconfigure connected controllers
+		for c in self.controllers:
+			c.apply_config(cfg.get_controller_config(c.get_id()))
+		# Update list of preloaded profiles
+		try:
+			self.preloader.set_profiles(collect_profiles(cfg))
+		except Exception, e:
+			log.warning("Failed to preload profiles: %s", e)
+		# Start or stop scc-autoswitch-daemon as needed
+		need_autoswitch_daemon = len(cfg["autoswitch"]) > 0
+		if need_autoswitch_daemon and self.xdisplay and not self.autoswitch_daemon:
+			self.subprocs.append(Subprocess("scc-autoswitch-daemon", True))
+		elif not need_autoswitch_daemon and self.autoswitch_daemon:
+			self._remove_subproccess("scc-autoswitch-daemon")
+			self.autoswitch_daemon.close()
+			self.autoswitch_daemon = None
+		# Respond
+		try:
+			client.wfile.write(b"OK.\n")
+			self._send_to_all("Reconfigured.\n".encode("utf-8"))
+		except:
+			pass
+	
+	
+	def _handle_rescan(self, client, message):
+		""" Handles 'Rescan.' message """
+		cbs = []
+		cbs += self.rescan_cbs
+		# Respond first
+		try:
+			client.wfile.write(b"OK.\n")
+		except:
+			pass
+		# Do stuff later
+		for cb in self.rescan_cbs:
 			try:
-				self.dev_monitor.rescan()
+				cb()
 			except Exception, e:
 				log.exception(e)
-
-		elif message.startswith("Turnoff."):
-			to_turn_off = []
-			with self.lock:
-				if client.mapper.get_controller():
-					to_turn_off.append(client.mapper.get_controller())
-				else:
-					to_turn_off += [ c for c in self.controllers ]
-			for c in to_turn_off:
-				c.turnoff()
-			client.wfile.write(b"OK.\n")
-		elif message.startswith("Gesture:"):
+		# dev_monitor rescan has to be last to run
+		try:
+			self.dev_monitor.rescan()
+		except Exception, e:
+			log.exception(e)
+	
+	
+	def _handle_turnoff(self, client, message):
+		""" Handles 'Turnoff.' message """
+		to_turn_off = []
+		if client.mapper.get_controller():
+			to_turn_off.append(client.mapper.get_controller())
+		else:
+			to_turn_off += [ c for c in self.controllers ]
+		for c in to_turn_off:
+			c.turnoff()
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_gesture(self, client, message):
+		""" Handles 'Gesture:' message """
+		try:
+			what, up_angle = message[8:].strip().split(" ", 2)
+			up_angle = int(up_angle)
+		except Exception, e:
+			tb = unicode(traceback.format_exc()).encode("utf-8").encode('string_escape')
+			client.wfile.write(b"Fail: " + tb + b"\n")
+			return
+		client.request_gesture(self, what, up_angle)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_restart(self, client, message):
+		""" Handles 'Restart.' message """
+		self.on_sa_restart()
+	
+	
+	def _handle_gestured(self, client, message):
+		""" Handles 'Gestured:' message """
+		gstr = message[9:].strip()
+		client.gesture_action.gesture(client.mapper, gstr)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _handle_selected(self, client, message):
+		""" Handles 'Selected:' message """
+		menuaction = None
+		def press(mapper):
 			try:
-				what, up_angle = message[8:].strip().split(" ", 2)
-				up_angle = int(up_angle)
+				menuaction.button_press(mapper)
+				client.mapper.schedule(0.1, release)
 			except Exception, e:
-				tb = unicode(traceback.format_exc()).encode("utf-8").encode('string_escape')
-				client.wfile.write(b"Fail: " + tb + b"\n")
-				return
-			with self.lock:
-				client.request_gesture(self, what, up_angle)
-				client.wfile.write(b"OK.\n")
-		elif message.startswith("Restart."):
-			self.on_sa_restart()
-		elif message.startswith("Gestured:"):
-			gstr = message[9:].strip()
-			client.gesture_action.gesture(client.mapper, gstr)
-			with self.lock:
-				client.wfile.write(b"OK.\n")
-		elif message.startswith("Selected:"):
+				log.error("Error while processing menu action")
+				log.exception(e)
+		def release(mapper):
+			try:
+				menuaction.button_release(mapper)
+			except Exception, e:
+				log.error("Error while processing menu action")
+				log.exception(e)
+		
+		try:
+			menu_id, item_id = shsplit(message)[1:]
 			menuaction = None
-			def press(mapper):
-				try:
-					menuaction.button_press(mapper)
-					client.mapper.schedule(0.1, release)
-				except Exception, e:
-					log.error("Error while processing menu action")
-					log.exception(e)
-			def release(mapper):
-				try:
-					menuaction.button_release(mapper)
-				except Exception, e:
-					log.error("Error while processing menu action")
-					log.exception(e)
-			
-			with self.lock:
-				try:
-					menu_id, item_id = shsplit(message)[1:]
-					menuaction = None
-					if menu_id in (None, "None"):
-						menuaction = self.osd_ids[item_id]
-					elif "." in menu_id:
-						# TODO: Move this common place
-						data = json.loads(open(menu_id, "r").read())
-						menudata = MenuData.from_json_data(data, TalkingActionParser())
-						menuaction = menudata.get_by_id(item_id).action
-					else:
-						menuaction = client.mapper.profile.menus[menu_id].get_by_id(item_id).action
-					client.wfile.write(b"OK.\n")
-				except:
-					log.warning("Selected menu item is no longer valid.")
-					client.wfile.write(b"Fail: Selected menu item is no longer valid\n")
-				if menuaction:
-					client.mapper.schedule(0, press)
-		elif message.startswith("Register:"):
-			with self.lock:
-				if message.strip().endswith("osd"):
-					if self.osd_daemon: self.osd_daemon.close()
-					self.osd_daemon = client
-					log.info("Registered scc-osd-daemon")
-				elif message.strip().endswith("autoswitch"):
-					if self.autoswitch_daemon: self.autoswitch_daemon.close()
-					self.autoswitch_daemon = client
-					log.info("Registered scc-autoswitch-daemon")
-				client.wfile.write(b"OK.\n")
-		else:
-			client.wfile.write(b"Fail: Unknown command\n")
+			if menu_id in (None, "None"):
+				menuaction = self.osd_ids[item_id]
+			elif "." in menu_id:
+				# TODO: Move this common place
+				data = json.loads(open(menu_id, "r").read())
+				menudata = MenuData.from_json_data(data, TalkingActionParser())
+				menuaction = menudata.get_by_id(item_id).action
+			else:
+				menuaction = client.mapper.profile.menus[menu_id].get_by_id(item_id).action
+			client.wfile.write(b"OK.\n")
+		except:
+			log.warning("Selected menu item is no longer valid.")
+			client.wfile.write(b"Fail: Selected menu item is no longer valid\n")
+		if menuaction:
+			client.mapper.schedule(0, press)
+	
+	
+	def _handle_register(self, client, message):
+		""" Handles 'Register:' message """
+		if message.strip().endswith("osd"):
+			if self.osd_daemon: self.osd_daemon.close()
+			self.osd_daemon = client
+			log.info("Registered scc-osd-daemon")
+		elif message.strip().endswith("autoswitch"):
+			if self.autoswitch_daemon: self.autoswitch_daemon.close()
+			self.autoswitch_daemon = client
+			log.info("Registered scc-autoswitch-daemon")
+		client.wfile.write(b"OK.\n")
 	
 	
 	def _remove_subproccess(self, binary_name):
@@ -989,7 +1318,7 @@ class SCCDaemon(Daemon):
 		managed subproccesses, effectively preventing daemon from
 		auto-restarting it.
 		
-		Should be called while lock is acquired
+		Should be called from main thread.
 		"""
 		n = []
 		for i in self.subprocs:
@@ -1005,7 +1334,7 @@ class SCCDaemon(Daemon):
 		Returns True if action assigned to axis,
 		pad or button is not yet locked.
 		
-		Should be called while self.lock is acquired.
+		Should be called from main thread.
 		"""
 		# TODO: Probably move to mapper
 		is_locked = (lambda a: isinstance(a, LockedAction) or
@@ -1091,7 +1420,10 @@ class SCCDaemon(Daemon):
 	
 	
 	def _remove_socket(self):
-		self.sserver.shutdown()
+		if self.ssocket:
+			self.poller.unregister(self.ssocket.fileno())
+			self.ssocket.close()
+			self.ssocket = None
 		if os.path.exists(self.socket_file):
 			os.unlink(self.socket_file)
 		log.debug("Control socket removed")
@@ -1109,13 +1441,45 @@ class SCCDaemon(Daemon):
 
 
 class Client(object):
-	def __init__(self, connection, mapper, rfile, wfile):
+	def __init__(self, connection, mapper, output):
 		self.connection = connection
-		self.rfile = rfile
-		self.wfile = wfile
+		self.reader = FrameReader()	# Splits received data into messages
+		self.output = output	# OutputQueue
+		self.wfile = output		# Same as output, or FramedWriter wrapping it
 		self.mapper = mapper
 		self.gesture_action = None
 		self.locked_actions = {}
+		self.recorder = None
+		self.binary = False		# Set after client asks for binary frames
+		self.batches = {}		# Maps interval to EventBatch
+	
+	
+	def report_event(self, controller_id, source, values):
+		"""
+		Sends input event to client, as text or as binary record.
+		'values' is tuple of one or two numbers.
+		"""
+		if self.binary:
+			prefix, data = self.wfile.encode_event(controller_id, source, values)
+			if prefix:
+				self.output.write(prefix)
+		else:
+			data = ("Event: %s %s %s\n" % (controller_id, source,
+				" ".join([ "%s" % (x,) for x in values ]))).encode("utf-8")
+		# Positions of axes and pads replace older, not yet sent ones
+		key = (controller_id, source) if len(values) == 2 else None
+		self.output.write(data, key, True)
+	
+	
+	def report_batched(self, mapper, controller_id, source, values, interval):
+		"""
+		As report_event, but event is sent together with other events
+		reported with same interval, no more often than once per interval.
+		"""
+		batch = self.batches.get(interval)
+		if batch is None:
+			batch = self.batches[interval] = EventBatch(self, interval)
+		batch.add(mapper, controller_id, source, values)
 	
 	
 	def close(self):
@@ -1131,10 +1495,9 @@ class Client(object):
 		Handler used when client requested gesture detection with
 		"Gesture:" message.
 		
-		Should be called while daemon.lock is acquired.
+		Should be called from main thread.
 		"""
 		def cb(gesture):
-			# Called while lock is being held
 			try:
 				self.wfile.write(b"Gesture: %s %s\n" % (what, gesture))
 			except:
@@ -1149,7 +1512,7 @@ class Client(object):
 		"""
 		Locks action so event can be send to client instead of handling it.
 		
-		Should be called while daemon.lock is acquired.
+		Should be called from main thread.
 		"""
 		def lock(action, what):
 			# ObservingAction should be above LockedAction
@@ -1161,14 +1524,16 @@ class Client(object):
 		daemon._apply(self.mapper, what, lock, what)
 	
 	
-	def observe_action(self, daemon, what):
+	def observe_action(self, daemon, what, interval=None):
 		"""
 		Enables observing of action so event is both sent to client and handled.
+		If 'interval' is set, positions of axes and pads are sent at most
+		once per 'interval' seconds.
 		
-		Should be called while daemon.lock is acquired.
+		Should be called from main thread.
 		"""
 		daemon._apply(self.mapper, what,
-				lambda a : ObservingAction(what, self, a))
+				lambda a : ObservingAction(what, self, a, interval))
 	
 	
 	def replace_action(self, daemon, what, action):
@@ -1176,14 +1541,36 @@ class Client(object):
 		Temporally replaces action in way that allows reversing operation when
 		client disconnects.
 		
-		Should be called while daemon.lock is acquired.
+		Should be called from main thread.
 		"""
 		daemon._apply(self.mapper, what,
 				lambda a : ReplacedAction(what, self, action, a))
 	
 	
+	def start_recording(self, filename):
+		"""
+		Starts recording inputs received by client's mapper into file.
+		Should be called from main thread.
+		"""
+		self.stop_recording()
+		self.recorder = InputRecorder(filename)
+		self.recorder.attach(self.mapper)
+	
+	
+	def stop_recording(self):
+		""" Should be called from main thread. """
+		if self.recorder:
+			recorder, self.recorder = self.recorder, None
+			recorder.detach()
+			# Mapper may be writing frame right now, file is closed on main thread
+			self.mapper.schedule(0, lambda *a: recorder.close())
+	
+	
 	def unlock_actions(self, daemon):
-		""" Should be called while daemon.lock is acquired """
+		""" Should be called from main thread. """
+		for batch in self.batches.values():
+			batch.cancel()
+		self.batches = {}
 		locked, self.locked_actions = self.locked_actions, {}
 		for mapper in locked:
 			s = locked[mapper]
@@ -1194,7 +1581,7 @@ class Client(object):
 	def reaply_locks(self, daemon, mapper):
 		"""
 		Called after profile is changed.
-		Should be called while daemon.lock is acquired
+		Should be called from main thread.
 		"""
 		if mapper in self.locked_actions:
 			s, self.locked_actions[mapper] = self.locked_actions[mapper], set()
@@ -1202,6 +1589,55 @@ class Client(object):
 				a.reaply(self, daemon)
 
 
+class EventBatch(object):
+	"""
+	Collects events reported to client by rate-limited ObservingActions
+	and sends them together, at most once per interval. Only latest values
+	of every input are sent and only if they changed since last batch.
+	"""
+	
+	def __init__(self, client, interval):
+		self.client = client
+		self.interval = interval
+		self.pending = {}		# Maps (controller_id, source) to values
+		self.sent = {}			# Last values sent for every key
+		self.last_flush = 0
+		self.task = None
+		self.mapper = None
+	
+	
+	def add(self, mapper, controller_id, source, values):
+		key = controller_id, source
+		if key not in self.pending and self.sent.get(key) == values:
+			return
+		self.pending[key] = values
+		if self.task is None:
+			delay = self.last_flush + self.interval - time.time()
+			if delay <= 0:
+				self.flush(mapper)
+			else:
+				self.mapper = mapper
+				self.task = mapper.schedule(delay, self.flush)
+	
+	
+	def flush(self, mapper):
+		self.task = None
+		self.last_flush = time.time()
+		pending, self.pending = self.pending, {}
+		for key, values in pending.iteritems():
+			if self.sent.get(key) != values:
+				self.sent[key] = values
+				self.client.report_event(key[0], key[1], values)
+	
+	
+	def cancel(self):
+		""" Cancels scheduled flush and drops everything pending """
+		if self.task:
+			self.mapper.cancel_task(self.task)
+		self.task, self.mapper = None, None
+		self.pending = {}
+
+
 class ReportingAction(Action):
 	"""
 	Action used to send requested inputs to client.
@@ -1209,10 +1645,11 @@ class ReportingAction(Action):
 	"""
 	MIN_DIFFERENCE = 300
 	
-	def __init__(self, what, client):
+	def __init__(self, what, client, interval=None):
 		self.what = what
 		self.client = client
 		self.mapper = client.mapper
+		self.interval = interval	# If set, positions are sent in batches
 		self.old_pos = 0, 0
 	
 	
@@ -1227,36 +1664,27 @@ class ReportingAction(Action):
 	__str__ = __repr__
 	
 	
-	def _report(self, message):
-		try:
-			self.client.wfile.write(message.encode("utf-8"))
-		except Exception, e:
-			# May fail when client dies
-			self.client.rfile.close()
-			self.client.wfile.close()
+	def _report(self, mapper, source, *values):
+		controller = mapper.get_controller()
+		if not controller:
+			return
+		# Never blocks, data is only queued
+		if self.interval is not None and len(values) == 2:
+			self.client.report_batched(mapper, controller.get_id(), source,
+				values, self.interval)
+		else:
+			self.client.report_event(controller.get_id(), source, values)
 	
 	
 	def trigger(self, mapper, position, old_position):
-		if mapper.get_controller():
-			self._report("Event: %s %s %s %s\n" % (
-				mapper.get_controller().get_id(),
-				nameof(self.what), position, old_position
-			))
+		self._report(mapper, nameof(self.what), position, old_position)
 	
 	
 	def button_press(self, mapper, number=1):
-		if mapper.get_controller():
-			if self.what == SCButtons.STICKPRESS:
-				self._report("Event: %s STICKPRESS %s\n" % (
-					mapper.get_controller().get_id(),
-					number
-				))
-			else:
-				self._report("Event: %s %s %s\n" % (
-					mapper.get_controller().get_id(),
-					nameof(self.what),
-					number
-				))
+		if self.what == SCButtons.STICKPRESS:
+			self._report(mapper, "STICKPRESS", number)
+		else:
+			self._report(mapper, nameof(self.what), number)
 	
 	
 	def button_release(self, mapper):
@@ -1264,16 +1692,16 @@ class ReportingAction(Action):
 	
 	
 	def whole(self, mapper, x, y, what):
+		if self.interval is not None:
+			# Batch sends only latest position, no need to skip small changes
+			self._report(mapper, what, x, y)
+			return
 		min_difference = self.MIN_DIFFERENCE
 		if what == CPAD: min_difference /= 10
 		if (x == 0 or y == 0 or abs(x - self.old_pos[0]) > min_difference
-							or abs(y - self.old_pos[1] > min_difference)):
+							or abs(y - self.old_pos[1]) > min_difference):
 			self.old_pos = x, y
-			if mapper.get_controller():
-				self._report("Event: %s %s %s %s\n" % (
-					mapper.get_controller().get_id(),
-					what, x, y
-				))
+			self._report(mapper, what, x, y)
 
 
 class LockedAction(ReportingAction):
@@ -1337,8 +1765,8 @@ class ObservingAction(ReportingAction):
 	"""
 	Similar to LockedAction, send inputs to client *and* executes actions.
 	"""
-	def __init__(self, what, client, original_action):
-		ReportingAction.__init__(self, what, client)
+	def __init__(self, what, client, original_action, interval=None):
+		ReportingAction.__init__(self, what, client, interval)
 		self.original_action = original_action
 		self._store_lock()
 		log.debug("%s on %s observed by %x", self.what,
@@ -1346,7 +1774,7 @@ class ObservingAction(ReportingAction):
 	
 	
 	def reaply(self, client, daemon):
-		client.observe_action(daemon, self.what)
+		client.observe_action(daemon, self.what, self.interval)
 	
 	
 	def cancel(self, mapper):
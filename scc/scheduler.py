@@ -3,24 +3,66 @@
 SC-Controller - Scheduler
 
 Centralized scheduler that should be used everywhere.
-Runs in SCCDaemon's (single-threaded) mainloop. That means all callbacks are
-also called on main thread.
+Runs in SCCDaemon's mainloop. That means all callbacks are called on main
+thread, but tasks may be scheduled and canceled from any thread.
 
 Use schedule(delay, callback, *data) to register one-time task.
+Use next_deadline() to find out when mainloop has to wake up again.
+
+Tasks are kept in binary heap. Canceled tasks are not removed from heap right
+away, but only marked as canceled and skipped when they get to top. Heap is
+rebuilt when more than half of it is made of canceled tasks.
 """
-import time, Queue, logging
+from heapq import heappush, heappop, heapify
+import time, itertools, threading, logging
 log = logging.getLogger("Scheduler")
 
-# TODO: Maybe create actual thread for this? Use poler? Scrap everything and rewrite it in GO?
 
 class Scheduler(object):
 	
 	def __init__(self):
-		self._scheduled = Queue.PriorityQueue()
-		self._next = None
+		self._heap = []
+		self._counter = itertools.count()
+		self._canceled = 0
+		self._now = time.time()
+		self._wakeup = None
+		self._lock = threading.Lock()
+	
+	
+	def set_wakeup_callback(self, cb):
+		"""
+		Sets callback called when new task becomes first to be executed.
+		Used by daemon to interrupt sleeping poller when task is scheduled
+		from another thread.
+		"""
+		self._wakeup = cb
+	
+	
+	def update_time(self):
+		"""
+		Updates time used as base for newly scheduled tasks. Called
+		automatically by run(), but should be called when mainloop wakes up
+		after sleeping for longer time.
+		"""
 		self._now = time.time()
 	
 	
+	def next_deadline(self):
+		"""
+		Returns time (as returned by time.time()) of next scheduled task
+		or None if there is nothing scheduled.
+		"""
+		with self._lock:
+			heap = self._heap
+			while heap and heap[0][2].scheduler is None:
+				# Drop canceled tasks from top
+				heappop(heap)
+				self._canceled -= 1
+			if heap:
+				return heap[0][0]
+			return None
+	
+	
 	def schedule(self, delay, callback, *data):
 		"""
 		Schedules one-time task to be executed no sooner than after 'delay' of
@@ -30,12 +72,13 @@ class Scheduler(object):
 		Returned Task instance can be used to cancel task once scheduled.
 		"""
 		task = Task(self._now + delay, callback, data)
-		if self._next is None or task.time < self._next.time:
-			if self._next:
-				self._scheduled.put(self._next)
-			self._next = task
-		else:
-			self._scheduled.put(task)
+		task.scheduler = self
+		with self._lock:
+			first = not self._heap or task.time < self._heap[0][0]
+			# Counter keeps tasks scheduled for same time in FIFO order
+			heappush(self._heap, (task.time, next(self._counter), task))
+		if self._wakeup and first:
+			self._wakeup()
 		return task
 	
 	
@@ -43,45 +86,48 @@ class Scheduler(object):
 		"""
 		Returns True if task was sucessfully removed or False if task was
 		already executed or not known at all.
-		
-		Note that this is slow as hell and completly thread-unsafe,
-		so it _has_ to be called on main thread.
 		"""
-		if task == self._next:
-			self._next = None if self._scheduled.empty() else self._scheduled.get()
+		with self._lock:
+			if task.scheduler is not self:
+				return False
+			task.scheduler = None
+			self._canceled += 1
+			if self._canceled > len(self._heap) / 2:
+				# Rebuilt in place, run() may be iterating over it right now
+				self._heap[:] = [ x for x in self._heap if x[2].scheduler is not None ]
+				heapify(self._heap)
+				self._canceled = 0
 			return True
-		# Fun part: All tasks are removed from PriorityQueue
-		# until correct is found. Then everything is put back
-		tasks, found = [], False
-		while not self._scheduled.empty():
-			t = self._scheduled.get()
-			if t == task:
-				found = True
-				break
-			tasks.append(t)
-		for t in tasks:
-			self._scheduled.put(t)
-		return found
 	
 	
 	def run(self):
 		self._now = time.time()
-		while self._next and self._now >= self._next.time:
-			callback, data = self._next.callback, self._next.data
-			self._next = None if self._scheduled.empty() else self._scheduled.get()
-			callback(*data)
+		heap = self._heap
+		while True:
+			# Lock is not held while callback is running,
+			# so callback can schedule another task
+			with self._lock:
+				if not heap or self._now < heap[0][0]:
+					break
+				task = heappop(heap)[2]
+				if task.scheduler is None:
+					self._canceled -= 1
+					continue
+				task.scheduler = None
+			task.callback(*task.data)
 
 
 class Task(object):
+	__slots__ = ('time', 'callback', 'data', 'scheduler')
 	
 	def __init__(self, time, callback, data):
 		self.time = time
 		self.callback = callback
 		self.data = data
+		self.scheduler = None	# Set while task is waiting in scheduler
 	
 	
 	def cancel(self):
 		""" Marks task as canceled, without actually removing it from scheduler """
 		self.callback = lambda *a, **b: False
 		self.data = ()
-
@@ -109,7 +109,7 @@ def cmd_list_profiles(argv0, argv):
 def cmd_set_profile(argv0, argv):
 	"""
 	Sets controller profile
-
+	
 	Usage: scc set-profile [controller_id] "profile name"
 	"""
 	from scc.tools import find_profile
@@ -270,6 +270,170 @@ def cmd_print_inputs(argv0, argv, lock="Lock: "):
 	return cmd_lock_inputs(argv0, argv, lock="Observe: ")
 
 
+def cmd_profiling(argv0, argv):
+	"""
+	Displays time spent in each action of profile
+	
+	Profiling has to be enabled first. Total time includes time spent in
+	child actions, self time doesn't.
+	
+	Usage: scc profiling [on|off|reset]
+	"""
+	if len(argv) > 1 or (argv and argv[0] not in ("on", "off", "reset")):
+		raise InvalidArguments()
+	s = connect_to_daemon()
+	if s is None: return -1
+	if argv:
+		print >>s, "Profiling: %s" % (argv[0],)
+		return 0 if check_error(s) else 1
+	
+	print >>s, "Profiling."
+	s.flush()
+	rows = []
+	while True:
+		line = s.readline()
+		if len(line) == 0:
+			print >>sys.stderr, "Connection closed"
+			return 1
+		line = line.strip("\n\r\t ")
+		if line.startswith("Profiling:"):
+			rows.append(line.split(" ", 4)[1:])
+		elif line.startswith("Fail:"):
+			print >>sys.stderr, line
+			return 1
+		elif line == "OK.":
+			break
+	
+	print "%10s %12s %12s  %s" % ("calls", "total (us)", "self (us)", "action")
+	for row in rows:
+		print "%10s %12s %12s  %s" % tuple(row)
+	return 0
+
+
+def cmd_stats(argv0, argv):
+	"""
+	Displays input latency measured by daemon
+	
+	Measuring has to be enabled first. Times are measured from moment when
+	daemon is woken up by incoming input to moment when events are sent to
+	virtual devices.
+	
+	Usage: scc stats [on|off|reset]
+	"""
+	if len(argv) > 1 or (argv and argv[0] not in ("on", "off", "reset")):
+		raise InvalidArguments()
+	s = connect_to_daemon()
+	if s is None: return -1
+	if argv:
+		print >>s, "Stats: %s" % (argv[0],)
+		return 0 if check_error(s) else 1
+	
+	print >>s, "Stats."
+	s.flush()
+	rows, dropped = [], []
+	while True:
+		line = s.readline()
+		if len(line) == 0:
+			print >>sys.stderr, "Connection closed"
+			return 1
+		line = line.strip("\n\r\t ")
+		if line.startswith("Stats:"):
+			rows.append(line.split(" ")[1:])
+		elif line.startswith("Dropped:"):
+			dropped.append(line.split(" ", 2)[1:])
+		elif line.startswith("Fail:"):
+			print >>sys.stderr, line
+			return 1
+		elif line == "OK.":
+			break
+	
+	print "%-10s %8s %10s %10s" % ("stage", "count", "avg (us)", "max (us)")
+	for row in rows:
+		print "%-10s %8s %10s %10s" % tuple(row[0:4])
+	print ""
+	print "%-10s" % ("< us",) + "".join([ " %9s" % (row[0],) for row in rows ])
+	for i in xrange(len(rows[0]) - 4 if rows else 0):
+		counts = [ row[4 + i] for row in rows ]
+		if any([ x != "0" for x in counts ]):
+			label = "%s" % (2 ** i,) if i < len(rows[0]) - 5 else "more"
+			print "%-10s" % (label,) + "".join([ " %9s" % (x,) for x in counts ])
+	if dropped:
+		print ""
+		print "%-20s %8s" % ("dropped", "count")
+		for what, count in dropped:
+			print "%-20s %8s" % (what, count)
+	return 0
+
+
+def cmd_record(argv0, argv):
+	"""
+	Records controller inputs into file
+	
+	Records inputs received from controller until interrupted with Ctrl+C.
+	Recording can be replayed later using 'scc replay'.
+	
+	Usage: scc record <filename>
+	
+	Return codes:
+		-1  - failed to connect to daemon
+		-2  - failed to start recording
+		-3  - connection terminated
+	"""
+	if len(argv) != 1:
+		raise InvalidArguments()
+	s = connect_to_daemon()
+	if s is None: return -1
+	try:
+		while True:
+			line = s.readline()
+			if line == "":
+				return -3
+			elif line.startswith("Ready."):
+				print >>s, "Record: %s" % (os.path.abspath(argv[0]),)
+				if not check_error(s): return -2
+				print >>sys.stderr, "Recording, press Ctrl+C to stop..."
+	finally:
+		s.close()
+
+
+def cmd_replay(argv0, argv):
+	"""
+	Replays recorded inputs and prints generated events
+	
+	Loads profile, feeds it with inputs recorded by 'scc record' and prints
+	every event that would be sent to virtual devices. Replay runs with
+	virtual clock, so output is same every time.
+	
+	Usage: scc replay [--tail seconds] <profile> <recording>
+	
+	Options:
+		--tail	how long should be scheduled actions executed after
+				last recorded frame. Defaults to 1 second.
+	"""
+	from scc.tools import find_profile
+	from scc.recorder import replay_file
+	tail = 1.0
+	if len(argv) >= 2 and argv[0] == "--tail":
+		try:
+			tail = float(argv[1])
+		except ValueError:
+			raise InvalidArguments()
+		argv = argv[2:]
+	if len(argv) != 2:
+		raise InvalidArguments()
+	filename = find_profile(argv[0]) if not os.path.exists(argv[0]) else argv[0]
+	if filename is None:
+		print >>sys.stderr, "Unknown profile:", argv[0]
+		return 1
+	try:
+		for event in replay_file(filename, argv[1], tail):
+			print "%.6f\t%s\t%s\t%s\t%s" % event
+	except (IOError, ValueError), e:
+		print >>sys.stderr, e
+		return 1
+	return 0
+
+
 def connect_to_daemon():
 	"""
 	Returns socket connected to daemon or None if connection failed.
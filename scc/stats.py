@@ -0,0 +1,292 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Stats
+
+LatencyStats measures how long it takes from moment when daemon wakes up
+with input available to moment when events are written to virtual devices.
+ActionProfiler measures how much time is spent in each action of profile.
+
+Measuring is done by wrapping methods on Poller, Mapper and Action
+instances, so there is no overhead at all while it is not enabled.
+
+Measured stages:
+	driver		- from poller waking up to Mapper.input being called.
+				  Includes libusb / evdev event handling and input decoding.
+	dispatch	- calling actions for changed inputs
+	scheduler	- running scheduled tasks
+	events		- generate_events, up to and including final synEvent
+	feedback	- generate_feedback
+	total		- from poller waking up to end of generate_events
+"""
+from scc.tools import nameof, wrap_method, unwrap_method
+from ctypes.util import find_library
+import ctypes, logging
+log = logging.getLogger("Stats")
+
+STAGES = ( "driver", "dispatch", "scheduler", "events", "feedback", "total" )
+# Bucket 'i' counts samples shorter than 2^i microseconds,
+# last bucket counts everything longer
+BUCKETS = 18
+
+CLOCK_MONOTONIC = 1
+
+
+class _timespec(ctypes.Structure):
+	_fields_ = [
+		('tv_sec', ctypes.c_long),
+		('tv_nsec', ctypes.c_long),
+	]
+
+
+_libc = ctypes.CDLL(find_library("c"))
+_ts = _timespec()
+_ts_ref = ctypes.byref(_ts)
+
+def monotonic():
+	""" Returns CLOCK_MONOTONIC time in seconds """
+	_libc.clock_gettime(CLOCK_MONOTONIC, _ts_ref)
+	return _ts.tv_sec + _ts.tv_nsec * 1e-9
+
+
+class Histogram(object):
+	__slots__ = ('count', 'total', 'max', 'buckets')
+	
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+		self.buckets = [ 0 ] * BUCKETS
+	
+	
+	def add(self, seconds):
+		self.count += 1
+		self.total += seconds
+		if seconds > self.max:
+			self.max = seconds
+		us = int(round(seconds * 1000000)) if seconds > 0 else 0
+		self.buckets[min(us.bit_length(), BUCKETS - 1)] += 1
+	
+	
+	def to_string(self):
+		"""
+		Returns 'count average_us max_us bucket0 ... bucketN'
+		"""
+		avg = self.total / self.count if self.count else 0.0
+		return " ".join([ str(self.count), "%.1f" % (avg * 1000000.0,),
+			"%.1f" % (self.max * 1000000.0,) ] + [ str(x) for x in self.buckets ])
+
+
+class LatencyStats(object):
+	"""
+	Collects per-stage latency histograms.
+	Use attach_poller and attach to start measuring, detach to stop.
+	"""
+	
+	def __init__(self):
+		self.histograms = { x : Histogram() for x in STAGES }
+		self._patched = []
+		self._mappers = set()
+		self._wakeup = None
+		self._input = None
+		self._stage = None
+	
+	
+	def reset(self):
+		self.histograms = { x : Histogram() for x in STAGES }
+	
+	
+	def _patch(self, obj, name, make_wrapper):
+		""" Wraps method on instance, remembering how to put it back """
+		self._patched.append(( obj, name, wrap_method(obj, name, make_wrapper) ))
+	
+	
+	def attach_poller(self, poller):
+		def make_wrapper(wait):
+			def wrapper(*a, **b):
+				rv = wait(*a, **b)
+				self._wakeup = monotonic()
+				return rv
+			return wrapper
+		
+		self._patch(poller, "wait", make_wrapper)
+	
+	
+	def attach(self, mapper):
+		""" Starts measuring on mapper. Does nothing if already attached """
+		if mapper in self._mappers:
+			return
+		self._mappers.add(mapper)
+		
+		def wrap_input(input):
+			def wrapper(*a):
+				t = self._stage = self._input = monotonic()
+				if self._wakeup is not None:
+					self.histograms["driver"].add(t - self._wakeup)
+				try:
+					return input(*a)
+				finally:
+					self._input = None
+			return wrapper
+		
+		def wrap_stage(method, name, previous=None):
+			def wrapper(*a):
+				if self._input is None:
+					# Called from outside of Mapper.input
+					return method(*a)
+				t = monotonic()
+				if previous:
+					self.histograms[previous].add(t - self._stage)
+				rv = method(*a)
+				self._stage = monotonic()
+				self.histograms[name].add(self._stage - t)
+				if name == "events" and self._wakeup is not None:
+					self.histograms["total"].add(self._stage - self._wakeup)
+				return rv
+			return wrapper
+		
+		self._patch(mapper, "input", wrap_input)
+		if not any([ x[0] is mapper.scheduler for x in self._patched ]):
+			# Scheduler is shared by all mappers
+			self._patch(mapper.scheduler, "run",
+				lambda m : wrap_stage(m, "scheduler", "dispatch"))
+		self._patch(mapper, "generate_events", lambda m : wrap_stage(m, "events"))
+		self._patch(mapper, "generate_feedback", lambda m : wrap_stage(m, "feedback"))
+	
+	
+	def detach(self):
+		""" Stops measuring, restoring all wrapped methods """
+		while self._patched:
+			obj, name, wrapper = self._patched.pop()
+			unwrap_method(obj, name, wrapper)
+		self._mappers = set()
+		self._wakeup = None
+	
+	
+	def report(self):
+		"""
+		Returns list of 'stage count average_us max_us bucket0 ... bucketN'
+		strings, one for each stage.
+		"""
+		return [ "%s %s" % (x, self.histograms[x].to_string()) for x in STAGES ]
+
+
+class ActionProfiler(object):
+	"""
+	Counts calls and time spent in every action of profile, including
+	child actions, by path like 'buttons.A -> mode -> button'.
+	Use attach to start measuring on mapper, detach to stop.
+	"""
+	# Methods called by mapper or by parent actions
+	HANDLERS = ( 'button_press', 'button_release', 'axis', 'pad', 'gyro',
+		'whole', 'whole_blocked', 'add', 'change', 'trigger' )
+	
+	def __init__(self):
+		self.entries = {}		# path -> [ calls, total time, self time, depth ]
+		self._patched = {}		# mapper -> list of (action, method name, original)
+		self._stack = []
+	
+	
+	def reset(self):
+		for entry in self.entries.values():
+			entry[0:3] = 0, 0.0, 0.0
+	
+	
+	def attach(self, mapper, profile=None):
+		"""
+		Starts measuring actions in profile used by mapper. If mapper is
+		already being measured, wrappers are removed from old profile first.
+		
+		'profile' can be used to measure profile that is not yet assigned
+		to mapper.
+		"""
+		self._restore(mapper)
+		profile = profile or mapper.profile
+		patched = self._patched[mapper] = []
+		seen = set()
+		for path, action in ActionProfiler._walk(profile):
+			if id(action) in seen:
+				# Same instance used in multiple places
+				continue
+			seen.add(id(action))
+			entry = self.entries.setdefault(path, [ 0, 0.0, 0.0, 0 ])
+			for name in ActionProfiler.HANDLERS:
+				method = getattr(action, name, None)
+				if method is not None:
+					patched.append(( action, name, action.__dict__.get(name) ))
+					setattr(action, name, self._wrap(method, entry))
+	
+	
+	def _wrap(self, method, entry):
+		stack = self._stack
+		def wrapper(*a, **b):
+			if entry[3]:
+				# Action calling its own handler; already measured
+				return method(*a, **b)
+			entry[3] = 1
+			stack.append(0.0)
+			t = monotonic()
+			try:
+				return method(*a, **b)
+			finally:
+				dt = monotonic() - t
+				children = stack.pop()
+				if stack: stack[-1] += dt
+				entry[0] += 1
+				entry[1] += dt
+				entry[2] += dt - children
+				entry[3] = 0
+		return wrapper
+	
+	
+	@staticmethod
+	def _walk(profile):
+		""" Yields (path, action) for every action in profile """
+		def walk(path, action, names):
+			if not action:
+				# NoAction
+				return
+			name = getattr(action, "COMMAND", None) or action.__class__.__name__
+			names[name] = names.get(name, 0) + 1
+			if names[name] > 1:
+				# Multiple children of same type
+				name = "%s#%s" % (name, names[name])
+			path = "%s -> %s" % (path, name)
+			yield path, action
+			names = {}
+			for child in action.get_child_actions():
+				for x in walk(path, child, names):
+					yield x
+		
+		for key, dct in (("buttons", profile.buttons),
+				("triggers", profile.triggers), ("pads", profile.pads)):
+			for k in dct:
+				for x in walk("%s.%s" % (key, nameof(k)), dct[k], {}):
+					yield x
+		for key in ("stick", "rstick", "gyro"):
+			for x in walk(key, getattr(profile, key), {}):
+				yield x
+	
+	
+	def _restore(self, mapper):
+		for action, name, original in reversed(self._patched.pop(mapper, ())):
+			if original is None:
+				delattr(action, name)
+			else:
+				setattr(action, name, original)
+	
+	
+	def detach(self):
+		""" Stops measuring, restoring all wrapped methods """
+		for mapper in list(self._patched):
+			self._restore(mapper)
+	
+	
+	def report(self):
+		"""
+		Returns list of 'calls total_us self_us path' strings, sorted by
+		total time spent in action. Actions never called are not included.
+		"""
+		entries = sorted([ (e[1], e[2], e[0], path)
+				for path, e in self.entries.items() if e[0] ], reverse=True)
+		return [ "%s %.1f %.1f %s" % (calls, total * 1000000.0, own * 1000000.0, path)
+				for total, own, calls, path in entries ]
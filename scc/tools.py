@@ -139,6 +139,42 @@ def shsplit(s):
 	return [ x.decode('utf-8') for x in list(lex) ]
 
 
+def wrap_method(obj, name, make_wrapper):
+	"""
+	Replaces method 'name' on instance 'obj' by make_wrapper(method).
+	Returns wrapper, which can be later removed by unwrap_method, even if
+	something else wrapped same method in meantime.
+	"""
+	# link = [ what was set on instance before, what wrapper calls ]
+	link = [ obj.__dict__.get(name), getattr(obj, name) ]
+	def call_next(*a, **b):
+		return link[1](*a, **b)
+	wrapper = make_wrapper(call_next)
+	wrapper._link = link
+	setattr(obj, name, wrapper)
+	return wrapper
+
+
+def unwrap_method(obj, name, wrapper):
+	"""
+	Removes wrapper set by wrap_method, leaving wrappers added by
+	anything else in place.
+	"""
+	current = obj.__dict__.get(name)
+	if current is wrapper:
+		if wrapper._link[0] is None:
+			delattr(obj, name)
+		else:
+			setattr(obj, name, wrapper._link[0])
+		return
+	while hasattr(current, "_link"):
+		if current._link[0] is wrapper:
+			# Wrapper added later calls this one, make it skip it
+			current._link[:] = wrapper._link
+			return
+		current = current._link[0]
+
+
 def static_vars(**kwargs):
 	"""Static variable func decorator"""
 
@@ -315,10 +351,10 @@ def find_binary(name):
 	return name
 
 
-def find_library(libname):
+def find_library(libname, loader=ctypes.CDLL):
 	"""
 	Search for 'libname.so'.
-	Returns library loaded with ctypes.CDLL
+	Returns library loaded with ctypes.CDLL, or with 'loader' if set.
 	Raises OSError if library is not found
 	"""
 	base_path = os.path.dirname(__file__)
@@ -341,7 +377,7 @@ def find_library(libname):
 	if not lib:
 		raise OSError('Cant find %s.so. searched at:\n %s' % (
 			libname, '\n'.join(search_paths)))
-	return ctypes.CDLL(lib)
+	return loader(lib)
 
 
 def find_gksudo():
@@ -34,8 +34,9 @@
 #include <unistd.h>
 
 #pragma GCC diagnostic ignored "-Wunused-result"
-#define UNPUT_MODULE_VERSION 9
+#define UNPUT_MODULE_VERSION 10
 #define MAX_FF_EVENTS 4
+#define EVENT_BUFFER_SIZE 128
 
 #define INFINITE_RUMBLE		10000		// Not really infinite, but longer than controller can handle
 
@@ -49,6 +50,15 @@ struct feedback_effect {
 	int16_t level;
 };
 
+/**
+ * Events generated for one device are stored here and written by single
+ * write() call in uinput_flush.
+ */
+struct event_buffer {
+	int count;
+	struct input_event events[EVENT_BUFFER_SIZE];
+};
+
 int uinput_init(
 	int	 key_len,
 	__u16 * key,
@@ -178,48 +188,46 @@ const int uinput_module_version(void) {
 	return UNPUT_MODULE_VERSION;
 }
 
-void uinput_key(int fd, __u16 key, __s32 val)
+int uinput_flush(int fd, struct event_buffer* buffer)
 {
-	struct input_event ev;
-
-	memset(&ev, 0, sizeof(ev));
-	ev.type = EV_KEY;
-	ev.code = key;
-	ev.value = val;
-	write(fd, &ev, sizeof(ev));
+	int rv = 0;
+	if (buffer->count > 0) {
+		rv = write(fd, buffer->events, sizeof(struct input_event) * buffer->count);
+		buffer->count = 0;
+	}
+	return rv;
 }
 
-void uinput_abs(int fd, __u16 abs, __s32 val)
+static void uinput_buffer(int fd, struct event_buffer* buffer, __u16 type, __u16 code, __s32 val)
 {
-	struct input_event ev;
-
-	memset(&ev, 0, sizeof(ev));
-	ev.type = EV_ABS;
-	ev.code = abs;
-	ev.value = val;
-	write(fd, &ev, sizeof(ev));
+	struct input_event* ev;
+	if (buffer->count >= EVENT_BUFFER_SIZE)
+		uinput_flush(fd, buffer);
+	ev = &buffer->events[buffer->count++];
+	memset(ev, 0, sizeof(struct input_event));
+	ev->type = type;
+	ev->code = code;
+	ev->value = val;
 }
 
-void uinput_rel(int fd, __u16 rel, __s32 val)
+void uinput_key(int fd, struct event_buffer* buffer, __u16 key, __s32 val)
 {
-	struct input_event ev;
+	uinput_buffer(fd, buffer, EV_KEY, key, val);
+}
 
-	memset(&ev, 0, sizeof(ev));
-	ev.type = EV_REL;
-	ev.code = rel;
-	ev.value = val;
-	write(fd, &ev, sizeof(ev));
+void uinput_abs(int fd, struct event_buffer* buffer, __u16 abs, __s32 val)
+{
+	uinput_buffer(fd, buffer, EV_ABS, abs, val);
 }
 
-void uinput_scan(int fd, __s32 val)
+void uinput_rel(int fd, struct event_buffer* buffer, __u16 rel, __s32 val)
 {
-	struct input_event ev;
+	uinput_buffer(fd, buffer, EV_REL, rel, val);
+}
 
-	memset(&ev, 0, sizeof(ev));
-	ev.type = EV_MSC;
-	ev.code = MSC_SCAN;
-	ev.value = val;
-	write(fd, &ev, sizeof(ev));
+void uinput_scan(int fd, struct event_buffer* buffer, __s32 val)
+{
+	uinput_buffer(fd, buffer, EV_MSC, MSC_SCAN, val);
 }
 
 void uinput_set_delay_period(int fd, __s32 delay, __s32 period)
@@ -236,15 +244,9 @@ void uinput_set_delay_period(int fd, __s32 delay, __s32 period)
 	write(fd, &ev, sizeof(ev));
 }
 
-void uinput_syn(int fd)
+void uinput_syn(int fd, struct event_buffer* buffer)
 {
-	struct input_event ev;
-
-	memset(&ev, 0, sizeof(ev));
-	ev.type = EV_SYN;
-	ev.code = SYN_REPORT;
-	ev.value = 0;
-	write(fd, &ev, sizeof(ev));
+	uinput_buffer(fd, buffer, EV_SYN, SYN_REPORT, 0);
 }
 
 // #define RUMBLE_DEBUG(...) do { printf(__VA_ARGS__); } while (0)
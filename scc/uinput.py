@@ -30,7 +30,7 @@ from scc.tools import find_library
 from scc.cheader import defines
 from scc.lib import IntEnum
 
-UNPUT_MODULE_VERSION = 9
+UNPUT_MODULE_VERSION = 10
 
 # Get All defines from linux headers
 if os.path.exists('/usr/include/linux/input-event-codes.h'):
@@ -41,6 +41,7 @@ else:
 	CHEAD = defines('/usr/include', 'linux/input.h')
 
 MAX_FEEDBACK_EFFECTS = 4
+EVENT_BUFFER_SIZE = 128
 
 # Keys enum contains all keys and button from linux/uinput.h (KEY_* BTN_*)
 Keys = IntEnum('Keys', {i: CHEAD[i] for i in CHEAD.keys() if (i.startswith('KEY_') or
@@ -183,6 +184,12 @@ class InputEvent(ctypes.Structure):
 		('value', c_int32)
 	]
 
+class EventBuffer(ctypes.Structure):
+	_fields_ = [
+		('count', ctypes.c_int),
+		('events', InputEvent * EVENT_BUFFER_SIZE),
+	]
+
 class FeedbackEvent(ctypes.Structure):
 	_fields_ = [
 		('in_use', c_bool),
@@ -202,6 +209,9 @@ class UInput(object):
 	"""
 	UInput class permits to create a uinput device.
 
+	Generated events are stored in buffer and written to device only
+	when flush() is called.
+
 	See Gamepad, Mouse, Keyboard for examples
 	"""
 
@@ -218,6 +228,12 @@ class UInput(object):
 		self._r = rels
 		
 		self._lib = find_library("libuinput")
+		# Library loaded for 2nd time, this time without releasing GIL.
+		# Used to fill event buffer, so it can be done from any thread.
+		self._blib = find_library("libuinput", ctypes.PyDLL)
+		self._buffer = EventBuffer()
+		self._buffer_ref = byref(self._buffer)
+		self._dirty = False
 		self._ff_events = None
 		if rumble:
 			self._ff_events = (POINTER(FeedbackEvent) * MAX_FEEDBACK_EFFECTS)()
@@ -266,6 +282,14 @@ class UInput(object):
 										 c_name)
 		if self._fd < 0:
 			raise CannotCreateUInputException("Failed to create uinput device. Error code: %s" % (self._fd,))
+		
+		buf = POINTER(EventBuffer)
+		self._blib.uinput_key.argtypes = [ ctypes.c_int, buf, c_uint16, c_int32 ]
+		self._blib.uinput_abs.argtypes = [ ctypes.c_int, buf, c_uint16, c_int32 ]
+		self._blib.uinput_rel.argtypes = [ ctypes.c_int, buf, c_uint16, c_int32 ]
+		self._blib.uinput_scan.argtypes = [ ctypes.c_int, buf, c_int32 ]
+		self._blib.uinput_syn.argtypes = [ ctypes.c_int, buf ]
+		self._blib.uinput_flush.argtypes = [ ctypes.c_int, buf ]
 
 
 	def getDescriptor(self):
@@ -279,9 +303,8 @@ class UInput(object):
 		@param int axis		 key or btn event (KEY_* or BTN_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_key(self._fd,
-							 ctypes.c_uint16(key),
-							 ctypes.c_int32(val))
+		self._blib.uinput_key(self._fd, self._buffer_ref, key, val)
+		self._dirty = True
 
 
 	def axisEvent(self, axis, val):
@@ -291,9 +314,8 @@ class UInput(object):
 		@param int axis		 abs event (ABS_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_abs(self._fd,
-							 ctypes.c_uint16(axis),
-							 ctypes.c_int32(val))
+		self._blib.uinput_abs(self._fd, self._buffer_ref, axis, val)
+		self._dirty = True
 
 	def relEvent(self, rel, val):
 		"""
@@ -302,9 +324,8 @@ class UInput(object):
 		@param int rel		  rel event (REL_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_rel(self._fd,
-							 ctypes.c_uint16(rel),
-							 ctypes.c_int32(val))
+		self._blib.uinput_rel(self._fd, self._buffer_ref, rel, val)
+		self._dirty = True
 
 	def scanEvent(self, val):
 		"""
@@ -312,14 +333,24 @@ class UInput(object):
 
 		@param int val		  scan event value (scancode)
 		"""
-		self._lib.uinput_scan(self._fd,
-							  ctypes.c_int32(val))
+		self._blib.uinput_scan(self._fd, self._buffer_ref, val)
+		self._dirty = True
 
 	def synEvent(self):
 		"""
 		Generate a syn event
 		"""
-		self._lib.uinput_syn(self._fd)
+		self._blib.uinput_syn(self._fd, self._buffer_ref)
+		self._dirty = True
+
+	def flush(self):
+		"""
+		Writes all buffered events to device using single write() call.
+		Does nothing if there is nothing buffered.
+		"""
+		if self._dirty:
+			self._dirty = False
+			self._blib.uinput_flush(self._fd, self._buffer_ref)
 
 
 	def setDelayPeriod(self, delay, period):
@@ -475,20 +506,16 @@ class Mouse(UInput):
 		@param int dx		   delta movement from last call on x axis
 		@param int dy		   delta movement from last call on y axis
 
+		Caller is responsible for generating syn event afterwards.
 		"""
 		self._dx += dx * self._xscale
 		self._dy += dy * self._yscale
-		_syn = False
 		if int(self._dx):
 			self.relEvent(rel=Rels.REL_X, val=int(self._dx))
 			self._dx -= int(self._dx)
-			_syn = True
 		if int(self._dy):
 			self.relEvent(rel=Rels.REL_Y, val=int(self._dy))
 			self._dy -= int(self._dy)
-			_syn = True
-		if _syn:
-			self.synEvent()
 
 	def scrollEvent(self, dx=0, dy=0):
 		"""
@@ -499,21 +526,17 @@ class Mouse(UInput):
 
 		@return float		   absolute distance moved this tick
 
+		Caller is responsible for generating syn event afterwards.
 		"""
 		# Compute mouse mouvement from interger part of d * scale
 		self._scr_dx += dx * self._scr_xscale
 		self._scr_dy += dy * self._scr_yscale
-		_syn = False
 		if int(self._scr_dx):
 			self.relEvent(rel=Rels.REL_HWHEEL, val=int(copysign(1, self._scr_dx)))
 			self._scr_dx -= int(self._scr_dx)
-			_syn = True
 		if int(self._scr_dy):
 			self.relEvent(rel=Rels.REL_WHEEL,  val=int(copysign(1, self._scr_dy)))
 			self._scr_dy -= int(self._scr_dy)
-			_syn = True
-		if _syn:
-			self.synEvent()
 
 
 class Keyboard(UInput):
@@ -589,6 +612,7 @@ class Dummy(object):
 	relEvent = keyEvent
 	scanEvent = keyEvent
 	synEvent = keyEvent
+	flush = keyEvent
 	setDelayPeriod = keyEvent
 	updateParams = keyEvent
 	updateScrollParams = keyEvent
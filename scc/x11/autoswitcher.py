@@ -3,6 +3,10 @@
 SC-Controller - Autoswitch Daemon
 
 Observes active window and commands scc-daemon to change profiles as needed.
+
+Active window and its title are not polled, but watched using PropertyNotify
+events on root window and on window that has focus. Polling every INTERVAL
+is used only as fallback if window manager doesn't set _NET_ACTIVE_WINDOW.
 """
 from __future__ import unicode_literals
 from scc.tools import _
@@ -16,15 +20,29 @@ from scc.tools import find_profile
 from scc.actions import Action
 from scc.mapper import Mapper
 from scc.config import Config
+from collections import OrderedDict, deque
+from ctypes import byref
 
-import os, sys, re, time, socket, traceback, threading, logging
+import os, sys, re, time, socket, select, traceback, threading, logging
 log = logging.getLogger("AutoSwitcher")
 
 class AutoSwitcher(object):
 	INTERVAL = 1
+	# Properties of focused window that may change its title
+	TITLE_PROPERTIES = ("_NET_WM_NAME", "WM_NAME")
 	
 	def __init__(self):
 		self.dpy = X.open_display(os.environ["DISPLAY"])
+		self.root = X.get_default_root_window(self.dpy)
+		self.event = X.XEvent()
+		self.active_window_atom = X.intern_atom(self.dpy, b"_NET_ACTIVE_WINDOW", False)
+		self.title_atoms = set([ X.intern_atom(self.dpy, x.encode("ascii"), False)
+				for x in self.TITLE_PROPERTIES ])
+		# Windows may be destroyed before they are checked, errors about
+		# that have to be ignored instead of killing process
+		self._error_handler = X.ERROR_HANDLER(lambda *a: 0)
+		X.set_error_handler(self._error_handler)
+		self.wakeup_r, self.wakeup_w = os.pipe()
 		self.lock = threading.Lock()
 		self.thread = threading.Thread(target=self.connect_daemon)
 		self.config = Config()
@@ -36,14 +54,20 @@ class AutoSwitcher(object):
 		self.exit_code = None
 		self.current_profile = None
 		self.current_window = None
+		self.current_title = None
+		self.recheck = False	# Set when window has to be matched again
 		self.conds = AutoSwitcher.parse_conditions(self.config)
+		self.matcher = ConditionMatcher(self.conds)
 	
 	
 	@staticmethod
 	def parse_conditions(config):
-		""" Parses conditions from config """
+		"""
+		Parses conditions from config.
+		Returns OrderedDict, order of conditions is their priority.
+		"""
 		parser = TalkingActionParser()
-		conds = {}
+		conds = OrderedDict()
 		for c in config['autoswitch']:
 			try:
 				astr = c['action']
@@ -111,38 +135,84 @@ class AutoSwitcher(object):
 				elif line.startswith("Current profile:"):
 					profile = line.split(":", 1)[-1].strip()
 					log.debug("Daemon reported profile change: %s", profile)
+					if self.current_profile is None:
+						# Window was not checked until profile is known.
+						# Later changes are not rechecked, so user can
+						# switch profile by hand.
+						self.recheck = True
 					self.current_profile = profile
 				elif line.startswith("Reconfigured."):
 					log.debug("Reloading config...")
 					self.config = Config()
 					self.conds = AutoSwitcher.parse_conditions(self.config)
+					self.matcher = ConditionMatcher(self.conds)
+					self.recheck = True
 				elif line.startswith("Controller Count:"):
 					self.enabled = int(line.split(":")[-1]) > 0
 					log.debug("Enabled: %s", self.enabled)
 			
 			self.lock.release()
+			# Wakes up main thread, so it can check window if it's now enabled
+			# or if profile or conditions changed
+			os.write(self.wakeup_w, b"\x00")
+	
+	
+	def watch_window(self, w):
+		"""
+		Stops watching properties of previously focused window
+		and starts watching for title changes of new one.
+		"""
+		if self.current_window and self.current_window != self.root:
+			X.select_input(self.dpy, self.current_window, X.NOEVENTMASK)
+		if w and w != self.root:
+			X.select_input(self.dpy, w, X.PROPERTYCHANGEMASK)
+		X.flush(self.dpy)
+	
+	
+	def process_events(self):
+		"""
+		Processes all queued X events.
+		Returns True if active window or its title may have changed.
+		"""
+		changed = False
+		while X.pending(self.dpy):
+			X.next_event(self.dpy, byref(self.event))
+			if self.event.type == X.PROPERTYNOTIFY:
+				atom = self.event.xproperty.atom
+				if self.event.xproperty.window == self.root:
+					changed = changed or atom == self.active_window_atom
+				else:
+					changed = changed or atom in self.title_atoms
+		return changed
 	
 	
 	def check(self, *a):
-		w = X.get_current_window(self.dpy)
-		if w == self.current_window or not self.current_profile:
-			# Window not switched or profile is not known yet
+		if not self.current_profile:
+			# Profile is not known yet
 			return
-		self.current_window = w
-		log.debug("Window switched: %s", w)
+		w = X.get_current_window(self.dpy)
+		if w != self.current_window:
+			log.debug("Window switched: %s", w)
+			self.watch_window(w)
+			self.current_window = w
+			self.current_title = None
+		
 		pars = X.get_window_title(self.dpy, w), X.get_window_class(self.dpy, w)
-
-                if pars[0] is None:
-                        pars = ("",pars[1])
-
-                if pars[1] is None:
-                        pars = (pars[0], ("",""))
-
-		for c in self.conds:
-			if c.matches(*pars):
-				action = self.conds[c]
-				action.button_press(self.mapper)
-				action.button_release(self.mapper)
+		if pars[0] is None:
+			pars = ("", pars[1])
+		if pars[1] is None:
+			pars = (pars[0], ("", ""))
+		with self.lock:
+			recheck, self.recheck = self.recheck, False
+		if pars[0] == self.current_title and not recheck:
+			# Neither window nor its title changed, nor profile or conditions
+			return
+		self.current_title = pars[0]
+		
+		action = self.matcher.match(*pars)
+		if action:
+			action.button_press(self.mapper)
+			action.button_release(self.mapper)
 	
 	
 	def on_sa_profile(self, mapper, action):
@@ -191,11 +261,31 @@ class AutoSwitcher(object):
 	
 	def run(self):
 		self.thread.start()
+		X.select_input(self.dpy, self.root, X.PROPERTYCHANGEMASK)
+		X.flush(self.dpy)
+		trash, prop = X.get_window_prop(self.dpy, self.root, b"_NET_ACTIVE_WINDOW")
+		if prop is not None and prop.value is not None:
+			X.free(prop)
+			timeout = None
+		else:
+			log.warning("_NET_ACTIVE_WINDOW not supported, falling back to polling")
+			timeout = self.INTERVAL
+		
+		fds = [ X.connection_number(self.dpy), self.wakeup_r ]
+		woken = False
 		log.debug("AutoSwitcher started")
 		while self.exit_code is None:
-			if self.enabled:
+			changed = self.process_events()
+			if (changed or woken or timeout is not None) and self.enabled:
 				self.check()
-			time.sleep(self.INTERVAL)
+			woken = False
+			if X.pending(self.dpy):
+				# check() may have received more events while talking to XServer
+				continue
+			readable, trash, trash = select.select(fds, [], [], timeout)
+			if self.wakeup_r in readable:
+				os.read(self.wakeup_r, 1024)
+				woken = True
 		return 1
 
 
@@ -221,7 +311,7 @@ class Condition(object):
 		if type(self.regexp) in (str, unicode):
 			self.regexp = re.compile(self.regexp)
 		self.wm_class = wm_class
-		self.empty = not ( title or title or regexp or wm_class )
+		self.empty = not ( exact_title or title or regexp or wm_class )
 	
 	
 	def __str__(self):
@@ -301,6 +391,165 @@ class Condition(object):
 		return True
 
 
+class SubstringAutomaton(object):
+	"""
+	Aho-Corasick automaton. Finds all patterns contained in string
+	with single pass over that string.
+	"""
+	
+	def __init__(self, patterns):
+		""" 'patterns' is iterable of (pattern, value) tuples """
+		self.goto = [ {} ]
+		self.fail = [ 0 ]
+		self.out = [ [] ]
+		for pattern, value in patterns:
+			state = 0
+			for ch in pattern:
+				if ch not in self.goto[state]:
+					self.goto.append({})
+					self.fail.append(0)
+					self.out.append([])
+					self.goto[state][ch] = len(self.goto) - 1
+				state = self.goto[state][ch]
+			self.out[state].append(value)
+		
+		# Failure links, computed breadth-first
+		queue = deque(self.goto[0].values())
+		while queue:
+			state = queue.popleft()
+			for ch, next in self.goto[state].items():
+				queue.append(next)
+				f = self.fail[state]
+				while f and ch not in self.goto[f]:
+					f = self.fail[f]
+				self.fail[next] = self.goto[f].get(ch, 0)
+				self.out[next] = self.out[next] + self.out[self.fail[next]]
+	
+	
+	def search(self, text):
+		""" Returns set of values of all patterns found in text """
+		goto, fail, out = self.goto, self.fail, self.out
+		rv = set()
+		state = 0
+		for ch in text:
+			while state and ch not in goto[state]:
+				state = fail[state]
+			state = goto[state].get(ch, 0)
+			if out[state]:
+				rv.update(out[state])
+		return rv
+
+
+class ConditionMatcher(object):
+	"""
+	Finds first matching condition without evaluating all of them.
+	
+	Every condition is indexed by one of its parts; exact title and
+	window class are looked up in dicts, title substrings are searched for
+	using Aho-Corasick automaton and regular expressions are combined
+	into few alternations. Conditions found this way are then checked
+	in order of priority and first one that really matches wins.
+	"""
+	CACHE_SIZE = 256
+	MAX_GROUPS = 99		# Python's re module supports only 100 groups
+	# Regexps with backreferences, named groups or inline flags
+	# cannot be safely combined with others
+	UNSAFE_RE = re.compile(r"\\[1-9]|\(\?P|\(\?\(|\(\?[iLmsux]")
+	
+	def __init__(self, conds):
+		"""
+		'conds' is (ordered) dict of condition: action, as returned
+		by AutoSwitcher.parse_conditions. Order determines priority.
+		"""
+		self.conditions = []
+		self.actions = []
+		self.by_exact_title = {}
+		self.by_class = {}
+		self.unindexed = []
+		self.regexps = []
+		self._cache = {}
+		substrings = []
+		regexps = []
+		for c in conds:
+			if c.empty:
+				continue
+			index = len(self.conditions)
+			self.conditions.append(c)
+			self.actions.append(conds[c])
+			if c.exact_title:
+				self.by_exact_title.setdefault(c.exact_title, []).append(index)
+			elif c.wm_class:
+				self.by_class.setdefault(c.wm_class, []).append(index)
+			elif c.title:
+				substrings.append(( c.title, index ))
+			elif c.regexp.flags or ConditionMatcher.UNSAFE_RE.search(c.regexp.pattern):
+				self.unindexed.append(index)
+			else:
+				regexps.append(( c.regexp, index ))
+		self.substrings = SubstringAutomaton(substrings) if substrings else None
+		self._combine_regexps(regexps)
+	
+	
+	def _combine_regexps(self, regexps):
+		"""
+		Joins regexps into as few alternations as group limit allows.
+		Alternatives are tried from left to right, so first one that
+		matches belongs to condition with highest priority.
+		"""
+		while regexps:
+			patterns, groups, count = [], [], 0
+			while regexps and count + regexps[0][0].groups + 1 <= self.MAX_GROUPS:
+				regexp, index = regexps.pop(0)
+				patterns.append("(%s)" % (regexp.pattern,))
+				groups.append(( count + 1, index ))
+				count += regexp.groups + 1
+			if not patterns:
+				# Single regexp with too many groups
+				self.unindexed.append(regexps.pop(0)[1])
+				continue
+			try:
+				combined = re.compile("(?:%s)" % ("|".join(patterns),))
+			except (re.error, AssertionError):
+				self.unindexed += [ index for (trash, index) in groups ]
+				continue
+			self.regexps.append(( combined, groups ))
+	
+	
+	def match(self, window_title, wm_class):
+		"""
+		Returns action of first condition that matches provided window
+		properties, or None if there is no such condition.
+		"""
+		key = window_title, wm_class
+		if key in self._cache:
+			return self._cache[key]
+		
+		candidates = set(self.unindexed)
+		candidates.update(self.by_exact_title.get(window_title, ()))
+		for cls in set(wm_class):
+			candidates.update(self.by_class.get(cls, ()))
+		if self.substrings:
+			candidates.update(self.substrings.search(window_title))
+		for combined, groups in self.regexps:
+			m = combined.match(window_title)
+			if m:
+				for group, index in groups:
+					if m.start(group) >= 0:
+						candidates.add(index)
+						break
+		
+		rv = None
+		for index in sorted(candidates):
+			if self.conditions[index].matches(window_title, wm_class):
+				rv = self.actions[index]
+				break
+		
+		if len(self._cache) >= self.CACHE_SIZE:
+			self._cache = {}
+		self._cache[key] = rv
+		return rv
+
+
 class AutoswitchOptsMenuGenerator(MenuGenerator):
 	""" Generates entire Autoswich Options submenu """
 	GENERATOR_NAME = "autoswitch"
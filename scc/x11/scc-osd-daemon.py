@@ -29,11 +29,14 @@ from scc.osd.area import Area
 from scc.special_actions import OSDAction
 from scc.tools import shsplit, shjoin
 from scc.config import Config
+from collections import OrderedDict
 
 import os, sys, logging, time, traceback
 log = logging.getLogger("osd.daemon")
 
 class OSDDaemon(object):
+	MAX_POOLED_MENUS = 8
+	
 	def __init__(self):
 		self.exit_code = -1
 		self.mainloop = GLib.MainLoop()
@@ -46,6 +49,11 @@ class OSDDaemon(object):
 		self._registered = False
 		self._last_profile_change = 0
 		self._recent_profiles_undo = None
+		# Menus kept after they were closed, so they don't have to be built
+		# again next time. Maps message to (menu, mtime of menu source)
+		self._menu_pool = OrderedDict()
+		self._menu_generation = 0	# Increased every time pool is invalidated
+		self._to_prewarm = []
 	
 	
 	def quit(self, code=-1):
@@ -61,9 +69,11 @@ class OSDDaemon(object):
 		log.debug("Reloading config...")
 		self.config.reload()
 		self._check_colorconfig_change()
+		self.invalidate_menus()
 	
 	
 	def on_profile_changed(self, daemon, profile):
+		self.invalidate_menus(profile)
 		name = os.path.split(profile)[-1]
 		if name.endswith(".sccprofile") and not name.startswith("."):
 			# Ignore .mod and hidden files
@@ -121,6 +131,20 @@ class OSDDaemon(object):
 				lambda *a : False, lambda *a : False)
 	
 	
+	def on_pooled_menu_closed(self, m, message, generation):
+		""" Called after reusable menu is hidden """
+		self.on_menu_closed(m)
+		mtime = self._get_menu_mtime(m)
+		if (m.can_be_reused() and mtime is not None and message not in self._menu_pool
+				and generation == self._menu_generation):
+			self._menu_pool[message] = m, mtime
+			while len(self._menu_pool) > self.MAX_POOLED_MENUS:
+				old, trash = self._menu_pool.popitem(last=False)[1]
+				old.destroy()
+		else:
+			m.destroy()
+	
+	
 	def on_message_closed(self, m):
 		hsh = m.hash()
 		if hsh in self._visible_messages:
@@ -142,6 +166,102 @@ class OSDDaemon(object):
 			self.daemon.request('Gestured: x', lambda *a : False, lambda *a : False)
 	
 	
+	@staticmethod
+	def _get_menu_mtime(m):
+		"""
+		Returns modification time of file menu was loaded from
+		or None if menu is not loaded from file.
+		"""
+		filename = m.args.from_profile or m.args.from_file
+		try:
+			return os.path.getmtime(filename) if filename else None
+		except OSError:
+			return None
+	
+	
+	@staticmethod
+	def _create_menu(message):
+		""" Creates (empty) menu window of type matching message """
+		if message.startswith("OSD: hmenu"):
+			return HorizontalMenu()
+		elif message.startswith("OSD: radialmenu"):
+			return RadialMenu()
+		elif message.startswith("OSD: quickmenu"):
+			return QuickMenu()
+		elif message.startswith("OSD: gridmenu"):
+			return GridMenu()
+		elif message.startswith("OSD: dialog"):
+			return Dialog()
+		return Menu()
+	
+	
+	@staticmethod
+	def _is_reusable_message(message, args):
+		""" Returns True if menu created from message may be pooled """
+		if message.startswith("OSD: dialog"):
+			return False
+		return any([ x in args for x in ("--from-profile", "-p", "--from-file", "-f") ])
+	
+	
+	def _show_pooled_menu(self, message):
+		"""
+		Displays already built menu for message, if there is one in pool.
+		Returns False if there is no such menu or if it's outdated.
+		"""
+		if message not in self._menu_pool:
+			return False
+		m, mtime = self._menu_pool.pop(message)
+		if self._get_menu_mtime(m) != mtime:
+			m.destroy()
+			return False
+		self._window = m
+		self._window.show()
+		self._window.use_daemon(self.daemon)
+		return True
+	
+	
+	def invalidate_menus(self, profile=None):
+		"""
+		Destroys all pooled menus and schedules building them again in
+		background. If 'profile' is set, only menus loaded from that
+		profile and from menu files are built again.
+		"""
+		to_prewarm = [] + self._to_prewarm
+		for message, (m, trash) in self._menu_pool.items():
+			if profile is None or m.args.from_file or m.args.from_profile == profile:
+				to_prewarm.append(message)
+			m.destroy()
+		self._menu_pool = OrderedDict()
+		self._menu_generation += 1
+		if to_prewarm and not self._to_prewarm:
+			GLib.idle_add(self._prewarm_next)
+		self._to_prewarm = to_prewarm
+	
+	
+	def _prewarm_next(self, *a):
+		""" Builds one menu scheduled by invalidate_menus """
+		if not self._to_prewarm:
+			return False
+		message = self._to_prewarm.pop(0)
+		if message not in self._menu_pool:
+			m = self._create_menu(message)
+			m.set_reusable()
+			m.use_config(self.config)
+			try:
+				ok = m.parse_argumets(shsplit(message)[1:]) and m.can_be_reused()
+			except Exception:
+				log.error(traceback.format_exc())
+				ok = False
+			mtime = self._get_menu_mtime(m) if ok else None
+			if mtime is None:
+				m.destroy()
+			else:
+				m.connect('closed', self.on_pooled_menu_closed,
+					message, self._menu_generation)
+				self._menu_pool[message] = m, mtime
+		return len(self._to_prewarm) > 0
+	
+	
 	@staticmethod
 	def _is_menu_message(m):
 		"""
@@ -205,20 +325,14 @@ class OSDDaemon(object):
 			args = shsplit(message)[1:]
 			if self._window:
 				log.warning("Another OSD is already visible - refusing to show menu")
-			else:
-				if message.startswith("OSD: hmenu"):
-					self._window = HorizontalMenu()
-				elif message.startswith("OSD: radialmenu"):
-					self._window = RadialMenu()
-				elif message.startswith("OSD: quickmenu"):
-					self._window = QuickMenu()
-				elif message.startswith("OSD: gridmenu"):
-					self._window = GridMenu()
-				elif message.startswith("OSD: dialog"):
-					self._window = Dialog()
+			elif not self._show_pooled_menu(message):
+				self._window = self._create_menu(message)
+				if self._is_reusable_message(message, args):
+					self._window.set_reusable()
+					self._window.connect('closed', self.on_pooled_menu_closed,
+						message, self._menu_generation)
 				else:
-					self._window = Menu()
-				self._window.connect('destroy', self.on_menu_closed)
+					self._window.connect('destroy', self.on_menu_closed)
 				self._window.use_config(self.config)
 				try:
 					if self._window.parse_argumets(args):
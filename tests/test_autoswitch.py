@@ -0,0 +1,77 @@
+from scc.x11.autoswitcher import Condition, ConditionMatcher, SubstringAutomaton
+from collections import OrderedDict
+import random
+
+
+def linear(conds, title, wm_class):
+	""" Returns action of first matching condition, the slow way """
+	for c in conds:
+		if c.matches(title, wm_class):
+			return conds[c]
+	return None
+
+
+class TestConditionMatcher(object):
+	
+	def test_automaton(self):
+		""" Tests if all overlapping substrings are found """
+		a = SubstringAutomaton([ ("he", 1), ("she", 2), ("his", 3), ("hers", 4), ("x", 5) ])
+		assert a.search("ushers") == { 1, 2, 4 }
+		assert a.search("ahishe") == { 1, 2, 3 }
+		assert a.search("nothing") == set()
+	
+	
+	def test_priority(self):
+		""" Tests if first matching condition wins, whatever is it indexed by """
+		conds = OrderedDict()
+		conds[Condition(title="Game", wm_class="other")] = "a"
+		conds[Condition(regexp="^Game.*")] = "b"
+		conds[Condition(wm_class="game")] = "c"
+		conds[Condition(exact_title="Game 2")] = "d"
+		m = ConditionMatcher(conds)
+		assert m.match("Game 2", ("game", "Game")) == "b"
+		del conds[conds.keys()[1]]
+		m = ConditionMatcher(conds)
+		assert m.match("Game 2", ("game", "Game")) == "c"
+		assert m.match("Game 2", ("other", "Other")) == "a"
+		assert m.match("Game 2", ("xterm", "XTerm")) == "d"
+		assert m.match("Nothing", ("xterm", "XTerm")) is None
+	
+	
+	def test_unsafe_regexps(self):
+		""" Tests regexps that cannot be combined with others """
+		conds = OrderedDict()
+		conds[Condition(regexp=r"^(a+)-\1$")] = "backref"
+		conds[Condition(regexp=r"(?i)^game$")] = "flags"
+		conds[Condition(regexp="(" * 60 + "x" + ")" * 60)] = "groups"
+		conds[Condition(regexp="(" * 60 + "y" + ")" * 60)] = "groups2"
+		conds[Condition(regexp=r"^plain")] = "plain"
+		m = ConditionMatcher(conds)
+		assert m.match("aa-aa", (None, None)) == "backref"
+		assert m.match("aa-a", (None, None)) is None
+		assert m.match("GAME", (None, None)) == "flags"
+		assert m.match("x", (None, None)) == "groups"
+		assert m.match("y", (None, None)) == "groups2"
+		assert m.match("plain", (None, None)) == "plain"
+	
+	
+	def test_same_as_linear(self):
+		""" Tests if matcher gives same results as evaluating every condition """
+		rnd = random.Random(1)
+		words = [ "a", "b", "ab", "ba", "aba" ]
+		conds = OrderedDict()
+		for i in xrange(300):
+			kw = {}
+			for key in rnd.sample(("exact_title", "title", "regexp", "wm_class"), rnd.randint(1, 2)):
+				if key == "regexp":
+					kw[key] = rnd.choice(words) + rnd.choice(("", ".*", "$", "b?$"))
+				else:
+					kw[key] = rnd.choice(words)
+			conds[Condition(**kw)] = i
+		m = ConditionMatcher(conds)
+		for i in xrange(500):
+			title = "".join([ rnd.choice(words) for x in xrange(rnd.randint(0, 3)) ])
+			wm_class = rnd.choice(words), rnd.choice(words)
+			assert m.match(title, wm_class) == linear(conds, title, wm_class)
+			# From cache
+			assert m.match(title, wm_class) == linear(conds, title, wm_class)
@@ -0,0 +1,79 @@
+from scc.sccdaemon import SCCDaemon
+from scc.parser import ActionParser
+from scc.profile import Profile
+from scc.mapper import Mapper
+import os, socket, tempfile, shutil, threading
+
+
+class TestControlSocket(object):
+	
+	def setup_method(self, method):
+		self.tmp = tempfile.mkdtemp()
+		self.daemon = SCCDaemon(os.path.join(self.tmp, "daemon.pid"),
+			os.path.join(self.tmp, "daemon.socket"))
+		self.daemon.default_mapper = Mapper(Profile(ActionParser()),
+			self.daemon.scheduler, keyboard=False, mouse=False, gamepad=False)
+		self.daemon.start_listening()
+	
+	
+	def teardown_method(self, method):
+		self.daemon._remove_socket()
+		shutil.rmtree(self.tmp)
+	
+	
+	def connect(self):
+		s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		s.connect(self.daemon.socket_file)
+		s.setblocking(False)
+		return s
+	
+	
+	def iterate(self, times=3):
+		for x in xrange(times):
+			self.daemon.poller.poll(0.01)
+			self.daemon._send_queued()
+	
+	
+	def read_lines(self, s):
+		data = b""
+		try:
+			while True:
+				r = s.recv(65536)
+				if not r: break
+				data += r
+		except socket.error:
+			pass
+		return data.split(b"\n")[0:-1]
+	
+	
+	def test_served_from_mainloop(self):
+		""" Tests if clients are accepted and served without threads """
+		threads = threading.active_count()
+		a, b = self.connect(), self.connect()
+		self.iterate()
+		for s in (a, b):
+			lines = self.read_lines(s)
+			assert lines[0] == b"SCCDaemon"
+			assert lines[-1] == b"Ready."
+		# Message split to multiple chunks
+		a.send(b"Nonsense")
+		b.send(b"Rescan.\n")
+		self.iterate()
+		a.send(b".\n")
+		self.iterate()
+		assert self.read_lines(a) == [ b"Fail: Unknown command" ]
+		assert self.read_lines(b) == [ b"OK." ]
+		assert len(self.daemon.clients) == 2
+		assert threading.active_count() == threads
+		a.close(); b.close()
+	
+	
+	def test_disconnect(self):
+		""" Tests if everything is released when client disconnects """
+		a = self.connect()
+		self.iterate()
+		assert len(self.daemon.clients) == 1
+		a.close()
+		self.iterate()
+		assert len(self.daemon.clients) == 0
+		assert self.daemon._client_fds == {}
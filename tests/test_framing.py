@@ -0,0 +1,81 @@
+from scc.framing import FramedWriter, FrameReader, read_frame, decode_event
+from scc.framing import FT_MESSAGE, FT_CONTROLLER, FT_EVENT, HANDLE, SOURCES
+from scc.sccdaemon import Client
+from scc.output_queue import OutputQueue
+from StringIO import StringIO
+import socket
+
+
+class TestFraming(object):
+	
+	def test_roundtrip(self):
+		""" Tests if messages and events written in binary mode are read back """
+		f = StringIO()
+		w = FramedWriter(f)
+		w.write(b"OK.\nStats: a")
+		w.write(b" b\n")
+		w.write_event("sc0", "LEFT", (-100, 32767))
+		w.write_event("sc1", "A", (1,))
+		w.write_event("sc0", "STICKPRESS", (0,))
+		frames = FrameReader().feed(f.getvalue())
+		assert frames[0:2] == [ (FT_MESSAGE, "OK."), (FT_MESSAGE, "Stats: a b") ]
+		assert frames[2] == (FT_CONTROLLER, HANDLE.pack(0) + b"sc0")
+		assert decode_event(frames[3][1]) == (0, "LEFT", (-100, 32767))
+		assert frames[4] == (FT_CONTROLLER, HANDLE.pack(1) + b"sc1")
+		assert decode_event(frames[5][1]) == (1, "A", (1,))
+		assert decode_event(frames[6][1]) == (0, "STICKPRESS", (0,))
+		assert len(frames) == 7
+	
+	
+	def test_mixed(self):
+		""" Tests if text lines and frames are split correctly in any chunks """
+		f = StringIO()
+		f.write(b"Version: 1\n")
+		w = FramedWriter(f)
+		w.write(b"Binary\xc3\xa1\n")
+		f.write(b"Event: sc0 A 1\n")
+		w.write_event("sc0", "RT", (255, 0))
+		data = f.getvalue()
+		expected = FrameReader().feed(data)
+		assert [ x[0] for x in expected ] == [ FT_MESSAGE, FT_MESSAGE, FT_MESSAGE, FT_CONTROLLER, FT_EVENT ]
+		assert expected[1] == (FT_MESSAGE, u"Binary\xe1")
+		for size in (1, 2, 3, 7):
+			r, frames = FrameReader(), []
+			for i in xrange(0, len(data), size):
+				frames += r.feed(data[i:i+size])
+			assert frames == expected
+			assert r.buffer == b""
+		# Same thing from blocking file
+		f.seek(0)
+		frames = []
+		while True:
+			frame = read_frame(f)
+			if frame is None: break
+			frames.append(frame)
+		assert frames == expected
+	
+	
+	def test_text_events(self):
+		""" Tests if events sent to text-mode clients are unchanged """
+		a, b = socket.socketpair()
+		c = Client(a, None, OutputQueue(a, lambda *x: None))
+		c.report_event("sc0", "LEFT", (1, -2))
+		c.report_event("sc0", "A", (0,))
+		c.report_event("sc0", "UNKNOWN", (1, 2))
+		c.output.send()
+		assert b.recv(1024) == b"Event: sc0 LEFT 1 -2\nEvent: sc0 A 0\nEvent: sc0 UNKNOWN 1 2\n"
+		c.binary, c.wfile = True, FramedWriter(c.output)
+		c.report_event("sc0", "UNKNOWN", (1, 2))
+		c.report_event("sc0", "A", (1,))
+		c.output.send()
+		frames = FrameReader().feed(b.recv(1024))
+		assert frames[0] == (FT_MESSAGE, "Event: sc0 UNKNOWN 1 2")
+		assert frames[1] == (FT_CONTROLLER, HANDLE.pack(0) + b"sc0")
+		assert decode_event(frames[2][1]) == (0, "A", (1,))
+		a.close(); b.close()
+	
+	
+	def test_sources(self):
+		""" Tests if all sources fit into record """
+		assert len(SOURCES) == len(set(SOURCES)) < 256
+		assert "STICKPRESS" in SOURCES and "LT" in SOURCES and "CPAD" in SOURCES
@@ -6,8 +6,10 @@ from scc.parser import ActionParser
 from scc.profile import Profile
 from scc.scheduler import Scheduler
 from scc.mapper import Mapper
+from scc.modifiers import SmoothModifier, BallModifier
+from scc.recorder import VirtualClock
 from collections import namedtuple
-import time
+import time, random
 
 """
 Tests various inputs for crashes and incorrect behaviour,
@@ -247,3 +249,76 @@ class TestInputs(object):
 		_state, state = state, state._replace(buttons=SCButtons.A)
 		mapper.input(mapper.controller, _state, state)
 		assert Keys.KEY_Y in mapper.keyboard.pressed
+	
+	
+	@input_test
+	def test_oneeuro(self, mapper):
+		"""
+		Tests that oneeuro smooths out jitter but follows fast movement
+		"""
+		mapper.profile.pads[Profile.LEFT] = (parser.restart(
+			"oneeuro(XY(axis(Axes.ABS_X), axis(Axes.ABS_Y)))")).parse()
+		
+		# Runs at 250Hz, as controller sends input every 4ms
+		with VirtualClock() as clock:
+			# Jitter around one position
+			state = ZERO_STATE
+			for i in xrange(50):
+				clock.now += 0.004
+				new_state = state._replace(buttons=SCButtons.LPADTOUCH,
+						lpad_x=10000 + (50 if i % 2 else -50))
+				mapper.input(mapper.controller, state, new_state)
+				state = new_state
+			assert abs(mapper.gamepad.axes[Axes.ABS_X] - 10000) < 20
+			
+			# Jump far away
+			for i in xrange(10):
+				clock.now += 0.004
+				new_state = state._replace(lpad_x=-20000)
+				mapper.input(mapper.controller, state, new_state)
+				state = new_state
+			assert abs(mapper.gamepad.axes[Axes.ABS_X] + 20000) < 1000
+
+
+class TestFilters(object):
+	"""
+	Tests that incrementally computed averages used by smooth and ball
+	modifiers match ones computed from entire buffer.
+	"""
+	
+	def test_smooth(self):
+		for level, multiplier in ((8, 0.75), (5, 0.3), (1, 0.5), (16, 1.0), (4, 1.5)):
+			rnd = random.Random(level)
+			smooth = SmoothModifier(level, multiplier, ZERO_STATE)
+			weights = [ multiplier ** x for x in reversed(xrange(level)) ]
+			values = [ rnd.randint(STICK_PAD_MIN, STICK_PAD_MAX) ] * level
+			smooth._fill(values[0], -values[0])
+			for i in xrange(SmoothModifier.RESYNC_INTERVAL * 2 + 7):
+				x = rnd.randint(STICK_PAD_MIN, STICK_PAD_MAX)
+				values = values[1:] + [ x ]
+				smooth._push(x, -x)
+				expected = sum([ v * w for v, w in zip(values, weights) ]) / sum(weights)
+				x, y = smooth._get_pos()
+				assert abs(x - expected) < 0.001
+				assert abs(y + expected) < 0.001
+	
+	
+	def test_ball(self):
+		rnd = random.Random(1)
+		ball = BallModifier()
+		values = []
+		for i in xrange(1000):
+			if i % 300 == 0:
+				ball._stop()
+				values = []
+			dx, dy = rnd.uniform(-1e6, 1e6), rnd.uniform(-1e3, 1e3)
+			ball._add(dx, dy)
+			if values:
+				expected = sum([ v[0] for v in values ]) / len(values)
+				assert abs(ball._xvel - expected) < 1e-9
+				expected = sum([ v[1] for v in values ]) / len(values)
+				assert abs(ball._yvel - expected) < 1e-9
+			else:
+				assert ball._xvel == 0.0 and ball._yvel == 0.0
+			values = (values + [ (dx * ball._radscale, dy * ball._radscale) ])[-BallModifier.DEFAULT_MEAN_LEN:]
+
@@ -0,0 +1,86 @@
+from scc.sccdaemon import Client, ObservingAction
+from scc.output_queue import OutputQueue
+from scc.scheduler import Scheduler
+from scc.actions import NoAction
+from scc.constants import SCButtons, LEFT, RIGHT
+import socket, time
+
+
+class FakeController(object):
+	def get_id(self):
+		return "sc0"
+
+
+class FakeMapper(object):
+	def __init__(self):
+		self.scheduler = Scheduler()
+	
+	def get_controller(self):
+		return FakeController()
+	
+	def schedule(self, delay, cb):
+		return self.scheduler.schedule(delay, cb, self)
+	
+	def cancel_task(self, task):
+		return self.scheduler.cancel_task(task)
+
+
+class TestObserve(object):
+	
+	def setup_method(self, method):
+		self.a, self.b = socket.socketpair()
+		self.b.setblocking(False)
+		self.mapper = FakeMapper()
+		self.client = Client(self.a, self.mapper, OutputQueue(self.a, lambda *x: None))
+	
+	
+	def teardown_method(self, method):
+		self.a.close()
+		self.b.close()
+	
+	
+	def received(self):
+		self.client.output.send()
+		try:
+			return self.b.recv(65536).split(b"\n")[0:-1]
+		except socket.error:
+			return []
+	
+	
+	def test_rate_limited(self):
+		""" Tests if only latest changed positions are sent once per interval """
+		a = ObservingAction(RIGHT, self.client, NoAction(), 0.05)
+		for i in xrange(100):
+			a.whole(self.mapper, i, -i, RIGHT)
+		a.button_press(self.mapper)
+		assert self.received() == [ b"Event: sc0 RIGHT 0 0", b"Event: sc0 RIGHT 1" ]
+		time.sleep(0.06)
+		self.mapper.scheduler.run()
+		assert self.received() == [ b"Event: sc0 RIGHT 99 -99" ]
+		# Unchanged position is not sent again
+		time.sleep(0.06)
+		a.whole(self.mapper, 99, -99, RIGHT)
+		self.mapper.scheduler.run()
+		assert self.received() == []
+	
+	
+	def test_unlock_cancels(self):
+		""" Tests if pending batch is dropped when client stops observing """
+		a = ObservingAction(LEFT, self.client, NoAction(), 0.05)
+		a.whole(self.mapper, 1, 1, LEFT)
+		a.whole(self.mapper, 2, 2, LEFT)
+		self.client.batches.values()[0].cancel()
+		time.sleep(0.06)
+		self.mapper.scheduler.run()
+		assert self.received() == [ b"Event: sc0 LEFT 1 1" ]
+	
+	
+	def test_threshold(self):
+		""" Tests if unlimited observer skips only small movements on both axes """
+		a = ObservingAction(LEFT, self.client, NoAction())
+		a.whole(self.mapper, 5000, 5000, LEFT)
+		assert self.received() == [ b"Event: sc0 LEFT 5000 5000" ]
+		a.whole(self.mapper, 5010, 5010, LEFT)
+		assert self.received() == []
+		a.whole(self.mapper, 5010, 1000, LEFT)
+		assert self.received() == [ b"Event: sc0 LEFT 5010 1000" ]
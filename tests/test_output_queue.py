@@ -0,0 +1,100 @@
+from scc.output_queue import OutputQueue
+import socket
+
+
+class TestOutputQueue(object):
+	
+	def setup_method(self, method):
+		self.a, self.b = socket.socketpair()
+		self.a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+		self.dirty = []
+		self.q = OutputQueue(self.a, self.dirty.append)
+	
+	
+	def teardown_method(self, method):
+		self.a.close()
+		self.b.close()
+	
+	
+	def read_all(self):
+		self.b.setblocking(False)
+		data = b""
+		try:
+			while True:
+				r = self.b.recv(65536)
+				if not r: break
+				data += r
+		except socket.error:
+			pass
+		return data
+	
+	
+	def test_coalescing(self):
+		""" Tests if newer event with same key replaces unsent one """
+		self.q.write(b"OK.\n")
+		self.q.write(b"Event: sc0 LEFT 1 1\n", ("sc0", "LEFT"), True)
+		self.q.write(b"Event: sc0 A 1\n", None, True)
+		self.q.write(b"Event: sc0 LEFT 2 2\n", ("sc0", "LEFT"), True)
+		self.q.write(b"Event: sc1 LEFT 3 3\n", ("sc1", "LEFT"), True)
+		assert self.dirty == [ self.q ]
+		assert self.q.send()
+		assert self.read_all() == (b"OK.\nEvent: sc0 A 1\n"
+			b"Event: sc0 LEFT 2 2\nEvent: sc1 LEFT 3 3\n")
+		assert self.q.size == 0
+		# Queue is clean again, next write notifies
+		self.q.write(b"Event: sc0 LEFT 4 4\n", ("sc0", "LEFT"), True)
+		assert self.dirty == [ self.q, self.q ]
+	
+	
+	def test_stalled_client(self):
+		"""
+		Tests if writing never blocks and only droppable data is dropped
+		when client is not reading.
+		"""
+		for i in xrange(20000):
+			self.q.write(b"Event: sc0 A %05i\n" % (i,), None, True)
+			if i % 1000 == 0:
+				self.q.write(b"OK %05i\n" % (i,))
+			if i % 100 == 0:
+				# Socket buffer gets full soon
+				assert not self.q.send() or i < 5000
+		assert self.q.dropped > 0
+		assert self.q.size <= OutputQueue.MAX_SIZE
+		data = b""
+		while not self.q.send():
+			data += self.read_all()
+		lines = (data + self.read_all()).split(b"\n")[0:-1]
+		# Every response is delivered, events are complete and in order
+		assert [ x for x in lines if x.startswith("OK") ] == [
+			b"OK %05i" % (i,) for i in xrange(0, 20000, 1000) ]
+		events = [ int(x.split(" ")[-1]) for x in lines if x.startswith("Event") ]
+		assert events == sorted(events)
+		assert events[-1] == 19999
+		assert len(events) + self.q.dropped == 20000
+	
+	
+	def test_hard_limit(self):
+		""" Tests if client is disconnected when it's not reading responses """
+		for i in xrange(5000):
+			self.q.write(b"X" * 1024 + b"\n")
+		assert self.q.broken
+		try:
+			self.q.send()
+			assert False, "send() did not failed"
+		except socket.error:
+			pass
+	
+	
+	def test_no_leak(self):
+		""" Tests if nothing is kept after everything is sent """
+		for i in xrange(5000):
+			self.q.write(b"Event: sc0 A 1\n", None, True)
+			self.q.write(b"Event: sc0 LEFT %s 1\n" % (i,), ("sc0", "LEFT"), True)
+			if i % 10 == 0:
+				self.q.send()
+				self.read_all()
+		while not self.q.send():
+			self.read_all()
+		assert self.q.size == 0
+		assert len(self.q._queue) == len(self.q._droppable) == len(self.q._keys) == 0
+		assert self.q._discarded == 0
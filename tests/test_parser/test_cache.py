@@ -0,0 +1,35 @@
+from scc.parser import ActionParser, ParseError
+from scc.modifiers import BallModifier, ModeModifier
+from . import parser
+
+
+class TestCache(object):
+	
+	def test_not_shared(self):
+		"""
+		Tests if parsing same string twice, with result taken from cache,
+		creates new instances of all actions.
+		"""
+		a_str = "mode(A, ball(mouse()), B, button(Keys.KEY_B) and button(Keys.KEY_C), ball(XY(axis(Axes.ABS_X), axis(Axes.ABS_Y))))"
+		ActionParser.clear_cache()
+		a1 = parser.restart(a_str).parse()
+		a2 = parser.restart(a_str).parse()
+		assert a_str in ActionParser._cache
+		assert isinstance(a1, ModeModifier) and isinstance(a2, ModeModifier)
+		assert a1.to_string() == a2.to_string() == a_str
+		assert a1 is not a2
+		assert a1.default is not a2.default
+		assert isinstance(a2.default, BallModifier)
+		assert a1.default.action is not a2.default.action
+	
+	
+	def test_errors(self):
+		""" Tests if strings that fail to parse are not cached """
+		for a_str in ("button(KEY_A", "buttonz(KEY_A)", "mouse(1, 2, 3, 4, 5, 6, 7)"):
+			for i in xrange(2):
+				try:
+					parser.restart(a_str).parse()
+					assert False, "'%s' parsed" % (a_str,)
+				except ParseError:
+					pass
+			assert a_str not in ActionParser._cache
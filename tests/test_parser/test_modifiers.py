@@ -108,6 +108,21 @@ class TestModifiers(object):
 		assert a.multiplier == 0.3
 	
 	
+	def test_oneeuro(self):
+		"""
+		Tests if OneEuroModifier is parsed
+		"""
+		a = _parse_compressed("oneeuro(axis(ABS_X))")
+		assert isinstance(a, OneEuroModifier)
+		assert isinstance(a.action, AxisAction)
+		assert a.min_cutoff == 1.0
+		a = _parse_compressed("oneeuro(0.5, 0.01, axis(ABS_X))")
+		assert isinstance(a, OneEuroModifier)
+		assert a.min_cutoff == 0.5
+		assert a.beta == 0.01
+		assert a.d_cutoff == 1.0
+	
+	
 	def test_deadzone(self):
 		"""
 		Tests if DeadzoneModifier is parsed
@@ -0,0 +1,29 @@
+from scc.poller import Poller
+import threading, time
+
+
+class TestPoller(object):
+	
+	def test_wakeup(self):
+		"""
+		Tests if wakeup from other thread interrupts poll and
+		next poll waits again.
+		"""
+		poller = Poller()
+		threading.Timer(0.05, poller.wakeup).start()
+		start = time.time()
+		poller.poll(5.0)
+		assert time.time() - start < 1.0
+		assert not poller._pending
+		start = time.time()
+		poller.poll(0.1)
+		assert time.time() - start >= 0.09
+	
+	
+	def test_wakeup_before_poll(self):
+		""" Tests if wakeup before poll makes it return right away """
+		poller = Poller()
+		poller.wakeup()
+		start = time.time()
+		poller.poll(5.0)
+		assert time.time() - start < 1.0
@@ -0,0 +1,30 @@
+from scc.drivers.preprocess import InputPreprocessor
+
+
+class State(object):
+	def __init__(self, **values):
+		for x in ('lpad_x', 'lpad_y', 'rpad_x', 'rpad_y', 'stick_x', 'stick_y'):
+			setattr(self, x, values.get(x, 0))
+
+
+class TestPreprocess(object):
+	
+	def test_rotation(self):
+		""" Tests if only touched pads are rotated, by configured angle """
+		p = InputPreprocessor()
+		p.configure({ 'input_rotation_l' : 90, 'input_rotation_r' : 0 })
+		s = State(lpad_x=1000, rpad_x=1000)
+		p.process(s)
+		assert (s.lpad_x, s.lpad_y) == (0, -1000)
+		assert (s.rpad_x, s.rpad_y) == (1000, 0)
+		s = State(lpad_x=1000)
+		p.process(s, left=False)
+		assert (s.lpad_x, s.lpad_y) == (1000, 0)
+	
+	
+	def test_deadzones(self):
+		""" Tests if values inside deadzone are zeroed """
+		p = InputPreprocessor({ 'stick_x' : 100, 'stick_y' : 100, 'lpad_x' : 0 })
+		s = State(stick_x=99, stick_y=-100, lpad_x=1)
+		p.process(s)
+		assert (s.stick_x, s.stick_y, s.lpad_x) == (0, -100, 1)
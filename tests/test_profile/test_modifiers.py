@@ -140,6 +140,21 @@ class TestModifiers(object):
 		assert _is_axis_with_value(a.action)
 	
 	
+	def test_oneeuro(self):
+		"""
+		Tests if OneEuroModifier is parsed correctly from json.
+		"""
+		a = parser.from_json_data({
+			'action' : "axis(ABS_X)",
+			'oneeuro' : [ 0.5, 0.01 ]
+		})
+		
+		assert isinstance(a, OneEuroModifier)
+		assert a.min_cutoff == 0.5
+		assert a.beta == 0.01
+		assert _is_axis_with_value(a.action)
+	
+	
 	def test_deadzone(self):
 		"""
 		Tests if DeadzoneModifier is parsed correctly from json.
@@ -0,0 +1,121 @@
+from scc.profile_preloader import ProfilePreloader, find_switch_profiles
+from scc.profile_cache import ProfileCache
+from scc.parser import ActionParser
+from scc.profile import Profile
+from scc.poller import Poller
+from StringIO import StringIO
+import os, glob, shutil, tempfile
+
+
+def saved(profile):
+	""" Returns profile serialized to json string """
+	f = StringIO()
+	profile.save_fileobj(f)
+	return f.getvalue()
+
+
+class TestProfileCache(object):
+	
+	def setup_method(self, method):
+		self.directory = tempfile.mkdtemp()
+	
+	
+	def teardown_method(self, method):
+		shutil.rmtree(self.directory)
+	
+	
+	def test_roundtrip(self):
+		"""
+		Tests if every default and example profile is same when loaded
+		from memory or on-disk cache as when parsed.
+		"""
+		for filename in (glob.glob("default_profiles/*.sccprofile")
+					+ glob.glob("profile_examples/*.sccprofile")):
+			expected = Profile(ActionParser()).load(filename)
+			expected.compress()
+			cache = ProfileCache(directory=self.directory)
+			assert saved(cache.load(filename, ActionParser())) == saved(expected)
+			# From memory
+			assert saved(cache.load(filename, ActionParser())) == saved(expected)
+			cache.warm(filename)
+			assert saved(cache.load(filename, ActionParser())) == saved(expected)
+			# From disk
+			cache.clear()
+			assert saved(cache.load(filename, ActionParser())) == saved(expected)
+	
+	
+	def test_not_shared(self):
+		""" Tests if same instance is never returned twice """
+		filename = glob.glob("default_profiles/*.sccprofile")[0]
+		cache = ProfileCache(directory=self.directory)
+		loaded = [ cache.load(filename, ActionParser()) ]
+		cache.warm(filename)
+		loaded.append(cache.load(filename, ActionParser()))
+		loaded.append(cache.load(filename, ActionParser()))
+		assert len(set([ id(x) for x in loaded ])) == 3
+		assert len(set([ id(x.stick) for x in loaded ])) == 3
+	
+	
+	def test_invalidation(self):
+		""" Tests if profile is parsed again after file is changed """
+		filename = os.path.join(self.directory, "test.sccprofile")
+		Profile(ActionParser()).save(filename)
+		cache = ProfileCache(directory=self.directory)
+		assert not cache.load(filename, ActionParser()).stick
+		p = Profile(ActionParser())
+		p.stick = ActionParser("mouse()").parse()
+		p.save(filename)
+		os.utime(filename, (1, 1))
+		assert cache.load(filename, ActionParser()).stick
+		cache.clear()
+		assert cache.load(filename, ActionParser()).stick
+
+
+class TestProfilePreloader(object):
+	
+	def setup_method(self, method):
+		self.directory = tempfile.mkdtemp()
+	
+	
+	def teardown_method(self, method):
+		shutil.rmtree(self.directory)
+	
+	
+	def test_find_switch_profiles(self):
+		""" Tests if profile names are found in nested actions """
+		action = ActionParser("mode(A, profile('a'), B, profile('b') and profile('c'))").parse()
+		assert set(find_switch_profiles(action)) == { "a", "b", "c" }
+	
+	
+	def test_preload(self):
+		""" Tests if preloaded profile is ready to be used """
+		filename = glob.glob("default_profiles/*.sccprofile")[0]
+		cache = ProfileCache(directory=self.directory)
+		preloader = ProfilePreloader(cache)
+		preloader.set_profiles([ filename ])
+		preloader._queue.join()
+		entry = cache._entries[os.path.abspath(filename)]
+		profile = entry.profile
+		assert profile is not None
+		assert cache.load(filename, ActionParser()) is profile
+		assert entry.profile is None
+	
+	
+	def test_inotify(self):
+		""" Tests if changed profile is loaded again """
+		filename = os.path.join(self.directory, "test.sccprofile")
+		Profile(ActionParser()).save(filename)
+		poller = Poller()
+		cache = ProfileCache(directory=self.directory)
+		preloader = ProfilePreloader(cache)
+		assert preloader.watch(self.directory, poller)
+		preloader.set_profiles([ filename ])
+		preloader._queue.join()
+		assert not cache._entries[filename].profile.stick
+		p = Profile(ActionParser())
+		p.stick = ActionParser("mouse()").parse()
+		p.save(filename)
+		poller.poll(1.0)
+		preloader._queue.join()
+		assert cache._entries[filename].profile.stick
+		preloader.inotify.close()
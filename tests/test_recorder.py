@@ -0,0 +1,87 @@
+from scc.recorder import InputRecorder, VirtualClock, NULL_INPUT
+from scc.recorder import load_recording, replay_file
+from scc.constants import SCButtons, LEFT
+from scc.drivers.fake import FakeController
+from scc.parser import ActionParser
+from scc.profile import Profile
+import os, tempfile
+
+
+class FakeMapper(object):
+	def __init__(self):
+		self.received = []
+	
+	def input(self, controller, old_state, state):
+		self.received.append(state)
+
+
+class TestRecorder(object):
+	
+	def _record(self, frames):
+		""" Records list of (time, state) tuples and returns filename """
+		fd, filename = tempfile.mkstemp(suffix=".screc")
+		os.close(fd)
+		mapper = FakeMapper()
+		recorder = InputRecorder(filename)
+		recorder.attach(mapper)
+		with VirtualClock() as clock:
+			for t, state in frames:
+				clock.now = t
+				mapper.input(FakeController(0), NULL_INPUT, state)
+		recorder.close()
+		assert "input" not in mapper.__dict__
+		assert len(mapper.received) == len(frames)
+		return filename
+	
+	
+	def _profile(self):
+		""" Saves testing profile and returns filename """
+		fd, filename = tempfile.mkstemp(suffix=".sccprofile")
+		os.close(fd)
+		parser = ActionParser()
+		profile = Profile(parser)
+		profile.buttons[SCButtons.A] = parser.restart("button(Keys.KEY_A)").parse()
+		profile.pads[LEFT] = parser.restart("ball(mouse())").parse()
+		profile.save(filename)
+		return filename
+	
+	
+	def test_roundtrip(self):
+		""" Tests that recorded frames are loaded back unchanged """
+		frames = [
+			(10.0, NULL_INPUT._replace(buttons=SCButtons.A)),
+			(10.5, NULL_INPUT._replace(lpad_x=-1000, ltrig=255, q4=-5)),
+			(11.0, NULL_INPUT),
+		]
+		filename = self._record(frames)
+		try:
+			flags, loaded = load_recording(filename)
+		finally:
+			os.unlink(filename)
+		assert flags == 0
+		assert [ t for t, fflags, state in loaded ] == [ 0.0, 0.5, 1.0 ]
+		assert [ state for t, fflags, state in loaded ] == [ s for t, s in frames ]
+	
+	
+	def test_replay(self):
+		"""
+		Tests that replay generates expected events, including ones
+		generated by scheduled tasks after last frame, and that output
+		is same every time.
+		"""
+		frames = [ (0.0, NULL_INPUT._replace(buttons=SCButtons.A)), (0.01, NULL_INPUT) ]
+		for i in xrange(10):
+			frames.append((0.02 + i * 0.01, NULL_INPUT._replace(
+				buttons=SCButtons.LPADTOUCH, lpad_x=i * 2000)))
+		frames.append((0.12, NULL_INPUT))
+		filename, profile = self._record(frames), self._profile()
+		try:
+			events = replay_file(profile, filename)
+			assert events == replay_file(profile, filename)
+		finally:
+			os.unlink(filename)
+			os.unlink(profile)
+		keys = [ (e[0], e[3], e[4]) for e in events if e[2] == "EV_KEY" ]
+		assert keys == [ (0.0, "KEY_A", 1), (0.01, "KEY_A", 0) ]
+		# Ball keeps rolling after pad is released
+		assert any(e[2] == "EV_REL" and e[0] > 0.12 for e in events)
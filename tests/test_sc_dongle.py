@@ -0,0 +1,71 @@
+from scc.drivers.sc_dongle import SCController, SCStatus, ControllerInput
+from scc.drivers.sc_dongle import TUP_FORMAT, SCI_SIZE
+from scc.constants import SCButtons
+import struct
+
+
+def packet(**values):
+	""" Returns raw input packet as received from controller """
+	values.setdefault('status', SCStatus.INPUT)
+	return struct.pack(TUP_FORMAT, *[ values.get(x, 0) for x in ControllerInput._fields ])
+
+
+class FakeMapper(object):
+	def __init__(self):
+		self.received = []
+	
+	def input(self, controller, old_state, state):
+		self.received.append(( repr(old_state), repr(state) ))
+
+
+class TestSCDongle(object):
+	
+	def _controller(self):
+		c = SCController(None, 0, 0)
+		c.set_mapper(FakeMapper())
+		return c
+	
+	
+	def test_decode(self):
+		""" Tests if packet is decoded to same values as struct.unpack gives """
+		c = self._controller()
+		values = dict(seq=1234, buttons=SCButtons.A | SCButtons.LPADTOUCH,
+			ltrig=200, rtrig=3, lpad_x=-32768, lpad_y=32767, rpad_x=-5, rpad_y=6,
+			gpitch=-1, groll=2, gyaw=-3, q1=4, q2=-5, q3=6, q4=-7)
+		data = packet(**values)
+		assert len(data) == SCI_SIZE
+		c.input(data)
+		expected = ControllerInput._make(struct.unpack(TUP_FORMAT, data))
+		for name in ControllerInput._fields:
+			assert getattr(c._state, name) == getattr(expected, name)
+	
+	
+	def test_swap(self):
+		""" Tests if previous input is passed as old_state """
+		c = self._controller()
+		c.input(packet(lpad_x=10))
+		c.input(packet(lpad_x=20))
+		c.input(packet(lpad_x=30))
+		assert c._old_state.lpad_x == 20 and c._state.lpad_x == 30
+		received = c.mapper.received
+		assert "lpad_x=10" in received[1][0] and "lpad_x=20" in received[1][1]
+	
+	
+	def test_rotation(self):
+		""" Tests if rotation is applied in place and clamped """
+		c = self._controller()
+		c._preprocessor.set_rotation(-45, -45)
+		c.input(packet(buttons=SCButtons.LPADTOUCH, lpad_x=1000, rpad_x=30000, rpad_y=-30000))
+		assert c._state.lpad_x == 707 and c._state.lpad_y == 707
+		assert c._state.rpad_x == 32767 and c._state.rpad_y == 0
+	
+	
+	def test_seq(self):
+		""" Tests if missed packets are counted and older packets ignored """
+		c = self._controller()
+		for seq in (65534, 65535, 2, 1, 3, 3):
+			c.input(packet(seq=seq, ltrig=seq & 0xFF))
+		assert c.missed == 2 and c.stale == 1
+		assert c.get_dropped() == 3
+		assert c._state.ltrig == 3
+		assert len(c.mapper.received) == 5
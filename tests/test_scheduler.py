@@ -0,0 +1,94 @@
+from scc.scheduler import Scheduler
+import threading, time
+
+
+class TestScheduler(object):
+	
+	def _run_at(self, s, t):
+		""" Runs scheduler as if current time was 't' """
+		_time, time.time = time.time, lambda : t
+		try:
+			s.run()
+		finally:
+			time.time = _time
+	
+	
+	def test_order(self):
+		"""
+		Tests if tasks are executed in order of their deadlines and
+		tasks with same deadline in order in which they were scheduled.
+		"""
+		s, called = Scheduler(), []
+		for delay, name in ((0.3, "c"), (0.1, "a"), (0.2, "b1"), (0.2, "b2")):
+			s.schedule(delay, called.append, name)
+		self._run_at(s, s._now + 0.15)
+		assert called == [ "a" ]
+		self._run_at(s, s._now + 1.0)
+		assert called == [ "a", "b1", "b2", "c" ]
+		assert s.next_deadline() is None
+	
+	
+	def test_cancel(self):
+		"""
+		Tests if canceled tasks are not executed and if cancel_task
+		reports only tasks that are still waiting.
+		"""
+		s, called = Scheduler(), []
+		tasks = [ s.schedule(0.1 * i, called.append, i) for i in xrange(10) ]
+		assert s.cancel_task(tasks[0])
+		assert s.cancel_task(tasks[5])
+		assert not s.cancel_task(tasks[5])
+		assert s.next_deadline() == tasks[1].time
+		self._run_at(s, s._now + 2.0)
+		assert called == [ 1, 2, 3, 4, 6, 7, 8, 9 ]
+		assert not s.cancel_task(tasks[1])
+	
+	
+	def test_cancel_many(self):
+		"""
+		Tests canceling most of tasks, what causes heap to be rebuilt.
+		"""
+		s, called = Scheduler(), []
+		tasks = [ s.schedule(0.01 * i, called.append, i) for i in xrange(100) ]
+		for t in tasks:
+			if t.data[0] % 10:
+				s.cancel_task(t)
+		assert len(s._heap) < 100
+		self._run_at(s, s._now + 2.0)
+		assert called == range(0, 100, 10)
+	
+	
+	def test_cancel_from_callback(self):
+		"""
+		Tests canceling tasks from task callback while scheduler is running.
+		"""
+		s, called = Scheduler(), []
+		tasks = []
+		def cancel_all():
+			called.append("cancel")
+			for t in tasks:
+				s.cancel_task(t)
+		s.schedule(0.1, cancel_all)
+		tasks += [ s.schedule(0.2, called.append, i) for i in xrange(10) ]
+		self._run_at(s, s._now + 1.0)
+		assert called == [ "cancel" ]
+	
+	
+	def test_threads(self):
+		"""
+		Tests if tasks scheduled from other threads are not lost while
+		main thread cancels tasks and rebuilds heap.
+		"""
+		s, called = Scheduler(), []
+		def schedule_many(base):
+			for i in xrange(1000):
+				s.schedule(0.1, called.append, base + i)
+		threads = [ threading.Thread(target=schedule_many, args=(x * 1000,)) for x in xrange(4) ]
+		for t in threads:
+			t.start()
+		for i in xrange(2000):
+			s.cancel_task(s.schedule(0.1, called.append, -1))
+		for t in threads:
+			t.join()
+		self._run_at(s, s._now + 1.0)
+		assert sorted(called) == range(4000)
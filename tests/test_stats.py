@@ -0,0 +1,118 @@
+from scc.stats import LatencyStats, ActionProfiler, Histogram, STAGES, BUCKETS
+from scc.drivers.fake import FakeController
+from scc.recorder import InputRecorder, NULL_INPUT
+from scc.constants import SCButtons
+from scc.parser import ActionParser
+from scc.scheduler import Scheduler
+from scc.profile import Profile
+from scc.poller import Poller
+from scc.mapper import Mapper
+import os, tempfile
+
+
+class TestStats(object):
+	
+	def test_histogram(self):
+		""" Tests that samples are sorted into correct buckets """
+		h = Histogram()
+		for seconds in (0, 0.000001, 0.000003, 0.000004, 0.000007, 1000):
+			h.add(seconds)
+		assert h.count == 6
+		assert h.max == 1000
+		assert h.buckets[0:4] == [ 1, 1, 1, 2 ]
+		assert h.buckets[BUCKETS - 1] == 1
+	
+	
+	def test_attach_detach(self):
+		"""
+		Tests that every stage is measured for each input and that
+		everything is restored after detach.
+		"""
+		poller, scheduler = Poller(), Scheduler()
+		mapper = Mapper(Profile(ActionParser()), scheduler,
+			keyboard=None, mouse=None, gamepad=False)
+		controller = FakeController(0)
+		mapper.set_controller(controller)
+		stats = LatencyStats()
+		stats.attach_poller(poller)
+		stats.attach(mapper)
+		stats.attach(mapper)		# Second call should do nothing
+		
+		poller.wait(timeout=0)
+		mapper.input(controller, NULL_INPUT, NULL_INPUT._replace(buttons=SCButtons.A))
+		mapper.input(controller, NULL_INPUT._replace(buttons=SCButtons.A), NULL_INPUT)
+		# Called outside of input, should not be measured
+		mapper.generate_events()
+		for stage in STAGES:
+			assert stats.histograms[stage].count == 2
+		
+		stats.detach()
+		assert "wait" not in poller.__dict__
+		assert "run" not in scheduler.__dict__
+		for name in ("input", "generate_events", "generate_feedback"):
+			assert name not in mapper.__dict__
+	
+	
+	def test_with_recorder(self):
+		"""
+		Tests that stats and recorder, both wrapping mapper.input, can be
+		detached in any order without removing each other's wrapper.
+		"""
+		fd, filename = tempfile.mkstemp(suffix=".screc")
+		os.close(fd)
+		try:
+			for stats_first in (True, False):
+				mapper = Mapper(Profile(ActionParser()), Scheduler(),
+					keyboard=None, mouse=None, gamepad=False)
+				controller = FakeController(0)
+				mapper.set_controller(controller)
+				recorder, stats = InputRecorder(filename), LatencyStats()
+				frames = []
+				recorder.frame = lambda c, state: frames.append(state)
+				recorder.attach(mapper)
+				stats.attach(mapper)
+				if stats_first:
+					stats.detach()
+				else:
+					recorder.detach()
+				mapper.input(controller, NULL_INPUT, NULL_INPUT)
+				if stats_first:
+					assert len(frames) == 1
+					recorder.detach()
+				else:
+					assert len(frames) == 0
+					assert stats.histograms["dispatch"].count == 1
+					stats.detach()
+				mapper.input(controller, NULL_INPUT, NULL_INPUT)
+				assert len(frames) == (1 if stats_first else 0)
+				assert "input" not in mapper.__dict__
+				recorder.close()
+		finally:
+			os.unlink(filename)
+	
+	
+	def test_profiler(self):
+		"""
+		Tests that calls to child actions are counted under correct path
+		and that everything is restored after detach.
+		"""
+		parser = ActionParser()
+		profile = Profile(parser)
+		profile.buttons[SCButtons.A] = parser.restart(
+			"mode(B, button(Keys.KEY_X), button(Keys.KEY_Y))").parse()
+		mapper = Mapper(profile, Scheduler(), keyboard=None, mouse=None, gamepad=False)
+		controller = FakeController(0)
+		mapper.set_controller(controller)
+		profiler = ActionProfiler()
+		profiler.attach(mapper)
+		
+		mapper.input(controller, NULL_INPUT, NULL_INPUT._replace(buttons=SCButtons.A))
+		mapper.input(controller, NULL_INPUT._replace(buttons=SCButtons.A), NULL_INPUT)
+		report = [ line.split(" ", 3) for line in profiler.report() ]
+		assert [ (calls, path) for calls, total, own, path in report ] == [
+			("2", "buttons.A -> mode"), ("2", "buttons.A -> mode -> button#2") ]
+		
+		profiler.detach()
+		for action in profile.buttons[SCButtons.A].get_all_actions():
+			for name in ActionProfiler.HANDLERS:
+				assert name not in action.__dict__
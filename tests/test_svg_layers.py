@@ -0,0 +1,50 @@
+import pytest
+cairo = pytest.importorskip("cairo")
+pytest.importorskip("gi")
+from scc.gui.svg_widget import SVGWidget, Layer
+
+
+def surface(width, height, color):
+	""" Returns surface filled with (r, g, b) color """
+	s = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+	cr = cairo.Context(s)
+	cr.set_source_rgb(*color)
+	cr.paint()
+	return s
+
+
+def pixel(s, x, y):
+	""" Returns (r, g, b) of pixel """
+	s.flush()
+	data = s.get_data()
+	i = y * s.get_stride() + x * 4
+	b, g, r = [ ord(c) for c in data[i:i + 3] ]
+	return r, g, b
+
+
+class TestSVGLayers(object):
+	
+	def test_composite(self):
+		"""
+		Tests if layers are copied only over their own area and
+		rest of image stays same as base image.
+		"""
+		base = surface(10, 10, (1, 0, 0))
+		layers = [
+			Layer(1, 1, 2, 2, surface(2, 2, (0, 1, 0))),
+			Layer(6, 6, 3, 3, surface(3, 3, (0, 0, 1))),
+		]
+		target = surface(10, 10, (0, 0, 0))
+		SVGWidget.composite(target, base, (0, 0, 10, 10), layers)
+		assert pixel(target, 4, 4) == (255, 0, 0)
+		assert pixel(target, 0, 9) == (255, 0, 0)
+		assert pixel(target, 2, 2) == (0, 255, 0)
+		assert pixel(target, 8, 8) == (0, 0, 255)
+		
+		# Repaint only part of image, intersecting with second layer
+		target = surface(10, 10, (0, 0, 0))
+		SVGWidget.composite(target, base, (4, 4, 4, 4), layers)
+		assert pixel(target, 5, 5) == (255, 0, 0)
+		assert pixel(target, 7, 7) == (0, 0, 255)
+		assert pixel(target, 8, 8) == (0, 0, 0)
+		assert pixel(target, 2, 2) == (0, 0, 0)
@@ -0,0 +1,257 @@
+from scc.drivers.usb import USBDevice
+from scc.drivers import usb
+from scc.poller import Poller
+from scc.lib import usb1
+import threading, time
+
+
+class FakeTransfer(object):
+	def __init__(self, submitted, log):
+		self.submitted, self.log = submitted, log
+		self.data = None
+		self.user_data = None
+		self.status = usb1.TRANSFER_COMPLETED
+	
+	def setInterrupt(self, endpoint, size, callback=None):
+		self.endpoint, self.size, self.callback = endpoint, size, callback
+	
+	def setControl(self, request_type, request, value, index, data,
+				callback=None, user_data=None, timeout=0):
+		self.control = request_type, data
+		self.callback, self.user_data = callback, user_data
+	
+	def submit(self):
+		if self.log and self.log[-1] == "fail":
+			self.log.pop()
+			raise usb1.USBErrorIO()
+		assert self not in self.submitted
+		self.submitted.append(self)
+		self.thread = threading.current_thread()
+	
+	def complete(self, data, status=usb1.TRANSFER_COMPLETED):
+		self.submitted.remove(self)
+		self.data, self.status = data, status
+		self.callback(self)
+	
+	def cancel(self):
+		# Canceled transfer is completed later, by FakeContext
+		self.log.append("cancel")
+	
+	def getStatus(self):
+		return self.status
+	
+	def getActualLength(self):
+		return len(self.data)
+	
+	def getBuffer(self):
+		return self.data
+	
+	def getUserData(self):
+		return self.user_data
+
+
+class FakeHandle(object):
+	def __init__(self):
+		self.submitted = []
+		self.log = []
+	
+	def getTransfer(self):
+		return FakeTransfer(self.submitted, self.log)
+	
+	def releaseInterface(self, number):
+		self.log.append("release")
+	
+	def attachKernelDriver(self, number):
+		pass
+	
+	def resetDevice(self):
+		pass
+	
+	def close(self):
+		self.log.append("close")
+
+
+class FakeContext(object):
+	def __init__(self, handle):
+		self.handle = handle
+	
+	def handleEventsTimeout(self, tv=0):
+		for t in list(self.handle.submitted):
+			if "cancel" in self.handle.log:
+				t.complete(b"", usb1.TRANSFER_CANCELLED)
+
+
+class FakeDaemon(object):
+	def __init__(self):
+		self.poller = Poller()
+	
+	def get_poller(self):
+		return self.poller
+
+
+class TestUSB(object):
+	
+	def test_input_transfers(self):
+		"""
+		Tests if multiple transfers are kept submitted, even while
+		callback is processing data.
+		"""
+		handle = FakeHandle()
+		d = USBDevice(None, handle)
+		received = []
+		
+		def callback(endpoint, data):
+			assert len(handle.submitted) == 3
+			received.append(data)
+		
+		d.set_input_interrupt(2, 4, callback, count=3)
+		assert len(handle.submitted) == 3
+		assert handle.submitted[0].endpoint == usb1.ENDPOINT_IN | 2
+		handle.submitted[0].complete(b"abcd")
+		handle.submitted[0].complete(b"efgh")
+		# Unexpected size; counted, but transfer is still submitted again
+		handle.submitted[0].complete(b"ij")
+		assert received == [ b"abcd", b"efgh" ]
+		assert d.dropped_transfers == 1
+		assert len(handle.submitted) == 3
+		# Also reported as sum for all devices
+		usb._usb._devices[handle] = d
+		try:
+			assert usb.get_dropped() == 1
+		finally:
+			del usb._usb._devices[handle]
+	
+	
+	def test_control(self):
+		"""
+		Tests if control messages are sent one at time and message waiting
+		to be sent is replaced by newer one of same type.
+		"""
+		handle = FakeHandle()
+		d = USBDevice(None, handle)
+		responses = []
+		d.send_control(1, b"\x8f\x07\x00\x01")		# Left haptic
+		d.make_request(1, responses.append, b"\xae\x15\x01")
+		d.flush()
+		d.send_control(1, b"\x8f\x07\x00\x02")		# Left haptic again
+		d.send_control(1, b"\x8f\x07\x01\x01")		# Right haptic
+		d.send_control(1, b"\x8f\x07\x00\x03")		# Replaces 2nd left
+		d.flush()
+		sent = []
+		while handle.submitted:
+			t = handle.submitted[0]
+			sent.append(t.control)
+			t.complete(b"response" if t.control[0] == 0xA1 else b"")
+		assert [ x[1][0:4] if x[0] == 0x21 else x for x in sent ] == [
+			b"\x8f\x07\x00\x01", b"\x8f\x07\x00\x03", b"\x8f\x07\x01\x01",
+			b"\xae\x15\x01", (0xA1, 64) ]
+		assert responses == [ b"response" ]
+		assert d.sent_controls == 4
+		assert d.coalesced_controls == 1
+	
+	
+	def test_failed_request(self):
+		""" Tests if request callback is called with None when request fails """
+		handle = FakeHandle()
+		d = USBDevice(None, handle)
+		responses = []
+		d.make_request(1, responses.append, b"\xae\x15\x01")
+		d.make_request(1, responses.append, b"\xae\x15\x01")
+		d.flush()
+		handle.submitted[0].complete(b"", usb1.TRANSFER_ERROR)
+		assert responses == [ None ]
+		# Next request is sent anyway, and fails while reading response
+		handle.submitted[0].complete(b"")
+		assert handle.submitted[0].control == (0xA1, 64)
+		handle.submitted[0].complete(b"", usb1.TRANSFER_STALL)
+		assert responses == [ None, None ]
+		assert not handle.submitted
+	
+	
+	def test_failed_submit(self):
+		"""
+		Tests if failure to submit is reported for request being
+		submitted, not for one that was already finished.
+		"""
+		handle = FakeHandle()
+		d = USBDevice(None, handle)
+		responses = []
+		d.make_request(1, lambda x: responses.append(("first", x)), b"\xae\x15\x01")
+		d.flush()
+		d.make_request(1, lambda x: responses.append(("second", x)), b"\xae\x15\x01")
+		handle.submitted[0].complete(b"")
+		handle.log.append("fail")
+		handle.submitted[0].complete(b"response")
+		assert responses == [ ("first", b"response"), ("second", None) ]
+		assert not handle.submitted and not d._rmsg
+	
+	
+	def test_close(self):
+		"""
+		Tests if control transfer in progress is canceled and finished
+		before interfaces are released.
+		"""
+		handle = FakeHandle()
+		d = USBDevice(None, handle)
+		d._claimed = [ 0 ]
+		responses = []
+		d.make_request(1, responses.append, b"\xae\x15\x01")
+		d.flush()
+		assert d._ctransfer_busy
+		ctx, usb._usb._ctx = usb._usb._ctx, FakeContext(handle)
+		try:
+			d.close()
+		finally:
+			usb._usb._ctx = ctx
+		assert handle.log == [ "cancel", "release", "close" ]
+		assert not d._ctransfer_busy and not handle.submitted
+		assert responses == []
+	
+	
+	def test_thread(self):
+		"""
+		Tests if control messages are submitted by USB thread and
+		callbacks are called only from mainloop.
+		"""
+		handle = FakeHandle()
+		daemon = FakeDaemon()
+		driver = usb._usb
+		driver.set_daemon(daemon)
+		driver.use_thread = True
+		driver.start()
+		try:
+			d = USBDevice(None, handle)
+			driver._devices[None] = d
+			d.send_control(1, b"\x8f")
+			for i in xrange(100):
+				if handle.submitted: break
+				time.sleep(0.01)
+			assert handle.submitted[0].thread is driver._thread
+			responses = []
+			driver.call_in_mainloop(responses.append, 1)
+			assert responses == [ 1 ]
+			# Called as if from USB thread
+			driver._thread, thread = threading.current_thread(), driver._thread
+			driver.call_in_mainloop(responses.append, 2)
+			driver._thread = thread
+			assert responses == [ 1 ]
+			assert daemon.poller._pending
+			driver.mainloop()
+			assert responses == [ 1, 2 ]
+			# Only input packets are dropped when queue is full
+			driver._thread, thread = threading.current_thread(), driver._thread
+			for i in xrange(usb.IO_QUEUE_SIZE + 10):
+				driver.input_in_mainloop(responses.append, i)
+			driver.call_in_mainloop(responses.append, "response")
+			driver._thread = thread
+			driver.mainloop()
+			assert responses[2] == "response"
+			assert responses[3:] == range(10, usb.IO_QUEUE_SIZE + 10)
+			assert driver.dropped_calls == 10
+			assert usb.get_dropped_calls() == 10
+		finally:
+			driver.on_exit()
+			driver.use_thread = False
+			driver.dropped_calls = 0
+			driver._devices = {}
+		assert driver._thread is None